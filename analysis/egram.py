@@ -0,0 +1,179 @@
+# analysis/egram.py
+# Streaming egram analysis: sensed event / pacing spike detection, heart rate
+# and AS/AP/VS/VP event markers. Consumes the (vent, atr) frames returned by
+# PacemakerSerial.decode_signals, one frame at a time.
+#
+# Egram samples are fixed-point from decode onward: int16 counts with a
+# per-channel sensitivity (mV per count, the DICOM ChannelSensitivity).
+from collections import deque, namedtuple
+
+import numpy as np
+
+from params import schema
+
+EgramEvent = namedtuple("EgramEvent", ["time", "sample", "marker", "amplitude"])  # amplitude in mV
+
+EGRAM_SENSITIVITY = 0.001  # mV per count: int16 spans +/-32.767 mV in 1 uV steps
+INT16_MIN, INT16_MAX = -32768, 32767
+
+MARKER_MEANINGS = {
+    "AS": "Atrial Sensed",
+    "AP": "Atrial Paced",
+    "VS": "Ventricular Sensed",
+    "VP": "Ventricular Paced",
+}
+
+
+# Quantize mV samples to int16 counts, saturating instead of wrapping around
+# integer input is taken as counts already and only saturated
+def to_counts(values, sensitivity=EGRAM_SENSITIVITY):
+    x = np.asarray(values)
+    if x.dtype == np.int16:
+        return x
+    if x.dtype.kind in "iu":
+        return np.clip(x, INT16_MIN, INT16_MAX).astype(np.int16)
+    scaled = np.divide(x, sensitivity, dtype=np.float64)
+    np.rint(scaled, out=scaled)
+    np.clip(scaled, INT16_MIN, INT16_MAX, out=scaled)
+    scaled[np.isnan(scaled)] = 0
+    return scaled.astype(np.int16)
+
+
+# 0-d operands of to_counts_into (a Python scalar would be converted to an array on every call)
+_SENSITIVITY = np.array(EGRAM_SENSITIVITY)
+_COUNT_MIN, _COUNT_MAX, _ZERO = np.array(float(INT16_MIN)), np.array(float(INT16_MAX)), np.array(0.0)
+
+# to_counts of a float array into a preallocated int16 `out`, for the per-frame hot path:
+# `work` (float64) and `mask` (bool) are scratch arrays of the same shape, reused across calls
+def to_counts_into(values, out, work, mask):
+    np.copyto(work, values)  # widen first, a mixed-dtype ufunc call allocates a cast buffer
+    np.divide(work, _SENSITIVITY, out=work)
+    np.rint(work, out=work)
+    np.minimum(work, _COUNT_MAX, out=work)
+    np.maximum(work, _COUNT_MIN, out=work)
+    np.isnan(work, out=mask)
+    np.putmask(work, mask, _ZERO)
+    np.copyto(out, work, casting="unsafe")
+    return out
+
+
+# Convert int16 counts back to mV (only needed for display)
+def to_mv(counts, sensitivity=EGRAM_SENSITIVITY):
+    return np.multiply(counts, sensitivity, dtype=np.float64)
+
+
+class ChannelDetector:
+    """
+    Threshold and refractory event detector for one chamber.
+    A sample starts an event when its magnitude rises through sense_threshold
+    (sensed) or when the sample-to-sample step reaches pace_slope (pacing spike).
+    No new event is accepted until refractory_ms has passed.
+    Thresholds are given in mV and compared against int16 counts.
+    EgramAnalyzer tests both chambers in one vectorized pass and hands each detector its candidates.
+    """
+    def __init__(self, chamber, sense_threshold, pace_slope, refractory_ms, fs, sensitivity=EGRAM_SENSITIVITY):
+        self.chamber = chamber  # "A" or "V"
+        self.sensitivity = sensitivity
+        self.sense_threshold = int(round(sense_threshold / sensitivity))  # counts
+        self.pace_slope = int(round(pace_slope / sensitivity))            # counts per sample
+        self.refractory = int(round(refractory_ms * fs / 1000.0))
+
+        # state carried between frames
+        self._last = 0         # previous sample (counts), prepended to the next block
+        self._blank_until = 0  # absolute sample index where refractory ends
+
+    def _accept(self, candidates, paced, block, start):
+        # only the (few) candidates are walked to apply refractory
+        events = []
+        for i in candidates:
+            sample = start + int(i)
+            if sample < self._blank_until:
+                continue
+            marker = self.chamber + ("P" if paced[i] else "S")
+            events.append((sample, marker, int(block[i + 1]) * self.sensitivity))
+            self._blank_until = sample + self.refractory
+
+        self._last = int(block[-1])
+        return events
+
+
+class EgramAnalyzer:
+    """
+    Incremental analysis of the atrial/ventricular egram stream.
+    Frames are int16 counts at `sensitivity` mV per count (float frames are taken as mV).
+    Work per sample is constant: both chambers are tested in one vectorized pass per frame and the
+    rolling heart rate keeps a running sum over the last `rate_window` intervals.
+    """
+    def __init__(self, fs=1000.0,
+                 atrial_threshold=schema.NOMINAL_VALUES["Atrial Sensitivity"],
+                 ventricular_threshold=schema.NOMINAL_VALUES["Ventricular Sensitivity"],
+                 pace_slope=2.0,
+                 atrial_refractory_ms=schema.NOMINAL_VALUES["ARP"],
+                 ventricular_refractory_ms=schema.NOMINAL_VALUES["VRP"],
+                 rate_chamber="V", rate_window=8, max_events=1000, sensitivity=EGRAM_SENSITIVITY):
+        self.fs = float(fs)
+        self.atrial = ChannelDetector("A", atrial_threshold, pace_slope, atrial_refractory_ms, fs, sensitivity)
+        self.ventricular = ChannelDetector("V", ventricular_threshold, pace_slope, ventricular_refractory_ms, fs, sensitivity)
+        self.sensitivity = sensitivity
+        self._sense_thresholds = np.array([[self.atrial.sense_threshold], [self.ventricular.sense_threshold]])
+        self._pace_slopes = np.array([[self.atrial.pace_slope], [self.ventricular.pace_slope]])
+        self.rate_chamber = rate_chamber
+
+        self.sample_count = 0
+        self.events = deque(maxlen=max_events)  # most recent markers
+
+        # heart rate state
+        self.instantaneous_rate = None  # bpm, from the last interval
+        self.rolling_rate = None        # bpm, from the mean of the last rate_window intervals
+        self._last_beat = None
+        self._intervals = deque(maxlen=rate_window)
+        self._interval_sum = 0
+
+    def _update_rate(self, sample):
+        if self._last_beat is not None:
+            interval = sample - self._last_beat
+            if len(self._intervals) == self._intervals.maxlen:
+                self._interval_sum -= self._intervals[0]
+            self._intervals.append(interval)
+            self._interval_sum += interval
+            self.instantaneous_rate = 60.0 * self.fs / interval
+            self.rolling_rate = 60.0 * self.fs * len(self._intervals) / self._interval_sum
+        self._last_beat = sample
+
+    def process_frame(self, vent, atr):
+        """Analyze one decoded frame, returns the new EgramEvents in time order."""
+        if len(vent) != len(atr):
+            raise ValueError(f"Channel length mismatch: {len(vent)} ventricular vs {len(atr)} atrial samples")
+        start = self.sample_count
+        n = len(vent)
+
+        # both chambers in one (2, n + 1) block: row 0 atrial, row 1 ventricular,
+        # column 0 the previous frame's last sample
+        block = np.empty((2, n + 1), dtype=np.int32)
+        block[0, 0] = self.atrial._last
+        block[1, 0] = self.ventricular._last
+        block[0, 1:] = to_counts(atr, self.sensitivity)
+        block[1, 1:] = to_counts(vent, self.sensitivity)
+        above = np.abs(block) >= self._sense_thresholds
+        paced = np.abs(np.diff(block, axis=1)) >= self._pace_slopes
+        hits = (above[:, 1:] & ~above[:, :-1]) | paced
+
+        found = self.atrial._accept(np.flatnonzero(hits[0]), paced[0], block[0], start)
+        found += self.ventricular._accept(np.flatnonzero(hits[1]), paced[1], block[1], start)
+        found.sort()
+
+        new_events = []
+        for sample, marker, amplitude in found:
+            event = EgramEvent(sample / self.fs, sample, marker, amplitude)
+            if marker[0] == self.rate_chamber:
+                self._update_rate(sample)
+            self.events.append(event)
+            new_events.append(event)
+
+        self.sample_count += len(vent)
+        return new_events
+
+    def events_since(self, sample):
+        """Markers at or after an absolute sample index (e.g. the start of a stored waveform)."""
+        return [e for e in self.events if e.sample >= sample]
+
@@ -0,0 +1,529 @@
+# bench/bench.py
+# Benchmarks for the DCM's critical paths: packet encode/decode, DICOM parameter
+# and waveform I/O, patient provisioning, waveform rendering and login.
+#
+#   python -m bench.bench                       run everything, compare to bench/baseline.json
+#   python -m bench.bench -k dicom --quick      subset, fewer rounds
+#   python -m bench.bench --output run.json     also write machine-readable results
+#   python -m bench.bench --update-baseline     record this run as the new baseline
+#
+# Each result also records alloc_bytes, the median peak of Python/numpy memory
+# allocated during one call (tracemalloc), so allocation-free hot paths stay that way.
+#
+# Exit status is 1 when a benchmark's best time per call (min over rounds, the
+# least noisy estimate) is slower than the baseline by more than --threshold
+# (default 25%, 50% with --quick's shorter rounds). A benchmark over the
+# threshold is measured again up to CONFIRM_RUNS times and only reported when
+# its best time over all runs still is: a one-off stall of the machine is not
+# a regression.
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import itertools
+import platform
+import statistics
+import tempfile
+import tracemalloc
+import warnings
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+BASELINE_FILE = os.path.join(BASE_DIR, "bench", "baseline.json")
+BENCH_USER = "_bench"  # throwaway account folder under data/ for init_dir
+DEFAULT_THRESHOLD = 0.25
+QUICK_THRESHOLD = 0.5
+CONFIRM_RUNS = 2
+WAVEFORM_LENGTHS = (500, 5000, 50000)
+
+BENCHMARKS = []
+
+
+# Register a benchmark; `setup(ctx)` returns the zero-argument callable to time
+# tolerance raises the regression threshold for microsecond-scale calls dominated by timer/scheduler noise
+def benchmark(name, unit="call", items=1, tolerance=0.0):
+    def register(setup):
+        BENCHMARKS.append((name, setup, unit, items, tolerance))
+        return setup
+    return register
+
+
+''' TIMING '''
+
+def measure(fn, rounds=5, min_round_time=0.1):
+    # calibrate the number of calls per round so that one round takes at least min_round_time
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_round_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_round_time / elapsed) + 1))
+
+    times = [elapsed / number]
+    for _ in range(rounds - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return {
+        "median_s": statistics.median(times),
+        "min_s": min(times),
+        "stdev_s": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "rounds": rounds,
+        "number": number,
+    }
+
+
+# Median peak bytes allocated by one call, measured separately from the timing (tracemalloc slows every allocation)
+def measure_allocations(fn, calls=100):
+    fn()  # warm caches and lazily created state
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(calls):
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            fn()
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+    return int(statistics.median(peaks))
+
+
+''' BENCHMARKS '''
+
+def _serial_packet():
+    from comm.serial_comm import PacemakerSerial
+    from params import schema
+    link = PacemakerSerial()
+    return link, schema
+
+
+@benchmark("serial.encode_parameters", tolerance=0.5)
+def bench_encode(ctx):
+    link, schema = _serial_packet()
+    params = dict(schema.SERIAL_DEFAULTS)
+    return lambda: link._encode_parameters("DDD", params)
+
+
+@benchmark("serial.decode_parameters", tolerance=0.5)
+def bench_decode(ctx):
+    link, schema = _serial_packet()
+    data = link._encode_parameters("DDD", dict(schema.SERIAL_DEFAULTS)).ljust(88, b"\0")
+    return lambda: link._decode_parameters(data)
+
+
+@benchmark("serial.decode_signals", tolerance=0.5)
+def bench_decode_signals(ctx):
+    link, _ = _serial_packet()
+    frame = np.linspace(-1, 1, 22, dtype="<f4").tobytes()
+    return lambda: link.decode_signals(frame)
+
+
+class _FramePort:
+    # Serial port stand-in that answers every read with the same frame
+    def __init__(self, frame):
+        self.frame = frame
+
+    def read(self, size):
+        return self.frame[:size]
+
+    def readinto(self, buffer):
+        buffer[:len(self.frame)] = self.frame
+        return len(self.frame)
+
+
+@benchmark("serial.read_frame+decode_signals[into]", unit="frame", tolerance=0.5)
+def bench_read_decode_into(ctx):
+    link, _ = _serial_packet()
+    link.serial_port = _FramePort(np.linspace(-1, 1, 22, dtype="<f4").tobytes())
+    out = (np.empty(11, dtype=np.int16), np.empty(11, dtype=np.int16))
+    return lambda: link.decode_signals(link._read_frame(), out)
+
+
+@benchmark("serial.read_frame+decode_signals[into,128/ch]", unit="sample", items=256, tolerance=0.5)
+def bench_read_decode_large(ctx):
+    from comm.serial_comm import LinkParams
+    link, _ = _serial_packet()
+    link._set_link(LinkParams(921600, 128, True))
+    link.serial_port = _FramePort(np.linspace(-1, 1, 256, dtype="<f4").tobytes())
+    out = (np.empty(128, dtype=np.int16), np.empty(128, dtype=np.int16))
+    return lambda: link.decode_signals(link._read_frame(link.signal_frame_size), out)
+
+
+@benchmark("link_monitor.record", unit="frame", tolerance=0.5)
+def bench_link_monitor(ctx):
+    from comm.link_monitor import LinkMonitor
+    monitor = LinkMonitor()
+    latencies = itertools.cycle([150.0, 152.0, 149.0, 400.0, 151.0])
+    return lambda: monitor.record(True, next(latencies))
+
+
+@benchmark("telemetry_ring.publish+read", unit="frame", tolerance=0.5)
+def bench_telemetry_ring(ctx):
+    from comm.telemetry_ring import TelemetryRing
+    ring = TelemetryRing.create(f"dcm_bench_ring_{os.getpid()}", slots=1024)
+    reader = ring.reader("bench")
+    vent, atr = np.arange(128, dtype=np.int16), np.arange(128, dtype=np.int16)
+    out = np.zeros(ring.max_samples, np.int16), np.zeros(ring.max_samples, np.int16)
+    ctx["cleanup"].append(ring.close)
+
+    def publish_read():
+        ring.publish(vent, atr)
+        reader.read_into(*out)
+    return publish_read
+
+
+@benchmark("stream_queue.put+get[drop_oldest]", unit="frame", tolerance=0.5)
+def bench_stream_queue(ctx):
+    from comm.stream_queue import StreamQueue, DROP_OLDEST
+    queue = StreamQueue("bench", maxsize=64, policy=DROP_OLDEST)
+    vent, atr = np.arange(128, dtype=np.int16), np.arange(128, dtype=np.int16)
+    out = np.zeros(128, np.int16), np.zeros(128, np.int16)
+    for seq in range(32):
+        queue.put(vent, atr, seq)
+
+    def put_get():
+        queue.put(vent, atr)
+        queue.get(timeout=0, out=out)
+    return put_get
+
+
+@benchmark("egram.decode+analyze", unit="frame")
+def bench_decode_analyze(ctx):
+    from analysis.egram import EgramAnalyzer
+    link, _ = _serial_packet()
+    analyzer = EgramAnalyzer()
+    frame = np.sin(np.linspace(0, 3, 22)).astype("<f4").tobytes()
+
+    def decode_analyze():
+        vent, atr = link.decode_signals(frame)
+        analyzer.process_frame(vent, atr)
+    return decode_analyze
+
+
+def _gui_parameter_set():
+    from params import schema
+    values = {name: schema.NOMINAL_VALUES[name] for name in schema.MODE_PARAMETERS["AAIR"]}
+    values.update({"Atrial Pulse Width": 1.1, "Atrial Sensitivity": 0.5})  # exact-half conversions
+    return schema, values
+
+
+@benchmark("params.to_serial+from_serial", unit="set", tolerance=0.5)
+def bench_param_conversion(ctx):
+    schema, values = _gui_parameter_set()
+
+    def convert():
+        schema.from_serial(schema.to_serial(values))
+    return convert
+
+
+@benchmark("params.to_serial_batch[AAIR x 100000]", unit="set", items=100000)
+def bench_param_conversion_batch(ctx):
+    schema, values = _gui_parameter_set()
+    names = schema.MODE_PARAMETERS["AAIR"]
+    row = [schema.CHOICES[n][values[n]] if n in schema.CHOICES else values[n] for n in names]
+    sweep = np.tile(np.array(row, dtype=float), (100000, 1))
+    sweep[:, names.index("Atrial Pulse Width")] = np.round(np.linspace(0.05, 1.9, 100000) / 0.01) * 0.01
+    return lambda: schema.to_serial_batch("AAIR", sweep)
+
+
+def _brady_file(ctx):
+    from dicom.dicom_init import bradycardia_param_init
+    path = os.path.join(ctx["tmp"], "brady_params_report.dcm")
+    if not os.path.exists(path):
+        bradycardia_param_init("00000", path)
+    return path
+
+
+@benchmark("dicom.get_parameter")
+def bench_get_parameter(ctx):
+    from dicom.dicom import get_parameter
+    path = _brady_file(ctx)
+    return lambda: get_parameter(path, "VVIR", "Recovery Time")  # last mode: worst-case traversal
+
+
+@benchmark("dicom.set_parameter")
+def bench_set_parameter(ctx):
+    from dicom.dicom import set_parameter
+    path = _brady_file(ctx)
+    return lambda: set_parameter(path, "VVIR", "Recovery Time", 5.0)
+
+
+def _all_parameter_names():
+    from params.schema import MODE_PARAMETERS
+    return [(mode, name) for mode, names in MODE_PARAMETERS.items() for name in names]
+
+
+@benchmark("dicom.patient_load.get_parameter", unit="patient")
+def bench_patient_load(ctx):
+    from dicom.dicom import get_parameter
+    path = _brady_file(ctx)
+    names = _all_parameter_names()
+    return lambda: [get_parameter(path, mode, name) for mode, name in names]
+
+
+@benchmark("dicom.patient_load.get_all_parameters", unit="patient")
+def bench_patient_load_all(ctx):
+    from dicom.dicom import get_all_parameters
+    path = _brady_file(ctx)
+    return lambda: get_all_parameters(path)
+
+
+@benchmark("provision.init_dir+default_parameters", unit="patient")
+def bench_provision(ctx):
+    from dicom.dicom import init_dir
+    from dicom.patients import default_parameters
+    user_dir = os.path.join(BASE_DIR, "data", BENCH_USER)
+    ctx["cleanup"].append(lambda: shutil.rmtree(user_dir, ignore_errors=True))
+    counter = iter(range(10**9))
+
+    def provision():
+        paths = init_dir(BENCH_USER, f"P{next(counter)}")
+        default_parameters(paths)
+        shutil.rmtree(os.path.dirname(paths["PT_INFO_DCM"]))
+    return provision
+
+
+def _waveform_file(ctx, n):
+    from dicom.dicom import set_ecg_waveform
+    from dicom.dicom_init import lead_waveform_init
+    path = os.path.join(ctx["tmp"], f"lead_waveform_{n}.dcm")
+    if not os.path.exists(path):
+        lead_waveform_init("00000", path)
+        data = np.sin(np.linspace(0, 40 * np.pi, n))
+        set_ecg_waveform(path, "Atrial Lead", data)
+        set_ecg_waveform(path, "Ventricular Lead", data)
+    return path
+
+
+def _register_waveform_benchmarks(n):
+    @benchmark(f"dicom.get_ecg_waveform[n={n}]", unit="sample", items=n)
+    def bench_get(ctx):
+        from dicom.dicom import get_ecg_waveform
+        path = _waveform_file(ctx, n)
+        return lambda: get_ecg_waveform(path, "Atrial Lead")
+
+    @benchmark(f"dicom.set_ecg_waveform[n={n}]", unit="sample", items=n)
+    def bench_set(ctx):
+        from dicom.dicom import set_ecg_waveform
+        path = _waveform_file(ctx, n)
+        data = np.sin(np.linspace(0, 40 * np.pi, n))
+        return lambda: set_ecg_waveform(path, "Atrial Lead", data)
+
+
+for _n in WAVEFORM_LENGTHS:
+    _register_waveform_benchmarks(_n)
+
+
+@benchmark("dicom.waveform_append+checkpoint[11 samples]", unit="sample", items=11)
+def bench_waveform_append(ctx):
+    from dicom.waveform_appender import WaveformAppender
+    appender = WaveformAppender(_waveform_file(ctx, 50000), "Atrial Lead", checkpoint_samples=1)
+    ctx["cleanup"].append(appender.close)
+    frame = np.arange(11, dtype=np.int16)
+    return lambda: appender.append(frame)
+
+
+def _surface_file(ctx, n):
+    from dicom.dicom import set_multiplex_waveform
+    from dicom.dicom_init import surface_ecg_init
+    path = os.path.join(ctx["tmp"], f"surface_ecg_{n}.dcm")
+    if not os.path.exists(path):
+        surface_ecg_init("00000", path)
+        t = np.linspace(0, 40 * np.pi, n)[:, None]
+        set_multiplex_waveform(path, "Surface Lead", np.sin(t + np.arange(12)))
+    return path
+
+
+@benchmark("dicom.get_multiplex_waveform[12x5000]", unit="sample", items=12 * 5000)
+def bench_get_multiplex(ctx):
+    from dicom.dicom import get_multiplex_waveform
+    path = _surface_file(ctx, 5000)
+    return lambda: get_multiplex_waveform(path, "Surface Lead")
+
+
+@benchmark("dicom.set_multiplex_waveform[12x5000]", unit="sample", items=12 * 5000)
+def bench_set_multiplex(ctx):
+    from dicom.dicom import set_multiplex_waveform
+    path = _surface_file(ctx, 5000)
+    data = np.sin(np.linspace(0, 40 * np.pi, 5000)[:, None] + np.arange(12))
+    return lambda: set_multiplex_waveform(path, "Surface Lead", data)
+
+
+class _PlotHarness:
+    # The attributes DCMMainInterface.plot_waveform uses, on an offscreen Agg canvas
+    def __init__(self, paths, lead_type):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from gui.main_interface import DCMMainInterface
+        self.paths = paths
+        self.lead_type = lead_type
+        self.fig = Figure(figsize=(6, 3), dpi=100)
+        self.ax = self.fig.add_subplot(111)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self._plot_waveform = DCMMainInterface._plot_waveform.__get__(self)
+        self._plot_surface_ecg = DCMMainInterface._plot_surface_ecg.__get__(self)
+        self.plot_waveform = DCMMainInterface.plot_waveform.__get__(self)
+
+
+def _register_plot_benchmark(lead_type):
+    @benchmark(f"gui.plot_waveform[{lead_type}]", unit="frame")
+    def bench_plot(ctx):
+        harness = _PlotHarness({"LEAD_WAVFRM_DCM": _waveform_file(ctx, 5000)}, lead_type)
+        return harness.plot_waveform
+
+
+for _lead in ("Atrial Lead", "Surface Lead"):
+    _register_plot_benchmark(_lead)
+
+
+@benchmark("gui.plot_waveform[Surface Lead, 12-lead]", unit="frame")
+def bench_plot_surface(ctx):
+    paths = {"LEAD_WAVFRM_DCM": _waveform_file(ctx, 5000), "SURFACE_ECG_DCM": _surface_file(ctx, 5000)}
+    harness = _PlotHarness(paths, "Surface Lead")
+    return harness.plot_waveform
+
+
+@benchmark("auth.check_login")
+def bench_check_login(ctx):
+    from auth import auth
+    db_file = auth.DB_FILE
+    auth.DB_FILE = os.path.join(ctx["tmp"], "users.db")  # never touch the real users.db
+    ctx["cleanup"].append(lambda: setattr(auth, "DB_FILE", db_file))
+    auth.init_db()
+    auth.add_user("bench", "password")
+    return lambda: auth.check_login("bench", "password")
+
+
+''' RUN / COMPARE '''
+
+# names: exactly these benchmarks (e.g. the ones to confirm), instead of the pattern
+def run(pattern=None, rounds=5, min_round_time=0.1, log=None, names=None):
+    results = {}
+    tmp = tempfile.mkdtemp(prefix="dcm_bench_")
+    ctx = {"tmp": tmp, "cleanup": []}
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)  # pydicom VR length warnings from the init templates
+            for name, setup, unit, items, tolerance in BENCHMARKS:
+                if pattern and pattern not in name or names is not None and name not in names:
+                    continue
+                fn = setup(ctx)
+                result = measure(fn, rounds, min_round_time)
+                result["alloc_bytes"] = measure_allocations(fn, min(100, result["number"]))
+                result["unit"] = unit
+                result["tolerance"] = tolerance
+                result["ops_per_s"] = items / result["min_s"]
+                results[name] = result
+                if log:
+                    log(f"{name:<48} {result['min_s'] * 1e3:10.3f} ms  {result['ops_per_s']:14,.0f} {unit}/s"
+                        f"  {result['alloc_bytes']:10,d} B/call")
+    finally:
+        for cleanup in reversed(ctx["cleanup"]):
+            cleanup()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "rounds": rounds,
+        },
+        "results": results,
+    }
+
+
+# Compare best time per call against a baseline run, returns (regressions, report lines)
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    regressions = []
+    lines = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            lines.append(f"{name:<48} {'new':>10}")
+            continue
+        change = result["min_s"] / base["min_s"] - 1.0
+        flag = ""
+        if change > max(threshold, result.get("tolerance", 0.0)):
+            regressions.append(name)
+            flag = "  REGRESSION"
+        lines.append(f"{name:<48} {change * 100:+9.1f}%{flag}")
+    return regressions, lines
+
+
+# Keep the faster of two runs of each benchmark in `current`
+def keep_best(current, rerun):
+    for name, result in rerun["results"].items():
+        if result["min_s"] < current["results"][name]["min_s"]:
+            current["results"][name] = result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DCM critical path benchmarks")
+    parser.add_argument("-k", dest="pattern", help="only run benchmarks whose name contains this")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="3 short rounds per benchmark")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--threshold", type=float,
+                        help="allowed slowdown vs. baseline as a fraction (default 0.25, 0.5 with --quick)")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    rounds, min_round_time = (3, 0.02) if args.quick else (args.rounds, 0.1)
+    if args.threshold is None:
+        args.threshold = QUICK_THRESHOLD if args.quick else DEFAULT_THRESHOLD
+    log = lambda line: print(line, file=sys.stderr)
+    current = run(args.pattern, rounds, min_round_time, log)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.update_baseline:
+        baseline = {"meta": current["meta"], "results": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline["results"] = json.load(f)["results"]
+        baseline["results"].update(current["results"])  # a -k subset only replaces its own entries
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        log(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        log(f"No baseline at {args.baseline}, run with --update-baseline to record one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions, lines = compare(current, baseline, args.threshold)
+    for _ in range(CONFIRM_RUNS):
+        if not regressions:
+            break
+        log(f"\nConfirming {len(regressions)} benchmark(s) over the threshold")
+        keep_best(current, run(rounds=rounds, min_round_time=min_round_time, log=log, names=regressions))
+        regressions, lines = compare(current, baseline, args.threshold)
+    log(f"\nvs. baseline ({baseline['meta']['timestamp']}, {baseline['meta']['platform']}):")
+    for line in lines:
+        log(line)
+    if regressions:
+        log(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
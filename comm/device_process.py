@@ -0,0 +1,454 @@
+# comm/device_process.py
+# Out-of-process device I/O: a PacemakerSerial session in a supervised child process.
+#
+# DeviceProcess stands in for a PacemakerSerial (the methods and attributes the
+# GUI, the scheduler and the service use), forwarding every call over a pipe to
+# a child process that owns the serial port. The child answers commands as they
+# arrive and, while streaming, polls signal frames back to back in between,
+# publishing them to the TelemetryRing the parent attached (user-visible samples
+# never cross the pipe). Rendering, Tk and the GIL of the GUI process therefore
+# cannot delay a serial read.
+#
+# Messages, pickled over a multiprocessing Pipe:
+#   parent -> child   (call id, method, args, kwargs)
+#   child -> parent   ("reply", call id, ok, result or error, status)
+#                     ("event", "link_state" | "connection", args)
+# status is a snapshot of the child's session (connected, port, link, health...)
+# that the parent keeps to answer attribute reads without a round trip.
+#
+# Supervision: when the child dies (pipe closed) or a call gets no reply within
+# call_timeout, it is killed and restarted with a backoff, and the session is
+# replayed: telemetry ring, connect, link negotiation, last programming,
+# streaming. Calls in flight at that moment fail like a lost link does.
+#
+#   link = DeviceProcess()            # or DCM_DEVICE_PROCESS=1 for the GUI and service
+#   link.connect("/dev/ttyACM0"); link.telemetry = TelemetryRing.create(); link.start_streaming()
+import os
+import time
+import logging
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from metrics import metrics
+from metrics.metrics import log_event
+
+from .serial_comm import PacemakerSerial, DEFAULT_BAUDRATE, LEGACY_SAMPLES
+
+LOG = metrics.get_logger("device_process")
+
+ENV_VAR = "DCM_DEVICE_PROCESS"
+CALL_TIMEOUT_S = 10.0              # connect alone sleeps 1 s; a hung child is restarted after this
+RESTART_BACKOFF_S = 0.1
+RESTART_MAX_BACKOFF_S = 5.0
+STABLE_AFTER_S = 10.0              # a child that lived this long resets the backoff
+IDLE_POLL_S = 0.1                  # streaming while disconnected: check for commands this often
+
+RESTARTS = metrics.counter("dcm_device_process_restarts_total", "Device I/O child process restarts")
+CALL_MS = metrics.histogram("dcm_device_process_call_ms", "Round trip of a call to the device process")
+
+# Result of a call that could not complete, by method (default: (False, message))
+FAILURE_RESULTS = {
+    "echo_test_parameters": lambda message: (False, message, {}),
+    "verify_parameters": lambda message: (False, message, {}),
+    "cached_state": lambda message: None,
+    "list_ports": lambda message: [],
+    "find_jlink_port": lambda message: None,
+}
+
+DEFAULT_STATUS = {"connected": False, "port_name": None, "device_identity": None, "recording": None,
+                  "link": None, "health": {}, "reconnect": {}, "signal_frame_size": 8 * LEGACY_SAMPLES}
+
+
+def enabled():
+    return os.environ.get(ENV_VAR) == "1"
+
+
+class RemoteMonitor:
+    ''' The child's LinkMonitor as seen from the parent: on_change callback and last stats '''
+
+    def __init__(self, process):
+        self.on_change = None
+        self._process = process
+
+    @property
+    def state(self):
+        return self.stats().get("state", "OK")
+
+    def stats(self):
+        return dict(self._process._status["health"])
+
+    # Evaluated in the child with every transaction: the state it last reported, without a round trip
+    def check(self, now=None):
+        return self.state
+
+
+class DeviceProcess:
+    def __init__(self, port_opener=None, call_timeout=CALL_TIMEOUT_S):
+        self.port_opener = port_opener  # picklable stand-in for PacemakerSerial._open_port (tests, simulators)
+        self.call_timeout = call_timeout
+        self.monitor = RemoteMonitor(self)
+        self.on_connection = None
+        self.port_watcher = None  # used in this process for list_ports/find_jlink_port
+        self.restarts = 0
+        self._last_restart = None
+        self._restart_delay = 0.0
+        self._status = dict(DEFAULT_STATUS)
+        self._telemetry = None
+        self._session = {}  # calls replayed after a restart: connect, negotiate_link, program_parameters
+        self._streaming = None
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._send_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._closing = False
+        self._context = multiprocessing.get_context("spawn")
+        self._process = None
+        self._conn = None
+        self._start()
+        self._ready.set()
+
+    ''' CHILD LIFECYCLE '''
+    def _start(self):
+        parent, child = self._context.Pipe()
+        self._process = self._context.Process(target=serve, args=(child, self.port_opener),
+                                              name="dcm-device-io", daemon=True)
+        self._process.start()
+        child.close()
+        self._conn = parent
+        threading.Thread(target=self._receive, args=(parent,), name="device-process-rx", daemon=True).start()
+        log_event(LOG, logging.INFO, "device_process_started", pid=self._process.pid)
+
+    def _receive(self, conn):
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == "reply":
+                _, call_id, ok, result, status = message
+                self._status = status
+                future = self._pending.pop(call_id, None)
+                if future is not None:
+                    future.set_result((ok, result))
+            else:
+                self._dispatch(*message[1:])
+        if conn is self._conn and not self._closing:
+            self._restart("device process exited")
+
+    def _dispatch(self, event, args):
+        if event == "link_state" and self.monitor.on_change:
+            self.monitor.on_change(*args)
+        elif event == "connection":
+            state, info = args
+            self._status["connected"] = state == "connected"
+            if self.on_connection:
+                self.on_connection(state, info)
+
+    # Kill the child (if still there), start a new one and replay the session on it
+    def _restart(self, reason):
+        with self._send_lock:
+            restarting = self._closing or not self._ready.is_set()
+            if not restarting:
+                self._ready.clear()
+                old, self._conn = self._conn, None
+        self._fail_pending(f"Device process restarted ({reason})")
+        if restarting:
+            return  # closing, or a replay was under way: the restart loop below tries again
+        lost_at = time.perf_counter()
+        if self._process.is_alive():
+            self._process.kill()
+        self._process.join(1)
+        old.close()
+        self.restarts += 1
+        RESTARTS.inc()
+        log_event(LOG, logging.WARNING, "device_process_restart", reason=reason, restarts=self.restarts)
+        port = self.port_name
+        self._status = dict(DEFAULT_STATUS)
+        session = "connect" in self._session
+        if session and self.on_connection:
+            self.on_connection("reconnecting", {"port": port, "error": reason})
+
+        # the first restart is immediate, a child that keeps dying is restarted ever more slowly
+        if self._last_restart is not None and lost_at - self._last_restart < STABLE_AFTER_S:
+            self._restart_delay = min(max(self._restart_delay * 2, RESTART_BACKOFF_S), RESTART_MAX_BACKOFF_S)
+        else:
+            self._restart_delay = 0.0
+        self._last_restart = lost_at
+        time.sleep(self._restart_delay)
+        while not self._closing:
+            try:
+                self._start()
+                self._replay()
+                break
+            except (OSError, ConnectionError) as e:
+                log_event(LOG, logging.ERROR, "device_process_restart_failed", error=str(e))
+                if self._process.is_alive():
+                    self._process.kill()
+                self._restart_delay = min(max(self._restart_delay * 2, RESTART_BACKOFF_S), RESTART_MAX_BACKOFF_S)
+                time.sleep(self._restart_delay)
+        if session and self.on_connection and not self._closing:
+            self.on_connection("connected", dict(self.reconnect_stats, port=port,
+                                                 last_recover_ms=(time.perf_counter() - lost_at) * 1000))
+
+    def _replay(self):
+        if self._telemetry is not None:
+            self._call("attach_telemetry", (self._telemetry.name,), {}, replay=True)
+        for name in ("connect", "negotiate_link", "program_parameters"):
+            if name in self._session:
+                args, kwargs = self._session[name]
+                ok, result = self._call(name, args, kwargs, replay=True)
+                if not ok or not (result[0] if isinstance(result, tuple) else result):
+                    raise ConnectionError(f"{name} failed after restart: {result}")
+        if self._streaming is not None:
+            self._call("start_streaming", (self._streaming,), {}, replay=True)
+        self._ready.set()
+
+    def _fail_pending(self, message):
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_result((False, message))
+
+    def close(self):
+        self._closing = True
+        with self._send_lock:
+            conn = self._conn
+            if conn is not None:
+                try:
+                    conn.send((0, "stop", (), {}))
+                except OSError:
+                    pass
+        if self._process is not None:
+            self._process.join(2)
+            if self._process.is_alive():
+                self._process.kill()
+        self._fail_pending("Device process closed")
+
+    ''' CALLS '''
+    # Send one call and wait for its reply: (ok, result), ok False when the call raised or the child failed
+    def _call(self, name, args=(), kwargs=None, replay=False):
+        if not replay and not self._ready.wait(self.call_timeout):
+            return False, "Device process restarting"
+        future = Future()
+        call_id = next(self._ids)
+        start = time.perf_counter()
+        with self._send_lock:
+            if self._closing or self._conn is None:
+                return False, "Device process closed"
+            self._pending[call_id] = future
+            try:
+                self._conn.send((call_id, name, args, kwargs or {}))
+            except (OSError, ValueError) as e:
+                self._pending.pop(call_id, None)
+                return False, str(e)
+        try:
+            ok, result = future.result(self.call_timeout)
+        except FutureTimeout:
+            self._pending.pop(call_id, None)
+            if replay:
+                raise ConnectionError(f"{name} timed out after restart")
+            threading.Thread(target=self._restart, args=(f"{name} timed out",), daemon=True).start()
+            return False, f"{name} timed out"
+        CALL_MS.observe((time.perf_counter() - start) * 1000)
+        return ok, result
+
+    # A forwarded PacemakerSerial method: its own result, or its failure shape when the call failed
+    def _forward(self, name, *args, **kwargs):
+        ok, result = self._call(name, args, kwargs)
+        if ok:
+            return result
+        return FAILURE_RESULTS.get(name, lambda message: (False, message))(result)
+
+    def _remember(self, name, args, kwargs, result):
+        if result[0]:
+            self._session[name] = (args, kwargs)
+
+    ''' PACEMAKERSERIAL INTERFACE '''
+    def connect(self, port, baudrate=DEFAULT_BAUDRATE, timeout=1):
+        self._session.clear()
+        result = self._forward("connect", port, baudrate, timeout)
+        self._remember("connect", (port, baudrate, timeout), {}, result)
+        return result
+
+    def disconnect(self):
+        self._session.clear()
+        self._streaming = None
+        return self._forward("disconnect")
+
+    def negotiate_link(self, max_baudrate=None, max_samples=None):
+        result = self._forward("negotiate_link", max_baudrate, max_samples)
+        self._remember("negotiate_link", (max_baudrate, max_samples), {}, result)
+        return result
+
+    def program_parameters(self, mode, parameters, force=False):
+        result = self._forward("program_parameters", mode, parameters, force)
+        self._remember("program_parameters", (mode, parameters), {"force": True}, result)
+        return result
+
+    def echo_test_parameters(self, mode, params, force=False):
+        result = self._forward("echo_test_parameters", mode, params, force)
+        self._remember("program_parameters", (mode, params), {"force": True}, result)
+        return result
+
+    def verify_parameters(self, mode, params):
+        return self._forward("verify_parameters", mode, params)
+
+    def interrogate_device(self):
+        return self._forward("interrogate_device")
+
+    # out=(vent, atr) is filled in here; the arrays themselves do not cross the pipe
+    def get_signals(self, out=None):
+        ok, signals = self._forward("get_signals")
+        if ok and out is not None:
+            n = len(signals[0])
+            out[0][:n] = signals[0]
+            out[1][:n] = signals[1]
+            signals = out
+        return ok, signals
+
+    def cached_state(self):
+        return self._forward("cached_state")
+
+    def invalidate_state_cache(self, all_devices=False):
+        self._forward("invalidate_state_cache", all_devices)
+
+    def notify_port_change(self):
+        self._forward("notify_port_change")
+
+    def list_ports(self):
+        if self.port_watcher is not None:
+            return self.port_watcher.ports
+        return self._forward("list_ports")
+
+    def find_jlink_port(self):
+        if self.port_watcher is not None:
+            return self.port_watcher.find_jlink_port()
+        return self._forward("find_jlink_port")
+
+    def link_info(self):
+        return self._status["link"]
+
+    # Poll signal frames in the child, back to back (interval 0) or every `interval` seconds,
+    # publishing them to the telemetry ring; commands still run between two frames
+    def start_streaming(self, interval=0.0):
+        self._streaming = interval
+        return self._forward("start_streaming", interval)
+
+    def stop_streaming(self):
+        self._streaming = None
+        return self._forward("stop_streaming")
+
+    # Record the raw traffic in the child (a restarted child does not resume it); (ok, path or error)
+    def start_recording(self, path):
+        return self._forward("start_recording", path)
+
+    def stop_recording(self):
+        return self._forward("stop_recording")
+
+    # Path of the child's recording, None when not recording
+    @property
+    def recorder(self):
+        return self._status["recording"]
+
+    @property
+    def telemetry(self):
+        return self._telemetry
+
+    # The ring is created (and owned) here, so consumers stay attached across child restarts
+    @telemetry.setter
+    def telemetry(self, ring):
+        self._telemetry = ring
+        self._forward("attach_telemetry", ring.name if ring is not None else None)
+
+    @property
+    def connected(self):
+        return self._status["connected"]
+
+    @property
+    def port_name(self):
+        return self._status["port_name"]
+
+    @property
+    def device_identity(self):
+        return self._status["device_identity"]
+
+    @property
+    def reconnect_stats(self):
+        return dict(self._status["reconnect"], process_restarts=self.restarts)
+
+    @property
+    def signal_frame_size(self):
+        return self._status["signal_frame_size"]
+
+    @property
+    def pid(self):
+        return self._process.pid if self._process is not None else None
+
+
+''' CHILD '''
+def _snapshot(link):
+    return {"connected": bool(link.connected), "port_name": link.port_name, "device_identity": link.device_identity,
+            "recording": link.recorder.path if link.recorder is not None else None,
+            "link": link.link_info(), "health": link.monitor.stats(), "reconnect": dict(link.reconnect_stats),
+            "signal_frame_size": link.signal_frame_size}
+
+
+# Child process main loop: run commands as they come, poll signals in between while streaming
+def serve(conn, port_opener=None):
+    from .telemetry_ring import TelemetryRing
+
+    link = PacemakerSerial()
+    if port_opener is not None:
+        link._open_port = port_opener
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+    link.monitor.on_change = lambda old, new, stats: send(("event", "link_state", (old, new, stats)))
+    link.on_connection = lambda state, info: send(("event", "connection", (state, info)))
+    streaming = None
+
+    try:
+        while True:
+            if streaming is None:
+                timeout = None
+            else:
+                timeout = streaming if link.connected else max(streaming, IDLE_POLL_S)
+            if not conn.poll(timeout):
+                if streaming is not None and link.connected:
+                    link.get_signals()  # published to the telemetry ring
+                continue
+            call_id, name, args, kwargs = conn.recv()
+            if name == "stop":
+                break
+            try:
+                if name == "start_streaming":
+                    streaming = args[0]
+                    result = (True, "Streaming")
+                elif name == "stop_streaming":
+                    streaming = None
+                    result = (True, "Stopped")
+                elif name == "start_recording":
+                    result = (True, link.start_recording(*args).path)
+                elif name == "stop_recording":
+                    link.stop_recording()
+                    result = (True, "Stopped")
+                elif name == "attach_telemetry":
+                    if link.telemetry is not None:
+                        link.telemetry.close()
+                    link.telemetry = TelemetryRing.attach(args[0]) if args[0] else None
+                    result = (True, args[0])
+                else:
+                    result = getattr(link, name)(*args, **kwargs)
+                reply = ("reply", call_id, True, result, _snapshot(link))
+            except Exception as e:
+                reply = ("reply", call_id, False, f"{type(e).__name__}: {e}", _snapshot(link))
+            send(reply)
+    except (EOFError, OSError, KeyboardInterrupt):
+        pass
+    finally:
+        link.disconnect()
+        if link.telemetry is not None:
+            link.telemetry.close()
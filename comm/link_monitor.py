@@ -0,0 +1,151 @@
+# comm/link_monitor.py
+# Link health of a PacemakerSerial session, updated once per device transaction.
+#
+# Every statistic is an exponentially weighted moving value, so record() is a
+# constant number of float operations whatever the session length:
+#   error rate      short/failed frames
+#   missed rate     frames slower than the deadline
+#   latency         p50/p95/p99 round trip, tracked with stochastic quantile steps
+#   jitter          mean deviation of the inter-frame interval (RFC 3550 style),
+#                   between consecutive stream frames only: interrogations and
+#                   programming come at the user's pace, and an interval longer
+#                   than lost_timeout is a pause in streaming, not jitter
+# The state is OK, DEGRADED (error/missed rate or jitter above their limits,
+# back to OK below half of them) or LOST (LOST_AFTER consecutive failures, or no
+# good frame for lost_timeout seconds while streaming, noticed by check() on a
+# timer). on_change(old, new, stats) is called on transitions only, from the
+# thread doing the I/O, so it must not block: the GUI queues it for its Tk poll.
+import time
+import logging
+
+from metrics import metrics
+from metrics.metrics import log_event
+
+LOG = metrics.get_logger("link_monitor")
+
+OK, DEGRADED, LOST = "OK", "DEGRADED", "LOST"
+STATE_CODES = {OK: 0, DEGRADED: 1, LOST: 2}
+
+LINK_STATE = metrics.gauge("dcm_link_state", "Link health: 0 OK, 1 degraded, 2 lost")
+TRANSITIONS = {state: metrics.counter("dcm_link_transitions_total", "Link health transitions", state=state)
+               for state in STATE_CODES}
+
+ALPHA = 0.05             # weight of the newest frame (about a 20-frame window)
+DEADLINE_MS = 300.0      # a transaction is ~50 ms of protocol delay plus the reply and transfer time
+MAX_ERROR_RATE = 0.1
+MAX_MISSED_RATE = 0.2
+MAX_JITTER_MS = 50.0
+LOST_AFTER = 3
+LOST_TIMEOUT_S = 2.0
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LinkMonitor:
+    def __init__(self, on_change=None, deadline_ms=DEADLINE_MS, alpha=ALPHA, max_error_rate=MAX_ERROR_RATE,
+                 max_missed_rate=MAX_MISSED_RATE, max_jitter_ms=MAX_JITTER_MS, lost_after=LOST_AFTER,
+                 lost_timeout=LOST_TIMEOUT_S):
+        self.on_change = on_change
+        self.deadline_ms = deadline_ms
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.max_missed_rate = max_missed_rate
+        self.max_jitter_ms = max_jitter_ms
+        self.lost_after = lost_after
+        self.lost_timeout = lost_timeout
+        self.reset()
+
+    def reset(self):
+        self.state = OK
+        self.frames = 0
+        self.failures = 0           # consecutive
+        self.error_rate = 0.0
+        self.missed_rate = 0.0
+        self.latency_ms = 0.0       # EWMA
+        self.latency_dev_ms = 0.0   # EWMA of |latency - mean|, the step size of the quantile estimates
+        self.quantiles = [0.0] * len(QUANTILES)
+        self.interval_ms = 0.0
+        self.jitter_ms = 0.0
+        self._last_frame = None     # last stream frame, None outside a run of stream frames
+        self._last_good = None
+
+    # One transaction: ok is False for a short/failed frame, latency_ms its round trip,
+    # stream False for anything but an egram poll (interrogation, programming, link setup)
+    def record(self, ok, latency_ms, now=None, stream=True):
+        now = time.perf_counter() if now is None else now
+        a = self.alpha
+        self.frames += 1
+        self.error_rate += a * ((0.0 if ok else 1.0) - self.error_rate)
+        self.missed_rate += a * ((1.0 if latency_ms > self.deadline_ms else 0.0) - self.missed_rate)
+
+        if self.frames == 1:
+            self.latency_ms = latency_ms
+            self.quantiles = [latency_ms] * len(QUANTILES)
+        else:
+            self.latency_dev_ms += a * (abs(latency_ms - self.latency_ms) - self.latency_dev_ms)
+            self.latency_ms += a * (latency_ms - self.latency_ms)
+            step = a * max(self.latency_dev_ms, 0.01)
+            for i, q in enumerate(QUANTILES):
+                self.quantiles[i] += step * (q - (latency_ms < self.quantiles[i]))
+
+        if not stream:
+            # breaks the frame cadence: measure intervals again from the next stream frame
+            self._last_frame = None
+        else:
+            if self._last_frame is not None and now - self._last_frame <= self.lost_timeout:
+                interval = (now - self._last_frame) * 1000.0
+                if self.interval_ms:
+                    self.jitter_ms += (abs(interval - self.interval_ms) - self.jitter_ms) / 16.0
+                    self.interval_ms += a * (interval - self.interval_ms)
+                else:
+                    self.interval_ms = interval
+            self._last_frame = now
+
+        if ok:
+            self.failures = 0
+            self._last_good = now
+        else:
+            self.failures += 1
+        self._update(now)
+        return self.state
+
+    # Re-evaluate without a new frame (the GUI calls it on a timer), so a stream that went silent turns LOST
+    def check(self, now=None):
+        self._update(time.perf_counter() if now is None else now)
+        return self.state
+
+    def _update(self, now):
+        # silence only counts while stream frames are expected
+        if self.failures >= self.lost_after or (
+                self._last_frame is not None and self._last_good is not None
+                and now - self._last_good > self.lost_timeout):
+            state = LOST
+        else:
+            # hysteresis: leave DEGRADED only when well under the limits
+            margin = 0.5 if self.state != OK else 1.0
+            degraded = (self.error_rate > self.max_error_rate * margin
+                        or self.missed_rate > self.max_missed_rate * margin
+                        or self.jitter_ms > self.max_jitter_ms * margin)
+            state = DEGRADED if degraded else OK
+        if state != self.state:
+            self._transition(state)
+
+    def _transition(self, state):
+        old, self.state = self.state, state
+        LINK_STATE.set(STATE_CODES[state])
+        TRANSITIONS[state].inc()
+        stats = self.stats()
+        log_event(LOG, logging.WARNING if state != OK else logging.INFO, "link_state", old=old, **stats)
+        if self.on_change:
+            self.on_change(old, state, stats)
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "frames": self.frames,
+            "error_rate": round(self.error_rate, 3),
+            "missed_rate": round(self.missed_rate, 3),
+            "latency_p50_ms": round(self.quantiles[0], 1),
+            "latency_p95_ms": round(self.quantiles[1], 1),
+            "latency_p99_ms": round(self.quantiles[2], 1),
+            "jitter_ms": round(self.jitter_ms, 1),
+        }
@@ -0,0 +1,135 @@
+# comm/port_discovery.py
+# Background serial port discovery and hot-plug watching.
+#
+# PortWatcher enumerates the ports once in its own thread at start, then only
+# re-enumerates (serial.tools.list_ports.comports, slow: it reads sysfs/the
+# registry for every port) when the set of serial device nodes in /dev changes,
+# which it checks with one directory listing every poll_interval. Where there is
+# no /dev (Windows) it re-enumerates every FALLBACK_INTERVAL_S instead.
+#
+# The cached list is always available without blocking (ports/port_infos).
+# on_change(added, removed, port_infos) is called on every change and
+# on_jlink(info, known) when a J-Link port appears, known being True for a
+# device remember()ed earlier (e.g. the one the session was connected to).
+# Both run on the watcher thread, so GUI callbacks must hand off with root.after.
+import os
+import time
+import logging
+import threading
+from collections import namedtuple
+
+import serial.tools.list_ports
+
+from metrics import metrics
+from metrics.metrics import log_event
+
+LOG = metrics.get_logger("port_discovery")
+
+POLL_INTERVAL_S = 0.25
+FALLBACK_INTERVAL_S = 2.0
+DEV_DIR = "/dev"
+SERIAL_PREFIXES = ("ttyACM", "ttyUSB", "ttyAMA", "cu.", "tty.")  # USB/UART nodes (Linux, macOS)
+
+PortInfo = namedtuple("PortInfo", ["device", "description", "serial_number"])
+
+ENUMERATE_MS = metrics.histogram("dcm_port_enumerate_ms", "Serial port enumeration time")
+HOTPLUG_EVENTS = metrics.counter("dcm_port_hotplug_events_total", "Serial ports added or removed")
+
+
+def is_jlink(info):
+    return info.description.startswith("JLink")
+
+
+class PortWatcher:
+    def __init__(self, on_change=None, on_jlink=None, poll_interval=POLL_INTERVAL_S, dev_dir=DEV_DIR):
+        self.on_change = on_change
+        self.on_jlink = on_jlink
+        self.poll_interval = poll_interval
+        self.dev_dir = dev_dir
+        self.known = set()  # serial numbers of devices to auto-connect to
+        self.port_infos = ()
+        self.ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    ''' CACHED ENUMERATION '''
+    @property
+    def ports(self):
+        return [(p.device, p.description) for p in self.port_infos]
+
+    def find_jlink_port(self):
+        for info in self.port_infos:
+            if is_jlink(info):
+                return info.device
+        return None
+
+    # The cached list once the first enumeration is done (waits at most `timeout` for it)
+    def wait_ready(self, timeout=None):
+        return self.ready.wait(timeout)
+
+    def remember(self, serial_number):
+        if serial_number:
+            self.known.add(serial_number)
+
+    def _enumerate(self):
+        with ENUMERATE_MS.time():
+            return tuple(PortInfo(p.device, p.description or "", p.serial_number or None)
+                         for p in serial.tools.list_ports.comports())
+
+    # Serial device nodes in /dev, None where there is no /dev to watch
+    def _signature(self):
+        try:
+            return frozenset(name for name in os.listdir(self.dev_dir) if name.startswith(SERIAL_PREFIXES))
+        except OSError:
+            return None
+
+    ''' WATCHING '''
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="port-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        signature = self._signature()
+        self._update(self._enumerate())
+        self.ready.set()
+        last_enumeration = time.monotonic()
+        while not self._stop.wait(self.poll_interval):
+            current = self._signature()
+            if current is None:
+                if time.monotonic() - last_enumeration < FALLBACK_INTERVAL_S:
+                    continue
+            elif current == signature:
+                continue
+            signature = current
+            last_enumeration = time.monotonic()
+            try:
+                self._update(self._enumerate())
+            except Exception as e:  # keep watching, the next change re-enumerates
+                log_event(LOG, logging.WARNING, "port_enumeration_failed", error=str(e))
+
+    def _update(self, infos):
+        before = {p.device: p for p in self.port_infos}
+        after = {p.device: p for p in infos}
+        added = [p for device, p in after.items() if before.get(device) != p]
+        removed = [p for device, p in before.items() if device not in after]
+        self.port_infos = infos
+        if not added and not removed:
+            return
+        HOTPLUG_EVENTS.inc(len(added) + len(removed))
+        log_event(LOG, logging.INFO, "ports_changed", added=[p.device for p in added],
+                  removed=[p.device for p in removed])
+        if self.on_change:
+            self.on_change(added, removed, infos)
+        if self.on_jlink and self.ready.is_set():
+            for info in added:
+                if is_jlink(info):
+                    self.on_jlink(info, info.serial_number in self.known)
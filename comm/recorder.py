@@ -0,0 +1,247 @@
+# comm/recorder.py
+# Session recorder and replay engine for the serial link.
+#
+# A log is a 32-byte header followed by fixed-size records (100 bytes by default):
+#   t (float64, seconds since the session started, monotonic)
+#   direction (uint8, TX/RX), command (uint8, see COMMANDS), length (uint16)
+#   payload (88 bytes by default, the frame padded with zeros; PacemakerSerial records use the largest
+#   negotiable frame, see serial_comm.RECORD_PAYLOAD)
+# Fixed-size records let replay memory-map the log as a numpy record array and
+# seek by time with a binary search over the (sorted) timestamp column.
+#
+#   python -m comm.recorder <log>                      summary
+#   python -m comm.recorder <log> --replay --speed 10  replay signals through the egram analysis
+import os
+import sys
+import time
+import struct
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from analysis.egram import EgramAnalyzer
+
+MAGIC = b"DCMREC\x00\x01"
+HEADER = struct.Struct("<8sdH14x")  # magic, session start (unix time), record size
+RECORD = struct.Struct("<dBBH88s")
+PAYLOAD_SIZE = 88
+
+TX, RX = 0, 1
+COMMANDS = ("program", "interrogate", "signals", "link")
+COMMAND_CODES = {name: code for code, name in enumerate(COMMANDS)}
+
+RECORD_OVERHEAD = RECORD.size - PAYLOAD_SIZE
+
+
+def record_dtype(payload_size=PAYLOAD_SIZE):
+    return np.dtype([
+        ("t", "<f8"),
+        ("direction", "u1"),
+        ("command", "u1"),
+        ("length", "<u2"),
+        ("payload", "u1", (payload_size,)),
+    ])
+
+RECORD_DTYPE = record_dtype()
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+Record = namedtuple("Record", ["t", "direction", "command", "data"])
+
+
+class SessionRecorder:
+    ''' Appends timestamped command packets and device frames to a binary log '''
+
+    def __init__(self, path, payload_size=PAYLOAD_SIZE):
+        self.path = path
+        self.payload_size = payload_size
+        self._record = struct.Struct(f"<dBBH{payload_size}s")
+        self.start_wall = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, self.start_wall, self._record.size))
+        self.count = 0
+
+    def record(self, direction, command, data):
+        if len(data) > self.payload_size:
+            raise ValueError(f"Frame of {len(data)} bytes exceeds the {self.payload_size}-byte record payload")
+        packed = self._record.pack(time.perf_counter() - self._start, direction, COMMAND_CODES[command], len(data), bytes(data))
+        with self._lock:
+            self._file.write(packed)
+            self.count += 1
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class SessionReplay:
+    '''
+    Memory-mapped read access to a recorded session.
+    A partially written last record (e.g. after a crash) is ignored.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, self.start_wall, record_size = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a DCM session log")
+        if record_size <= RECORD_OVERHEAD:
+            raise ValueError(f"Unsupported record size {record_size} in {path}")
+
+        dtype = record_dtype(record_size - RECORD_OVERHEAD)
+        n = (os.path.getsize(path) - HEADER.size) // record_size
+        if n:
+            self.records = np.memmap(path, dtype=dtype, mode="r", offset=HEADER.size, shape=(n,))
+        else:
+            self.records = np.zeros(0, dtype=dtype)
+        self.times = self.records["t"]
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def duration(self):
+        return float(self.times[-1]) if len(self) else 0.0
+
+    def seek(self, t):
+        """Index of the first record at or after session time t (binary search)."""
+        return int(np.searchsorted(self.times, t, side="left"))
+
+    def __getitem__(self, i):
+        r = self.records[i]
+        return Record(float(r["t"]), int(r["direction"]), COMMANDS[r["command"]],
+                      r["payload"][:r["length"]].tobytes())
+
+    def iter_records(self, start=0.0, end=None, direction=None, command=None):
+        """Records in [start, end), optionally filtered by direction and command name."""
+        lo = self.seek(start)
+        hi = len(self) if end is None else self.seek(end)
+        window = self.records[lo:hi]
+        mask = np.ones(len(window), dtype=bool)
+        if direction is not None:
+            mask &= window["direction"] == direction
+        if command is not None:
+            mask &= window["command"] == COMMAND_CODES[command]
+        for i in np.flatnonzero(mask):
+            yield self[lo + int(i)]
+
+    def play(self, speed=1.0, start=0.0, end=None, direction=None, command=None):
+        """
+        Like iter_records but paced to the recorded timing divided by `speed`
+        (speed=2.0 is twice real time); speed=None replays as fast as possible.
+        """
+        wall_start = None
+        for record in self.iter_records(start, end, direction, command):
+            if speed is not None:
+                if wall_start is None:
+                    wall_start = time.perf_counter() - (record.t - start) / speed
+                delay = wall_start + (record.t - start) / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            yield record
+
+    def close(self):
+        # drop the mapping (numpy unmaps when the last reference goes)
+        self.records = self.times = np.zeros(0, dtype=RECORD_DTYPE)
+
+
+class ReplayPort:
+    ''' Serial port stand-in serving the recorded device frames in order, to drive PacemakerSerial without hardware '''
+
+    def __init__(self, replay, command=None):
+        self._frames = (record.data for record in replay.iter_records(direction=RX, command=command))
+        self.is_open = True
+        self.in_waiting = PAYLOAD_SIZE
+        self.written = []
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        pass
+
+    def read(self, size):
+        return next(self._frames, b"")[:size]
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.is_open = False
+
+
+# Feed the recorded signal frames through the same decoding and egram analysis as a live session
+# on_frame(record, vent, atr, events) is called per frame, e.g. to update a plot
+def replay_signals(replay, analyzer=None, link=None, speed=None, start=0.0, end=None, on_frame=None):
+    from comm.serial_comm import PacemakerSerial  # serial_comm imports this module
+
+    analyzer = analyzer or EgramAnalyzer()
+    link = link or PacemakerSerial()
+    for record in replay.play(speed, start, end, direction=RX, command="signals"):
+        try:
+            vent, atr = link.decode_signals(record.data)
+        except ValueError:
+            continue  # short frame, counted by decode_signals
+        events = analyzer.process_frame(vent, atr)
+        if on_frame:
+            on_frame(record, vent, atr, events)
+    return analyzer
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Inspect or replay a recorded DCM serial session")
+    parser.add_argument("log")
+    parser.add_argument("--replay", action="store_true", help="replay signal frames through the egram analysis")
+    parser.add_argument("--speed", type=float, default=None, help="replay speed (default: as fast as possible)")
+    parser.add_argument("--start", type=float, default=0.0, help="session time to start from (s)")
+    parser.add_argument("--end", type=float, default=None, help="session time to stop at (s)")
+    args = parser.parse_args(argv)
+
+    replay = SessionReplay(args.log)
+    print(f"{args.log}: {len(replay)} records over {replay.duration:.2f} s, "
+          f"recorded {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(replay.start_wall))}")
+    for code, name in enumerate(COMMANDS):
+        tx = int(np.count_nonzero((replay.records["command"] == code) & (replay.records["direction"] == TX)))
+        rx = int(np.count_nonzero((replay.records["command"] == code) & (replay.records["direction"] == RX)))
+        print(f"  {name:<12} {tx:8d} tx {rx:8d} rx")
+
+    if args.replay:
+        totals = {"frames": 0, "markers": 0}
+
+        def count(record, vent, atr, events):
+            totals["frames"] += 1
+            totals["markers"] += len(events)
+
+        begin = time.perf_counter()
+        analyzer = replay_signals(replay, speed=args.speed, start=args.start, end=args.end, on_frame=count)
+        elapsed = time.perf_counter() - begin
+        rate = totals["frames"] / elapsed if elapsed else float("inf")
+        print(f"Replayed {totals['frames']} frames ({analyzer.sample_count} samples) in {elapsed:.3f} s "
+              f"({rate:,.0f} frames/s), {totals['markers']} markers, rolling rate {analyzer.rolling_rate}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
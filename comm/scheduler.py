@@ -0,0 +1,163 @@
+# comm/scheduler.py
+# Priority command scheduler: the one thread that talks to a PacemakerSerial.
+#
+# Commands are queued per priority, PROGRAM > INTERROGATE > STREAM, and the
+# worker always runs the oldest command of the highest priority waiting. Stream
+# polls and interrogations are one device transaction each, so a program command
+# waits for at most the frame already in flight, however many polls are queued.
+#
+# Queues are bounded (max_queued per priority). A full PROGRAM or INTERROGATE
+# queue makes submit() raise SchedulerFull; a full STREAM queue drops its oldest
+# poll instead, a stale poll being worth nothing. submit() returns a
+# concurrent.futures.Future: future.cancel() withdraws a command that has not
+# started, cancel(priority) every queued command of a priority.
+#
+#   scheduler = CommandScheduler(link).start()
+#   ok, message = scheduler.program("AAI", serial_params).result()
+#   scheduler.poll_signals().add_done_callback(...)
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from metrics import metrics
+from metrics.metrics import log_event
+
+LOG = metrics.get_logger("scheduler")
+
+PROGRAM, INTERROGATE, STREAM = 0, 1, 2
+PRIORITY_NAMES = ("program", "interrogate", "stream")
+MAX_QUEUED = (4, 4, 2)
+
+QUEUE_WAIT_MS = [metrics.histogram("dcm_scheduler_wait_ms", "Time commands wait for the serial link", priority=name)
+                 for name in PRIORITY_NAMES]
+REJECTED = [metrics.counter("dcm_scheduler_rejected_total", "Commands refused or dropped on a full queue",
+                            priority=name)
+            for name in PRIORITY_NAMES]
+
+
+class SchedulerFull(Exception):
+    pass
+
+
+class CommandScheduler:
+    def __init__(self, link, max_queued=MAX_QUEUED):
+        self.link = link
+        self.max_queued = tuple(max_queued)
+        self.in_flight = None  # name of the running command
+        self._queues = tuple(deque() for _ in PRIORITY_NAMES)
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    ''' COMMANDS '''
+    def program(self, mode, serial_params):
+        return self.submit(PROGRAM, self.link.program_parameters, mode, serial_params, name="program")
+
+    # Program then read back (two transactions, run back to back as one command);
+    # force: even when the link's state cache says the device already holds these values
+    def verify(self, mode, serial_params, force=False):
+        return self.submit(PROGRAM, self.link.echo_test_parameters, mode, serial_params, force, name="verify")
+
+    # Read back and compare only, see PacemakerSerial.verify_parameters
+    def verify_only(self, mode, serial_params):
+        return self.submit(INTERROGATE, self.link.verify_parameters, mode, serial_params, name="verify_only")
+
+    def interrogate(self):
+        return self.submit(INTERROGATE, self.link.interrogate_device, name="interrogate")
+
+    def poll_signals(self, out=None):
+        return self.submit(STREAM, self.link.get_signals, out, name="signals")
+
+    # Queue fn(*args, **kwargs) to run on the scheduler thread; returns its Future
+    def submit(self, priority, fn, *args, name=None, **kwargs):
+        future = Future()
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("Command scheduler is not running")
+            queue = self._queues[priority]
+            if len(queue) >= self.max_queued[priority]:
+                self._purge(queue)
+            if len(queue) >= self.max_queued[priority]:
+                REJECTED[priority].inc()
+                if priority != STREAM:
+                    raise SchedulerFull(f"{PRIORITY_NAMES[priority]} queue full ({self.max_queued[priority]})")
+                queue.popleft()[0].cancel()
+            queue.append((future, name or getattr(fn, "__name__", "command"), fn, args, kwargs, time.perf_counter()))
+            self._cond.notify()
+        return future
+
+    # Cancel every queued command of a priority (all priorities when None); returns how many.
+    # With an error, the commands fail with it instead, telling their callers why they did not run.
+    def cancel(self, priority=None, error=None):
+        with self._cond:
+            queues = self._queues if priority is None else (self._queues[priority],)
+            cancelled = 0
+            for queue in queues:
+                while queue:
+                    future = queue.popleft()[0]
+                    if error is None:
+                        cancelled += future.cancel()
+                    elif not future.cancelled():
+                        future.set_exception(error)
+                        cancelled += 1
+        return cancelled
+
+    def pending(self):
+        with self._cond:
+            return {name: sum(not entry[0].cancelled() for entry in queue)
+                    for name, queue in zip(PRIORITY_NAMES, self._queues)}
+
+    # Drop cancelled commands still holding a queue slot
+    def _purge(self, queue):
+        live = [entry for entry in queue if not entry[0].cancelled()]
+        queue.clear()
+        queue.extend(live)
+
+    ''' WORKER '''
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._running = True
+                self._thread = threading.Thread(target=self._run, name="serial-scheduler", daemon=True)
+                self._thread.start()
+        return self
+
+    # Cancel what is queued and wait for the command in flight to finish
+    def stop(self):
+        with self._cond:
+            self._running = False
+            thread, self._thread = self._thread, None
+            self.cancel()
+            self._cond.notify()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _next(self):
+        for priority, queue in enumerate(self._queues):
+            while queue:
+                entry = queue.popleft()
+                if entry[0].set_running_or_notify_cancel():
+                    return priority, entry
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                job = self._next()
+                while job is None and self._running:
+                    self._cond.wait()
+                    job = self._next()
+                if job is None:
+                    return
+            priority, (future, name, fn, args, kwargs, queued_at) = job
+            QUEUE_WAIT_MS[priority].observe((time.perf_counter() - queued_at) * 1000.0)
+            self.in_flight = name
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                log_event(LOG, logging.ERROR, "command_failed", command=name, error=str(e))
+                future.set_exception(e)
+            finally:
+                self.in_flight = None
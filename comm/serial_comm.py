@@ -1,8 +1,77 @@
     # comm/serial_comm.py
+#
+# Link negotiation (protocol extension, optional on the device side):
+#   [0x16, 0x33] + 32 zero bytes          capabilities query
+#       -> 88 bytes LINK_LAYOUT: b"DCMX", version, status 0, max samples per channel, max baud rate
+#   [0x16, 0x44] + <I baud, <H samples    switch the link
+#       -> 88 bytes LINK_LAYOUT acknowledging (status 0) at the old baud rate, then the device switches
+# Firmware without the extension answers the query with an ordinary frame (or not at all),
+# which leaves the link at 115200 baud and 88-byte signal frames. After switching, a device
+# that receives no valid packet within LINK_TIMEOUT seconds returns to the default link.
+# With N samples per channel a signals frame is 2 * N little-endian floats: vent [:N], atr [N:].
 import serial
 import serial.tools.list_ports
 import struct
 import time
+import logging
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from params import schema
+from analysis.egram import to_counts, to_counts_into
+from metrics import metrics
+from metrics.metrics import log_event
+
+from .recorder import SessionRecorder, TX, RX
+from .link_monitor import LinkMonitor
+
+LOG = metrics.get_logger("serial")
+
+FRAME_SIZE = 88      # parameter frames, and signals frames of the default link
+REQUEST_SIZE = 34    # every command packet: sync, command, 32-byte payload
+
+DEFAULT_BAUDRATE = 115200
+BAUD_RATES = (115200, 230400, 460800, 921600)
+LEGACY_SAMPLES = 11                        # samples per channel of the 88-byte signals frame
+FRAME_SAMPLE_OPTIONS = (11, 32, 64, 128)   # samples per channel the link can be switched to
+SIGNAL_FRAME_SIZES = {8 * n: n for n in FRAME_SAMPLE_OPTIONS}
+RECORD_PAYLOAD = 8 * FRAME_SAMPLE_OPTIONS[-1]  # recorder payload: the largest frame any negotiation can switch to
+
+LINK_MAGIC = b"DCMX"
+LINK_VERSION = 1
+LINK_LAYOUT = struct.Struct("<4sBBHI")   # magic, version, status, samples per channel, baud rate
+LINK_REQUEST = struct.Struct("<IH")      # baud rate, samples per channel
+LINK_TIMEOUT = 1.0
+BAUD_SETTLE_S = 0.05                     # let both UARTs switch before the next packet
+
+# Automatic reconnect after the port disappears: backoff between attempts, doubling up to the max
+RECONNECT_BACKOFF_S = 0.05
+RECONNECT_MAX_BACKOFF_S = 1.0
+RECONNECT_GIVE_UP_S = 60.0
+RECONNECT_SETTLE_S = 0.05                # instead of connect()'s 1 s, the restore transactions confirm the device
+
+# baudrate, samples per channel, and whether the device negotiated (False: default link)
+LinkParams = namedtuple("LinkParams", ["baudrate", "samples", "extended"])
+
+# Link metrics (created once so the hot path only touches the instrument)
+BYTES_OUT = metrics.counter("dcm_serial_bytes_out_total", "Bytes written to the device")
+BYTES_IN = metrics.counter("dcm_serial_bytes_in_total", "Bytes read from the device")
+FRAMES_DECODED = metrics.counter("dcm_serial_frames_decoded_total", "88-byte frames decoded")
+FRAME_ERRORS = metrics.counter("dcm_serial_frame_errors_total", "Short or malformed frames")
+RESYNCS = metrics.counter("dcm_serial_resyncs_total", "Input buffer flushes to realign with the device")
+RX_QUEUE = metrics.gauge("dcm_serial_rx_queue_bytes", "Bytes waiting in the OS receive buffer")
+TRANSACTION_MS = {
+    command: metrics.histogram("dcm_serial_transaction_ms", "Command round trip time", command=command)
+    for command in ("program", "interrogate", "signals")
+}
+LINK_BAUDRATE = metrics.gauge("dcm_serial_link_baudrate", "Negotiated baud rate")
+LINK_EFFICIENCY = metrics.gauge("dcm_serial_link_payload_efficiency", "Sample bytes per byte on the wire")
+RECOVER_MS = metrics.histogram("dcm_serial_recover_ms", "Link loss to restored session")
+RECONNECT_ATTEMPTS = metrics.counter("dcm_serial_reconnect_attempts_total", "Automatic reconnect attempts")
+PROGRAM_SKIPPED = metrics.counter("dcm_serial_program_skipped_total", "Programming skipped, device already verified")
+VERIFY_CACHED = metrics.counter("dcm_serial_verify_cached_total", "Echo tests answered from the verified state")
 
 
 class PacemakerSerial:
@@ -13,16 +82,69 @@ class PacemakerSerial:
 
     # Commands
     CMD_ECHO = 0x22
+    CMD_LINK_CAPS = 0x33
+    CMD_SET_LINK = 0x44
     CMD_SET_PARAMS = 0x55
 
     def __init__(self):
         self.serial_port = None
         self.connected = False
         self.device_id = None
+        self.recorder = None  # SessionRecorder capturing the raw traffic, see start_recording
+        self.monitor = LinkMonitor()  # link health, set monitor.on_change to follow its state
+        self.port_watcher = None  # comm.port_discovery.PortWatcher whose cached port list to use
+        self.telemetry = None  # comm.telemetry_ring.TelemetryRing every decoded signals frame is published to
+
+        # Automatic reconnect (see AUTO RECONNECT): the port and device connect() opened,
+        # and the last parameters programmed, to restore after the link comes back
+        self.auto_reconnect = True
+        self.on_connection = None  # on_connection(state, info), state "reconnecting"/"connected"/"failed"; must not block
+        self.port_name = None
+        self.device_identity = None
+        self.reconnect_stats = {"losses": 0, "recoveries": 0, "attempts": 0, "last_recover_ms": None,
+                                "last_port_to_restore_ms": None}
+        self._port_settings = (DEFAULT_BAUDRATE, 1)
+        self._programmed = None
+        self._reconnect_thread = None
+        self._stop_reconnect = threading.Event()
+        self._wake_reconnect = threading.Event()
+
+        # Last verified parameter image per device (see LAST-KNOWN STATE)
+        self.state_cache = {}
+
+        self._request = self._packet(self.CMD_ECHO)
+        self._set_link(LinkParams(DEFAULT_BAUDRATE, LEGACY_SAMPLES, False))
+
+    # Switch to new link parameters and size the receive buffers for its frames
+    def _set_link(self, link):
+        self.link = link
+        self.signal_frame_size = 8 * link.samples
+        # Receive buffers reused by every transaction, so steady-state streaming does not allocate per frame
+        self._rx = bytearray(max(FRAME_SIZE, self.signal_frame_size))
+        self._rx_view = memoryview(self._rx)
+        self._rx_frames = {FRAME_SIZE: self._rx_view[:FRAME_SIZE]}
+        self._rx_frames[self.signal_frame_size] = self._rx_view[:self.signal_frame_size]
+        self._rx_signals = self._rx_frames[self.signal_frame_size]
+        self._rx_samples = np.frombuffer(self._rx, dtype='<f4', count=2 * link.samples)
+        self._work = np.empty(2 * link.samples, dtype=np.float64)
+        self._nan = np.empty(2 * link.samples, dtype=bool)
+        self._counts = np.empty(2 * link.samples, dtype=np.int16)
+        self._counts_vent, self._counts_atr = self._counts[:link.samples], self._counts[link.samples:]
+        LINK_BAUDRATE.set(link.baudrate)
+        LINK_EFFICIENCY.set(self.link_info()["payload_efficiency"])
+
+    def _packet(self, command, payload=b""):
+        return bytes([self.SYNC_BYTE, command]) + payload.ljust(REQUEST_SIZE - 2, b"\0")
 
     ''' PORT FUNCTIONS '''
+    # Port entries (device, description, serial_number), from the watcher's cache once it has enumerated
+    def _comports(self):
+        if self.port_watcher is not None and self.port_watcher.ready.is_set():
+            return self.port_watcher.port_infos
+        return serial.tools.list_ports.comports()
+
     def list_ports(self):
-        ports = serial.tools.list_ports.comports()
+        ports = self._comports()
         return [(p.device, p.description) for p in ports]
 
     def find_jlink_port(self):
@@ -31,91 +153,342 @@ class PacemakerSerial:
                 return dev
         return None
 
-    def connect(self, port, baudrate=115200, timeout=1):
+    def _open_port(self, port, baudrate, timeout):
+        return serial.Serial(
+            port=port,
+            baudrate=baudrate,
+            timeout=timeout,
+            bytesize=serial.EIGHTBITS,
+            parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE,
+        )
+
+    # USB serial number of a port (stable across re-plugs, unlike the device path)
+    def _port_identity(self, port):
+        for p in self._comports():
+            if p.device == port:
+                return p.serial_number or None
+        return None
+
+    def connect(self, port, baudrate=DEFAULT_BAUDRATE, timeout=1):
         try:
-            self.serial_port = serial.Serial(
-                port=port,
-                baudrate=baudrate,
-                timeout=timeout,
-                bytesize=serial.EIGHTBITS,
-                parity=serial.PARITY_NONE,
-                stopbits=serial.STOPBITS_ONE,
-            )
+            self._cancel_reconnect()
+            self.serial_port = self._open_port(port, baudrate, timeout)
             time.sleep(1)
+            self._set_link(LinkParams(baudrate, LEGACY_SAMPLES, False))
+            self.monitor.reset()
+            self.port_name = port
+            self.device_identity = self._port_identity(port)
+            self._port_settings = (baudrate, timeout)
+            self._programmed = None
+            self.invalidate_state_cache()
             self.connected =  self.serial_port and self.serial_port.is_open
             return self.connected, "Connected"
         except Exception as e:
             return False, str(e)
 
     def disconnect(self):
+        self._cancel_reconnect()
+        self.port_name = None
+        self.stop_recording()
         if self.serial_port and self.serial_port.is_open:
             self.serial_port.close()
         self.serial_port = None
         self.connected = False
+        self._set_link(LinkParams(DEFAULT_BAUDRATE, LEGACY_SAMPLES, False))
+
+    ''' AUTO RECONNECT '''
+    # A transaction failed with a port error: reconnect in the background unless already doing so
+    def _link_failed(self, error):
+        self.invalidate_state_cache()  # the device may have reset
+        if not self.auto_reconnect or self.port_name is None:
+            return
+        if self._reconnect_thread is not None and self._reconnect_thread.is_alive():
+            return
+        lost_at = time.perf_counter()
+        self.connected = False
+        self.reconnect_stats["losses"] += 1
+        log_event(LOG, logging.WARNING, "link_lost", port=self.port_name, error=str(error))
+        self._stop_reconnect.clear()
+        self._wake_reconnect.clear()
+        self._reconnect_thread = threading.Thread(target=self._reconnect_loop, args=(lost_at, self.link),
+                                                  name="serial-reconnect", daemon=True)
+        self._reconnect_thread.start()
+        self._notify("reconnecting", {"port": self.port_name, "error": str(error)})
+
+    def _cancel_reconnect(self):
+        self._stop_reconnect.set()
+        self._wake_reconnect.set()
+        thread = self._reconnect_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self._reconnect_thread = None
+
+    # Wake a waiting reconnect attempt early, e.g. when a port appears
+    def notify_port_change(self):
+        self._wake_reconnect.set()
+
+    def _notify(self, state, info):
+        if self.on_connection:
+            self.on_connection(state, info)
+
+    # The port of the same device: matched by USB serial number, else the same path
+    def _find_device(self):
+        ports = self._comports()
+        if self.device_identity:
+            for p in ports:
+                if p.serial_number == self.device_identity:
+                    return p.device
+            return None
+        return self.port_name if any(p.device == self.port_name for p in ports) else None
+
+    def _reconnect_loop(self, lost_at, previous_link):
+        delay = RECONNECT_BACKOFF_S
+        baudrate, timeout = self._port_settings
+        while not self._stop_reconnect.is_set() and time.perf_counter() - lost_at < RECONNECT_GIVE_UP_S:
+            self.reconnect_stats["attempts"] += 1
+            RECONNECT_ATTEMPTS.inc()
+            try:
+                port = self._find_device()
+                if port is not None:
+                    found_at = time.perf_counter()
+                    if self.serial_port is not None and self.serial_port.is_open:
+                        self.serial_port.close()
+                    self.serial_port = self._open_port(port, baudrate, timeout)
+                    time.sleep(RECONNECT_SETTLE_S)
+                    self._set_link(LinkParams(baudrate, LEGACY_SAMPLES, False))
+                    ok, message = self._restore(previous_link)
+                    if ok:
+                        done = time.perf_counter()
+                        self.port_name = port
+                        self.connected = True
+                        self.reconnect_stats["recoveries"] += 1
+                        self.reconnect_stats["last_recover_ms"] = round((done - lost_at) * 1000, 1)
+                        self.reconnect_stats["last_port_to_restore_ms"] = round((done - found_at) * 1000, 1)
+                        RECOVER_MS.observe((done - lost_at) * 1000)
+                        log_event(LOG, logging.INFO, "link_restored", port=port, **self.reconnect_stats)
+                        self._notify("connected", dict(self.reconnect_stats, port=port, message=message))
+                        return
+                    log_event(LOG, logging.WARNING, "link_restore_failed", port=port, error=message)
+            except (serial.SerialException, OSError) as e:
+                log_event(LOG, logging.DEBUG, "reconnect_attempt_failed", error=str(e))
+            self._wake_reconnect.wait(delay)
+            self._wake_reconnect.clear()
+            delay = min(delay * 2, RECONNECT_MAX_BACKOFF_S)
+
+        if not self._stop_reconnect.is_set():
+            # disconnected for good: calls fail with "Device not connected" instead of reconnecting again
+            port = self.port_name
+            if self.serial_port is not None and self.serial_port.is_open:
+                self.serial_port.close()
+            self.serial_port = None
+            self.port_name = None
+            log_event(LOG, logging.ERROR, "reconnect_gave_up", port=port, seconds=RECONNECT_GIVE_UP_S)
+            self._notify("failed", {"port": port})
+
+    # Bring a reopened port back to the session's state: the negotiated link, the last
+    # programmed parameters (re-programmed and read back), and signal mode if it was streaming
+    def _restore(self, previous_link):
+        if previous_link.extended:
+            # same device: its capabilities are known, and the readback below confirms the new link
+            try:
+                ok, message = self._switch_link(previous_link.baudrate, previous_link.samples, confirm=False)
+            except (serial.SerialException, OSError) as e:
+                ok, message = False, str(e)
+            if not ok:
+                return False, message
+        if self._programmed is None:
+            return True, "Reconnected"
+
+        mode, params = programmed = self._programmed
+        try:
+            ok, message = self.program_parameters(mode, dict(params, response_type=1))
+            if not ok:
+                return False, message
+            ok, readback = self.interrogate_device()
+            if not ok:
+                return False, readback
+            differences = self._compare_readback(mode, params, readback)
+            if differences:
+                return False, f"{len(differences)} parameters differ after reconnect"
+            if params.get("response_type", 0) == 0:
+                ok, message = self.program_parameters(mode, params)  # resume the signal stream
+                if not ok:
+                    return False, message
+            return True, "Reconnected, parameters verified"
+        finally:
+            self._programmed = programmed
+
+    ''' LAST-KNOWN STATE '''
+    # Entries are keyed by the device's USB serial number (else its port) and hold the encoded
+    # payload and the readback of the last programming confirmed by reading it back. Any write,
+    # connect, link loss or failed verification drops the entry of the connected device.
+    def _state_key(self):
+        return self.device_identity or self.port_name
+
+    def cached_state(self):
+        return self.state_cache.get(self._state_key())
+
+    def _is_verified(self, payload):
+        cached = self.cached_state()
+        return cached is not None and cached["payload"] == payload
+
+    def _remember_verified(self, payload, readback):
+        self.state_cache[self._state_key()] = {"payload": payload, "readback": readback}
+
+    # Drop the connected device's entry, or every entry (e.g. when another device was plugged in)
+    def invalidate_state_cache(self, all_devices=False):
+        if all_devices:
+            self.state_cache.clear()
+        else:
+            self.state_cache.pop(self._state_key(), None)
+
+    ''' SESSION RECORDING '''
+    # Records are sized for the largest negotiable frame, so a recording outlives any later negotiate_link
+    def start_recording(self, path):
+        self.stop_recording()
+        self.recorder = SessionRecorder(path, payload_size=RECORD_PAYLOAD)
+        return self.recorder
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    ''' LINK NEGOTIATION '''
+    # LINK_LAYOUT fields of a link reply, None when the device does not speak the extension
+    def _link_reply(self, data):
+        if len(data) < LINK_LAYOUT.size:
+            return None
+        magic, version, status, samples, baudrate = LINK_LAYOUT.unpack_from(data)
+        if magic != LINK_MAGIC:
+            return None
+        return version, status, samples, baudrate
+
+    # Ask the device for its capabilities and switch to the fastest link both sides support
+    # (capped by max_baudrate/max_samples); old firmware keeps the default 88-byte link
+    def negotiate_link(self, max_baudrate=None, max_samples=None):
+        try:
+            caps = self._link_reply(self._transact("link", self._packet(self.CMD_LINK_CAPS)))
+            if caps is None:
+                self._set_link(LinkParams(self.link.baudrate, LEGACY_SAMPLES, False))
+                log_event(LOG, logging.INFO, "link_legacy", baudrate=self.link.baudrate)
+                return True, "Device does not support link negotiation, using 88-byte frames"
+
+            _, _, device_samples, device_baudrate = caps
+            max_baudrate = min(device_baudrate, max_baudrate or device_baudrate)
+            max_samples = min(device_samples, max_samples or device_samples)
+            baudrate = max([b for b in BAUD_RATES if b <= max_baudrate], default=self.link.baudrate)
+            samples = max([n for n in FRAME_SAMPLE_OPTIONS if n <= max_samples], default=LEGACY_SAMPLES)
+
+            return self._switch_link(baudrate, samples)
+        except Exception as e:
+            log_event(LOG, logging.ERROR, "link_negotiation_failed", error=str(e))
+            return False, str(e)
+
+    # Switch to a link the device supports; confirm=False leaves the check to the next transaction
+    def _switch_link(self, baudrate, samples, confirm=True):
+        request = self._packet(self.CMD_SET_LINK, LINK_REQUEST.pack(baudrate, samples))
+        ack = self._link_reply(self._transact("link", request))
+        if ack is None or ack[1] != 0 or ack[2:] != (samples, baudrate):
+            return False, f"Device rejected {baudrate} baud with {samples} samples per frame"
+
+        previous = self.link.baudrate
+        if baudrate != previous:
+            self.serial_port.baudrate = baudrate
+            time.sleep(BAUD_SETTLE_S)
+        # confirm the device answers on the new link
+        if confirm and self._link_reply(self._transact("link", self._packet(self.CMD_LINK_CAPS))) is None:
+            self.serial_port.baudrate = previous
+            time.sleep(LINK_TIMEOUT)  # the device falls back to the default link on its own
+            self._set_link(LinkParams(previous, LEGACY_SAMPLES, False))
+            log_event(LOG, logging.WARNING, "link_switch_failed", baudrate=baudrate, samples=samples)
+            return False, f"No response at {baudrate} baud, staying at {previous} baud with 88-byte frames"
+
+        self._set_link(LinkParams(baudrate, samples, True))
+        log_event(LOG, logging.INFO, "link_negotiated", **self.link_info())
+        return True, f"{baudrate} baud, {samples} samples per channel per frame"
+
+    # Negotiated link parameters; efficiency is sample bytes per byte on the wire for one signals transaction
+    def link_info(self):
+        wire_bytes = REQUEST_SIZE + self.signal_frame_size
+        return {
+            "baudrate": self.link.baudrate,
+            "samples_per_channel": self.link.samples,
+            "extended": self.link.extended,
+            "request_bytes": REQUEST_SIZE,
+            "frame_bytes": self.signal_frame_size,
+            "payload_efficiency": round(self.signal_frame_size / wire_bytes, 3),
+            # upper bound from the wire alone (8N1: 10 bits per byte), before device and polling delays
+            "max_samples_per_s": round(self.link.baudrate / 10 / wire_bytes * self.link.samples, 1),
+        }
 
     ''' ECHO TEST '''
-    def echo_test_parameters(self, mode, params):
+    # force: program and read back even when the device is known to hold these parameters
+    def echo_test_parameters(self, mode, params, force=False):
         try:
+            payload = self._encode_parameters(mode, params)
+            if not force and self._is_verified(payload):
+                VERIFY_CACHED.inc()
+                return True, "All parameters match! (unchanged since last verification)", {}
             # Step 1: Program parameters
-            print("  → Programming parameters...")
-            prog_ok, prog_msg = self.program_parameters(mode, params)
+            log_event(LOG, logging.INFO, "echo_test_program", mode=mode)
+            prog_ok, prog_msg = self.program_parameters(mode, params, force=True)
             if not prog_ok:
                 return False, f"Programming failed: {prog_msg}", {}
             # Step 2: Wait a bit for device to process
             time.sleep(0.3)
             self.serial_port.reset_input_buffer()
+            RESYNCS.inc()
             time.sleep(0.1)
             # Step 3: Interrogate device
-            print("  → Reading back parameters...")
+            log_event(LOG, logging.INFO, "echo_test_interrogate", mode=mode)
             inter_ok, result = self.interrogate_device()
             if not inter_ok:
                 return False, f"Interrogate failed: {result}", {}
             # Step 4: Compare parameters
-            print("  → Comparing parameters...")
-            differences = {}
-            readback = result
-            
-            # Map parameter names
-            comparisons = {
-                'mode': (self._mode_to_code(mode), readback.get('mode')),
-                'ARP': (int(params['ARP']), readback.get('ARP')),
-                'VRP': (int(params['VRP']), readback.get('VRP')),
-                'ATR_PULSE_AMP': (float(params['ATR_PULSE_AMP']), readback.get('ATR_PULSE_AMP')),
-                'VENT_PULSE_AMP': (float(params['VENT_PULSE_AMP']), readback.get('VENT_PULSE_AMP')),
-                'ATR_PULSE_WIDTH': (int(params['ATR_PULSE_WIDTH']), readback.get('ATR_PULSE_WIDTH')),
-                'VENT_PULSE_WIDTH': (int(params['VENT_PULSE_WIDTH']), readback.get('VENT_PULSE_WIDTH')),
-                'ATR_CMP_REF_PWM': (int(params['ATR_CMP_REF_PWM']), readback.get('ATR_CMP_REF_PWM')),
-                'VENT_CMP_REF_PWM': (int(params['VENT_CMP_REF_PWM']), readback.get('VENT_CMP_REF_PWM')),
-                'REACTION_TIME': (int(params['REACTION_TIME']), readback.get('REACTION_TIME')),
-                'RECOVERY_TIME': (int(params['RECOVERY_TIME']), readback.get('RECOVERY_TIME')),
-                'FIXED_AV_DELAY': (int(params['FIXED_AV_DELAY']), readback.get('FIXED_AV_DELAY')),
-                'RESPONSE_FACTOR': (int(params['RESPONSE_FACTOR']), readback.get('RESPONSE_FACTOR')),
-                'ACTIVITY_THRESHOLD': (int(params['ACTIVITY_THRESHOLD']), readback.get('ACTIVITY_THRESHOLD')),
-                'LRL': (int(params['LRL']), readback.get('LRL')),
-                'URL': (int(params['URL']), readback.get('URL')),
-                'MSR': (int(params['MSR']), readback.get('MSR')),
-            }
-            
-            # Check each parameter
-            all_match = True
-            for param_name, (sent, received) in comparisons.items():
-                # use tolerance comparison for floats
-                if isinstance(sent, float):
-                    tolerance = 0.01  # 1% tolerance for floating point
-                    if abs(sent - received) > tolerance:
-                        differences[param_name] = {'sent': sent, 'received': received}
-                        all_match = False
-                else:
-                    if sent != received:
-                        differences[param_name] = {'sent': sent, 'received': received}
-                        all_match = False
-            if all_match:
+            log_event(LOG, logging.INFO, "echo_test_compare", mode=mode)
+            differences = self._compare_readback(mode, params, result)
+            if not differences:
+                self._remember_verified(payload, result)
                 return True, "All parameters match!", {}
             else:
                 return False, f"Found {len(differences)} mismatches", differences
         except Exception as e:
             return False, f"Echo test error: {str(e)}", {}
 
+    # Verify only: read back and compare without programming (one transaction, no settle time)
+    def verify_parameters(self, mode, params):
+        try:
+            payload = self._encode_parameters(mode, params)
+            ok, result = self.interrogate_device()
+            if not ok:
+                return False, f"Interrogate failed: {result}", {}
+            differences = self._compare_readback(mode, params, result)
+            if differences:
+                self.invalidate_state_cache()
+                return False, f"Found {len(differences)} mismatches", differences
+            self._remember_verified(payload, result)
+            return True, "All parameters match!", {}
+        except Exception as e:
+            return False, f"Verify error: {str(e)}", {}
+
+    # Programmed values the interrogated readback does not match: {field: {"sent", "received"}}
+    def _compare_readback(self, mode, params, readback):
+        # Map parameter names (sent values as the device stores them, float32 for amplitudes)
+        comparisons = {'mode': (self._mode_to_code(mode), readback.get('mode'))}
+        for field in schema.SERIAL_TYPES:
+            if field in ('response_type', 'mode'):
+                continue
+            comparisons[field] = (schema.wire_value(field, params[field]), readback.get(field))
+
+        # Check each parameter (exact, the wire values round-trip unchanged)
+        differences = {}
+        for param_name, (sent, received) in comparisons.items():
+            if sent != received:
+                differences[param_name] = {'sent': sent, 'received': received}
+        return differences
+
     '''
     SET PARAMETERS (Python -> Simulink)
     Payload = 31 bytes, mapped according to your final spec
@@ -180,26 +553,40 @@ class PacemakerSerial:
 
         return bytes(buf)
 
-    def program_parameters(self, mode, parameters):
+    # Skipped when the payload is byte-identical to the device's verified state, unless force
+    def program_parameters(self, mode, parameters, force=False):
+        if self._reconnecting_elsewhere():
+            return False, "Reconnecting to the device"
         try:
             payload = self._encode_parameters(mode, parameters)
-            packet = bytearray([self.SYNC_BYTE, self.CMD_SET_PARAMS])  # Use bytearray
-            packet.extend(payload)
-            print("Packet length:", len(packet))
-            print("Packet:", packet)
-            self.serial_port.write(packet)
-            self.serial_port.flush()
-
-            # add delay for Simulink to process
-            time.sleep(0.1)
+            if not force and self._is_verified(payload):
+                PROGRAM_SKIPPED.inc()
+                self._programmed = (mode, dict(parameters))
+                return True, "Parameters already programmed (verified)"
+            self.invalidate_state_cache()
+            with TRANSACTION_MS["program"].time():
+                packet = bytearray([self.SYNC_BYTE, self.CMD_SET_PARAMS])  # Use bytearray
+                packet.extend(payload)
+                if LOG.isEnabledFor(logging.DEBUG):
+                    log_event(LOG, logging.DEBUG, "tx", command="program", length=len(packet), packet=packet.hex())
+                self.serial_port.write(packet)
+                self.serial_port.flush()
+                BYTES_OUT.inc(len(packet))
+                if self.recorder:
+                    self.recorder.record(TX, "program", packet)
+
+                # add delay for Simulink to process
+                time.sleep(0.1)
+            self._programmed = (mode, dict(parameters))
     
             # resp = self.serial_port.read(88)
-            # print("Data Length: ", len(resp))
-            # print("Data: ", resp)
             # if len(resp) != 88:
             #     return False, "Incomplete data"
             return True, "Parameters accepted"
         except Exception as e:
+            log_event(LOG, logging.ERROR, "program_failed", error=str(e))
+            if isinstance(e, (serial.SerialException, OSError)):
+                self._link_failed(e)
             return False, str(e)
 
     ''' INTERROGATE DEVICE (Simulink -> Python, 88-byte always) '''
@@ -254,62 +641,113 @@ class PacemakerSerial:
 
     def interrogate_device(self):
         try:
-            # Clear any leftover data in buffer         
-            self.serial_port.reset_input_buffer()         
-            time.sleep(0.05)  # add delay after clearing
-
-            # Request 88-byte parameter packet
-            pkt = bytearray([self.SYNC_BYTE, self.CMD_ECHO])
-            pkt.extend([0x00] * 32)
-            print("Packet: ", pkt)
-            self.serial_port.write(pkt)
-            self.serial_port.flush()
-
-            time.sleep(0.1)
-
-            data = self.serial_port.read(88)
-            print("Data Length: ", len(data))
-            print("Data: ", data)
-            if len(data) != 88:
+            with TRANSACTION_MS["interrogate"].time():
+                data = self._transact("interrogate")
+            if len(data) != FRAME_SIZE:
                 return False, "Incomplete data"
+            FRAMES_DECODED.inc()
             return True, self._decode_parameters(data)
         except Exception as e:
+            log_event(LOG, logging.ERROR, "interrogate_failed", error=str(e))
             return False, str(e)
 
-    ''' READ ATR/VENT SIGNALS (EGM) '''
-    def decode_signals(self, data88):
-        if len(data88) != 88:
-            raise ValueError(f"Expected 88-byte signal packet, got {len(data88)}")
-        vent = struct.unpack('<11f', data88[:44])
-        atr = struct.unpack('<11f', data88[44:88])
-        return vent, atr
-
-    def get_signals(self):
+    # Read one response into the receive buffer; returns a memoryview of it that the next read overwrites
+    def _read_frame(self, size=FRAME_SIZE):
+        view = self._rx_frames[size]
+        readinto = getattr(self.serial_port, "readinto", None)
+        if readinto is not None:
+            n = readinto(view) or 0
+        else:
+            data = self.serial_port.read(size)
+            n = len(data)
+            view[:n] = data
+        return view if n == size else view[:n]
+
+    # Send a request (the echo request by default) and read the `size`-byte response
+    def _transact(self, command, packet=None, size=FRAME_SIZE):
+        if self.serial_port is None or not self.connected and self._reconnecting_elsewhere():
+            raise ConnectionError("Device not connected" if self.serial_port is None else "Reconnecting to the device")
+        start = time.perf_counter()
         try:
-            # Clear any leftover data in buffer         
-            self.serial_port.reset_input_buffer()         
-            time.sleep(0.05)  # add delay after clearing
-
-            pkt = bytearray([self.SYNC_BYTE, self.CMD_ECHO])
-            pkt.extend([0x00] * 32)
-            self.serial_port.write(pkt)
-            self.serial_port.flush()
-
-            time.sleep(0.1)
+            data = self._exchange(command, packet or self._request, size)
+        except Exception as e:
+            self.monitor.record(False, (time.perf_counter() - start) * 1000.0, stream=command == "signals")
+            if isinstance(e, (serial.SerialException, OSError)):
+                self._link_failed(e)
+            raise
+        self.monitor.record(len(data) == size, (time.perf_counter() - start) * 1000.0, stream=command == "signals")
+        return data
+
+    # True on any thread but the reconnect thread while a reconnect is under way
+    def _reconnecting_elsewhere(self):
+        thread = self._reconnect_thread
+        return thread is not None and thread.is_alive() and thread is not threading.current_thread()
+
+    def _exchange(self, command, pkt, size):
+        # Clear any leftover data in buffer         
+        self.serial_port.reset_input_buffer()         
+        RESYNCS.inc()
+        time.sleep(0.05)  # add delay after clearing
+
+        if LOG.isEnabledFor(logging.DEBUG):
+            log_event(LOG, logging.DEBUG, "tx", command=command, length=len(pkt), packet=pkt.hex())
+        self.serial_port.write(pkt)
+        self.serial_port.flush()
+        BYTES_OUT.inc(len(pkt))
+        if self.recorder:
+            self.recorder.record(TX, command, pkt)
+
+        # no fixed wait for the device: the read blocks until the frame is in (or the port timeout)
+        if metrics.REGISTRY.enabled:
+            RX_QUEUE.set(self.serial_port.in_waiting)
+        data = self._read_frame(size)
+        BYTES_IN.inc(len(data))
+        if self.recorder:
+            self.recorder.record(RX, command, data)
+        if LOG.isEnabledFor(logging.DEBUG):
+            log_event(LOG, logging.DEBUG, "rx", command=command, length=len(data), data=data.hex())
+        if len(data) != size:
+            FRAME_ERRORS.inc()
+        return data
 
-            resp = self.serial_port.read(88)
-            print("Signals: ", resp)
-            if len(resp) != 88:
+    ''' READ ATR/VENT SIGNALS (EGM) '''
+    # Decode a signals frame of any negotiated size (recorded sessions may use another link)
+    # out=(vent, atr): int16 arrays to decode into instead of returning new arrays
+    def decode_signals(self, data, out=None):
+        if len(data) not in SIGNAL_FRAME_SIZES:
+            FRAME_ERRORS.inc()
+            raise ValueError(f"Expected {self.signal_frame_size}-byte signal packet, got {len(data)}")
+        # little-endian float mV samples -> int16 counts (EGRAM_SENSITIVITY mV per count)
+        samples = self._rx_samples if data is self._rx_signals else np.frombuffer(data, dtype='<f4')
+        FRAMES_DECODED.inc()
+        if out is None or len(data) != self.signal_frame_size:
+            counts = to_counts(samples)
+            n = len(counts) // 2
+            if out is None:
+                return counts[:n], counts[n:]
+            np.copyto(out[0], counts[:n])
+            np.copyto(out[1], counts[n:])
+            return out
+        vent, atr = out
+        to_counts_into(samples, self._counts, self._work, self._nan)
+        np.copyto(vent, self._counts_vent)
+        np.copyto(atr, self._counts_atr)
+        return out
+
+    def get_signals(self, out=None):
+        try:
+            with TRANSACTION_MS["signals"].time():
+                resp = self._transact("signals", size=self.signal_frame_size)
+            if len(resp) != self.signal_frame_size:
                 return False, ([], [])
-            vent, atr = self.decode_signals(resp)
+            vent, atr = self.decode_signals(resp, out)
+            if self.telemetry is not None:
+                self.telemetry.publish(vent, atr)
             return True, (vent, atr)
         except Exception as e:
+            log_event(LOG, logging.ERROR, "get_signals_failed", error=str(e))
             return False, str(e)
 
     ''' MODE CODE MAPPING '''
     def _mode_to_code(self, mode):
-        mapping = {
-            "AOO": 1, "VOO": 2, "AAI": 3, "VVI": 4,
-            "AOOR": 5, "VOOR": 6, "AAIR": 7, "VVIR": 8
-        }
-        return mapping.get(mode, 0)
\ No newline at end of file
+        return schema.mode_code(mode)
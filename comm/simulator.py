@@ -0,0 +1,140 @@
+# comm/simulator.py
+# Software stand-in for the pacemaker firmware, used in place of a serial port.
+#
+# SimulatedPacemaker implements the device side of the protocol in serial_comm:
+# programming, parameter echo (response_type 1), egram signal frames
+# (response_type 0) and, unless created with extended=False like the current
+# Simulink model, link negotiation. The baudrate attribute is the host side of
+# the port (set by PacemakerSerial, as on a pyserial Serial); while it differs
+# from the device's rate every byte is lost in both directions. unplug() makes
+# every further call fail like a pyserial port whose USB device went away.
+#
+#   link = PacemakerSerial()
+#   link.serial_port = SimulatedPacemaker()
+#   link.connected = True
+#   link.negotiate_link()
+import struct
+
+import numpy as np
+import serial
+
+from .serial_comm import (PacemakerSerial, FRAME_SIZE, REQUEST_SIZE, DEFAULT_BAUDRATE, BAUD_RATES, LEGACY_SAMPLES,
+                          FRAME_SAMPLE_OPTIONS, LINK_MAGIC, LINK_VERSION, LINK_LAYOUT, LINK_REQUEST)
+
+# serial field order of the program packet payload and of the 88-byte echo frame
+PROGRAM_LAYOUT = struct.Struct("<BBHHffHHxBBHHxBBBBBB")
+PROGRAM_FIELDS = ("response_type", "mode", "ARP", "VRP", "ATR_PULSE_AMP", "VENT_PULSE_AMP", "ATR_PULSE_WIDTH",
+                  "VENT_PULSE_WIDTH", "ATR_CMP_REF_PWM", "VENT_CMP_REF_PWM", "REACTION_TIME", "RECOVERY_TIME",
+                  "FIXED_AV_DELAY", "RESPONSE_FACTOR", "ACTIVITY_THRESHOLD", "LRL", "URL", "MSR")
+ECHO_LAYOUT = struct.Struct("<BBffHHBHHBBBBHHBBB")
+ECHO_FIELDS = ("response_type", "mode", "ATR_PULSE_AMP", "VENT_PULSE_AMP", "ATR_PULSE_WIDTH", "VENT_PULSE_WIDTH",
+               "LRL", "ARP", "VRP", "ATR_CMP_REF_PWM", "VENT_CMP_REF_PWM", "MSR", "RESPONSE_FACTOR",
+               "REACTION_TIME", "RECOVERY_TIME", "ACTIVITY_THRESHOLD", "URL", "FIXED_AV_DELAY")
+
+SAMPLE_RATE = 1000  # Hz
+PACE_INTERVAL = 1000  # samples between paced beats (60 bpm)
+
+
+class SimulatedPacemaker:
+    ''' Serial port double that answers like the pacemaker firmware '''
+
+    def __init__(self, extended=True, max_baudrate=BAUD_RATES[-1], max_samples=FRAME_SAMPLE_OPTIONS[-1], port="SIM0"):
+        self.port = port
+        self.extended = extended
+        self.max_baudrate = max_baudrate
+        self.max_samples = max_samples
+        self.is_open = True
+        self.baudrate = DEFAULT_BAUDRATE         # host side
+        self.device_baudrate = DEFAULT_BAUDRATE  # device side
+        self.samples = LEGACY_SAMPLES
+        self.programmed = dict.fromkeys(PROGRAM_FIELDS, 0)
+        self.programmed["response_type"] = 1
+        self.sample_count = 0
+        self._pending = b""
+        self._switch = None  # link to switch to once the acknowledgement has been read
+        self.unplugged = False
+
+    def unplug(self):
+        self.unplugged = True
+
+    def _check(self):
+        if self.unplugged:
+            raise serial.SerialException("device reports readiness to read but returned no data "
+                                         "(device disconnected or multiple access on port?)")
+
+    @property
+    def in_waiting(self):
+        return len(self._pending)
+
+    def write(self, data):
+        self._check()
+        data = bytes(data)
+        if self.baudrate != self.device_baudrate or len(data) != REQUEST_SIZE or data[0] != PacemakerSerial.SYNC_BYTE:
+            return len(data)  # garbled or not a packet: ignored, like the firmware
+        command, payload = data[1], data[2:]
+        if command == PacemakerSerial.CMD_SET_PARAMS:
+            self.programmed = dict(zip(PROGRAM_FIELDS, PROGRAM_LAYOUT.unpack(payload)))
+        elif command == PacemakerSerial.CMD_LINK_CAPS and self.extended:
+            self._pending = self._link_frame(0, self.max_samples, self.max_baudrate)
+        elif command == PacemakerSerial.CMD_SET_LINK and self.extended:
+            baudrate, samples = LINK_REQUEST.unpack_from(payload)
+            if baudrate in BAUD_RATES and baudrate <= self.max_baudrate and \
+                    samples in FRAME_SAMPLE_OPTIONS and samples <= self.max_samples:
+                self._pending = self._link_frame(0, samples, baudrate)
+                self._switch = (baudrate, samples)
+            else:
+                self._pending = self._link_frame(1, self.samples, self.device_baudrate)
+        else:
+            # the echo request, and any unknown command on firmware without the extension
+            self._pending = self._signals() if self.programmed["response_type"] == 0 else self._echo()
+        return len(data)
+
+    def read(self, size):
+        self._check()
+        if self.baudrate != self.device_baudrate:
+            return b""
+        data, self._pending = self._pending[:size], self._pending[size:]
+        if self._switch and not self._pending:
+            self.device_baudrate, self.samples = self._switch
+            self._switch = None
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self._check()
+        self._pending = b""
+
+    def close(self):
+        self.is_open = False
+
+    ''' FRAMES '''
+    def _link_frame(self, status, samples, baudrate):
+        return LINK_LAYOUT.pack(LINK_MAGIC, LINK_VERSION, status, samples, baudrate).ljust(FRAME_SIZE, b"\0")
+
+    def _echo(self):
+        return ECHO_LAYOUT.pack(*(self.programmed[f] for f in ECHO_FIELDS)).ljust(FRAME_SIZE, b"\0")
+
+    # Next `samples` samples of both channels: an atrial then a ventricular paced beat every PACE_INTERVAL
+    def _signals(self):
+        n = self.samples
+        t = self.sample_count + np.arange(n)
+        self.sample_count += n
+        phase = t % PACE_INTERVAL
+        atr = 0.2 * np.sin(2 * np.pi * t / SAMPLE_RATE) + np.where(phase == 0, 3.0, 0.0)
+        vent = 0.3 * np.sin(2 * np.pi * t / SAMPLE_RATE) + np.where(phase == 150, 4.0, 0.0)
+        return np.concatenate([vent, atr]).astype("<f4").tobytes()
+
+
+# Stand-in for PacemakerSerial._open_port: every port is a fresh simulated device
+# (picklable, e.g. DeviceProcess(port_opener=open_port))
+def open_port(port, baudrate=DEFAULT_BAUDRATE, timeout=1):
+    device = SimulatedPacemaker(port=port)
+    device.baudrate = baudrate
+    return device
@@ -0,0 +1,187 @@
+# comm/stream_queue.py
+# Bounded egram frame queues between the telemetry producer and its consumers.
+#
+# Every consumer gets its own StreamQueue with a fixed capacity (frames are kept
+# in preallocated int16 storage, so memory is maxsize * 2 * max_samples * 2 bytes
+# however long the session) and a policy for when it falls behind:
+#   block        put() waits for room (up to block_timeout): lossless, slows the producer
+#   drop_oldest  the oldest queued frame makes room: the consumer sees the freshest data
+#   drop_newest  the incoming frame is dropped: the queued backlog stays contiguous
+#   decimate     every other queued frame is dropped and only every Nth new frame is
+#                taken (N doubling while the queue keeps filling, halving as it drains)
+# Dropped frames are counted per queue and in dcm_stream_dropped_total{policy, consumer}.
+#
+# The session recorder needs no queue: it writes every frame inline, in the
+# transaction that read it (see PacemakerSerial._exchange), so it is lossless by
+# design. Consumers in other processes read the telemetry ring with their own
+# RingReader instead (see comm.telemetry_ring).
+#
+#   display = StreamQueue("display", maxsize=32, policy=DROP_OLDEST)
+#   display.put(vent, atr, seq)
+#   for seq, vent, atr in display.drain(): ...
+import time
+import logging
+import threading
+
+import numpy as np
+
+from metrics import metrics
+from metrics.metrics import log_event
+
+from .serial_comm import FRAME_SAMPLE_OPTIONS
+
+LOG = metrics.get_logger("stream_queue")
+
+BLOCK, DROP_OLDEST, DROP_NEWEST, DECIMATE = "block", "drop_oldest", "drop_newest", "decimate"
+POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST, DECIMATE)
+MAX_SAMPLES = FRAME_SAMPLE_OPTIONS[-1]
+
+
+class StreamClosed(Exception):
+    pass
+
+
+class StreamQueue:
+    def __init__(self, consumer, maxsize=256, policy=DROP_OLDEST, max_samples=MAX_SAMPLES, block_timeout=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown stream policy {policy!r}, expected one of {POLICIES}")
+        if maxsize < 2:
+            raise ValueError("A stream queue holds at least 2 frames")
+        self.consumer = consumer
+        self.maxsize = maxsize
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.max_samples = max_samples
+        self.decimation = 1        # decimate: take 1 of every `decimation` incoming frames
+        self.frames_in = 0
+        self.dropped = 0
+        self.closed = False
+        self._frames = np.zeros((maxsize, 2, max_samples), dtype=np.int16)
+        self._counts = np.zeros(maxsize, dtype=np.int32)
+        self._seqs = np.zeros(maxsize, dtype=np.int64)
+        self._head = 0
+        self._size = 0
+        self._phase = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._dropped_metric = metrics.counter("dcm_stream_dropped_total", "Frames dropped by a full stream queue",
+                                               policy=policy, consumer=consumer)
+        self._depth = metrics.gauge("dcm_stream_queue_depth", "Frames waiting in a stream queue", consumer=consumer)
+
+    def __len__(self):
+        return self._size
+
+    ''' PRODUCER '''
+    # Queue a frame (copied in); False when the policy dropped it
+    def put(self, vent, atr, seq=0):
+        with self._lock:
+            if self.closed:
+                raise StreamClosed(self.consumer)
+            self.frames_in += 1
+            if self.policy == DECIMATE:
+                self._phase += 1
+                if self._phase % self.decimation:
+                    self._drop(1)
+                    return False
+            if self._size == self.maxsize:
+                if self.policy == BLOCK:
+                    if not self._wait_for_room():
+                        self._drop(1)
+                        return False
+                elif self.policy == DROP_OLDEST:
+                    self._head = (self._head + 1) % self.maxsize
+                    self._size -= 1
+                    self._drop(1)
+                elif self.policy == DROP_NEWEST:
+                    self._drop(1)
+                    return False
+                else:
+                    self._decimate()
+            i = (self._head + self._size) % self.maxsize
+            n = len(vent)
+            self._frames[i, 0, :n] = vent
+            self._frames[i, 1, :n] = atr
+            self._counts[i] = n
+            self._seqs[i] = seq
+            self._size += 1
+            self._depth.set(self._size)
+            self._not_empty.notify()
+            return True
+
+    def _wait_for_room(self):
+        deadline = None if self.block_timeout is None else time.monotonic() + self.block_timeout
+        while self._size == self.maxsize and not self.closed:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            self._not_full.wait(remaining)
+        if self.closed:
+            raise StreamClosed(self.consumer)
+        return True
+
+    # Keep every other queued frame (the newest included) and take half as many new frames from now on
+    def _decimate(self):
+        keep = np.arange(self._size - 1, -1, -2)[::-1]
+        slots = (self._head + keep) % self.maxsize
+        kept = len(keep)
+        self._frames[:kept] = self._frames[slots]
+        self._counts[:kept] = self._counts[slots]
+        self._seqs[:kept] = self._seqs[slots]
+        self._drop(self._size - kept)
+        self._head, self._size = 0, kept
+        self.decimation *= 2
+        log_event(LOG, logging.INFO, "stream_decimated", consumer=self.consumer, decimation=self.decimation)
+
+    def _drop(self, frames):
+        self.dropped += frames
+        self._dropped_metric.inc(frames)
+
+    ''' CONSUMER '''
+    # Oldest queued frame as (seq, vent, atr) copies, or (seq, n) after copying into out=(vent, atr);
+    # None when nothing arrived within timeout (0: don't wait, None: wait for ever)
+    def get(self, timeout=None, out=None):
+        with self._lock:
+            if not self._size:
+                if timeout == 0 or self.closed:
+                    return None
+                self._not_empty.wait_for(lambda: self._size or self.closed, timeout)
+                if not self._size:
+                    return None
+            i = self._head
+            n = int(self._counts[i])
+            seq = int(self._seqs[i])
+            if out is None:
+                frame = seq, self._frames[i, 0, :n].copy(), self._frames[i, 1, :n].copy()
+            else:
+                out[0][:n] = self._frames[i, 0, :n]
+                out[1][:n] = self._frames[i, 1, :n]
+                frame = seq, n
+            self._head = (self._head + 1) % self.maxsize
+            self._size -= 1
+            if self.policy == DECIMATE and self.decimation > 1 and self._size <= self.maxsize // 4:
+                self.decimation //= 2
+            self._depth.set(self._size)
+            self._not_full.notify()
+            return frame
+
+    # Every queued frame, oldest first
+    def drain(self):
+        frames = []
+        while True:
+            frame = self.get(timeout=0)
+            if frame is None:
+                return frames
+            frames.append(frame)
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def stats(self):
+        return {"consumer": self.consumer, "policy": self.policy, "depth": self._size, "maxsize": self.maxsize,
+                "frames_in": self.frames_in, "dropped": self.dropped, "decimation": self.decimation,
+                "memory_bytes": self._frames.nbytes + self._counts.nbytes + self._seqs.nbytes}
+
@@ -0,0 +1,261 @@
+# comm/telemetry_ring.py
+# Shared-memory fan-out of decoded egram frames to local consumer processes.
+#
+# The serial reader (PacemakerSerial.telemetry) publishes every decoded signals
+# frame into a ring of fixed-size slots in a multiprocessing.shared_memory block;
+# recorders, analyzers or a second display attach to it by name from their own
+# processes. There is one writer and no lock: each slot carries the sequence
+# number of the frame in it (seqlock style), written as 0 before the samples are
+# copied in and as the frame's number after, so a reader that finds the number it
+# expects before and after using the samples knows they were not overwritten.
+#
+#   header   int64[4]: magic, slots, max samples per channel, frames published
+#   seq      int64[slots]         frame number in the slot (0 while being written)
+#   count    int32[slots]         samples per channel in the frame
+#   samples  int16[slots, 2, max] vent, atr counts (see analysis.egram)
+#
+# Every reader keeps its own position. When the writer laps it, the next read
+# skips to the oldest frame still in the ring and counts the frames in between
+# as lost (reader.lost, reader.overruns, and the consumer-labelled metric).
+#
+#   ring = TelemetryRing.create()                    # producer, DEFAULT_NAME
+#   ring.publish(vent, atr)
+#   reader = TelemetryRing.attach().reader("recorder")   # any process
+#   for seq, vent, atr in reader: ...
+#
+#   python -m comm.telemetry_ring [--name dcm_telemetry]   tail the ring, report rate and losses
+import sys
+import time
+import logging
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+from metrics import metrics
+from metrics.metrics import log_event
+
+from .serial_comm import FRAME_SAMPLE_OPTIONS
+
+LOG = metrics.get_logger("telemetry_ring")
+
+DEFAULT_NAME = "dcm_telemetry"
+DEFAULT_SLOTS = 4096                     # ~4 s of 128-sample frames at 1 kHz, 128 s of legacy frames
+MAX_SAMPLES = FRAME_SAMPLE_OPTIONS[-1]
+MAGIC = 0x44434D52494E4701               # "DCMRING", version 1
+HEADER_FIELDS = 4
+
+_created = set()  # rings created by this process
+
+PUBLISHED = metrics.counter("dcm_ring_frames_published_total", "Frames published to the telemetry ring")
+
+
+class TelemetryRing:
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.name = shm.name
+        self.owner = owner
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        if header[0] != MAGIC:
+            raise ValueError(f"{shm.name} is not a telemetry ring")
+        self.slots, self.max_samples = int(header[1]), int(header[2])
+        self._map(shm.buf)
+
+    def _map(self, buf):
+        offset = HEADER_FIELDS * 8
+        self._header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=buf)
+        self.seq = np.ndarray((self.slots,), dtype=np.int64, buffer=buf, offset=offset)
+        offset += self.slots * 8
+        self.count = np.ndarray((self.slots,), dtype=np.int32, buffer=buf, offset=offset)
+        offset += self.slots * 4
+        self.samples = np.ndarray((self.slots, 2, self.max_samples), dtype=np.int16, buffer=buf, offset=offset)
+
+    @staticmethod
+    def size(slots, max_samples):
+        return HEADER_FIELDS * 8 + slots * (8 + 4 + 2 * 2 * max_samples)
+
+    ''' CREATE / ATTACH '''
+    # Create the ring (the producer); a stale block left by a crashed producer is replaced
+    @classmethod
+    def create(cls, name=DEFAULT_NAME, slots=DEFAULT_SLOTS, max_samples=MAX_SAMPLES):
+        size = cls.size(slots, max_samples)
+        try:
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        _created.add(shm.name)
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = (0, slots, max_samples, 0)
+        header[0] = MAGIC  # last: attaching readers check it
+        del header
+        return cls(shm, owner=True)
+
+    # Attach to an existing ring (a consumer); FileNotFoundError when no producer is running
+    @classmethod
+    def attach(cls, name=DEFAULT_NAME):
+        return cls(_attach(name), owner=False)
+
+    def close(self):
+        # views into the block have to go before it can be closed
+        self._header = self.seq = self.count = self.samples = None
+        try:
+            self.shm.close()
+        except BufferError:  # frames returned by RingReader.next() still referenced; unmapped at exit
+            log_event(LOG, logging.DEBUG, "ring_close_deferred", name=self.name)
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    ''' PRODUCER '''
+    @property
+    def published(self):
+        return int(self._header[3])
+
+    def publish(self, vent, atr):
+        n = len(vent)
+        frame = int(self._header[3]) + 1
+        i = (frame - 1) % self.slots
+        self.seq[i] = 0
+        self.samples[i, 0, :n] = vent
+        self.samples[i, 1, :n] = atr
+        self.count[i] = n
+        self.seq[i] = frame
+        self._header[3] = frame
+        PUBLISHED.inc()
+        return frame
+
+    ''' CONSUMERS '''
+    def reader(self, consumer="consumer", start="latest"):
+        return RingReader(self, consumer, start)
+
+
+class RingReader:
+    ''' One consumer's position in a TelemetryRing: its own overruns and losses '''
+
+    def __init__(self, ring, consumer="consumer", start="latest"):
+        self.ring = ring
+        self.consumer = consumer
+        published = ring.published
+        # "latest": only frames published from now on; "oldest": everything still in the ring
+        self.next_seq = published + 1 if start == "latest" else max(1, published - ring.slots + 1)
+        self.frames = 0
+        self.lost = 0
+        self.overruns = 0
+        self._lost_metric = metrics.counter("dcm_ring_frames_lost_total", "Frames overwritten before a consumer read them",
+                                            consumer=consumer)
+
+    def available(self):
+        return max(0, self.ring.published - self.next_seq + 1)
+
+    # Next frame as (seq, vent, atr) views into its slot (no copy), None when caught up.
+    # The views stay valid until the writer laps the slot: check intact(seq) after using them.
+    def next(self):
+        ring = self.ring
+        while True:
+            published = ring.published
+            if self.next_seq > published:
+                return None
+            oldest = published - ring.slots + 1
+            if self.next_seq < oldest:
+                self._overrun(oldest - self.next_seq)
+                self.next_seq = oldest
+            seq = self.next_seq
+            i = (seq - 1) % ring.slots
+            n = int(ring.count[i])
+            if ring.seq[i] != seq:
+                # lapped between reading the head and the slot
+                self._overrun(1)
+                self.next_seq += 1
+                continue
+            self.next_seq += 1
+            self.frames += 1
+            return seq, ring.samples[i, 0, :n], ring.samples[i, 1, :n]
+
+    def intact(self, seq):
+        return self.ring.seq[(seq - 1) % self.ring.slots] == seq
+
+    # Copy the next frame into vent/atr (length max_samples); returns (seq, samples per channel) or None
+    def read_into(self, vent, atr):
+        while True:
+            frame = self.next()
+            if frame is None:
+                return None
+            seq, v, a = frame
+            n = len(v)
+            vent[:n] = v
+            atr[:n] = a
+            if self.intact(seq):
+                return seq, n
+            self.frames -= 1
+            self._overrun(1)
+
+    def __iter__(self):
+        while True:
+            frame = self.next()
+            if frame is None:
+                return
+            yield frame
+
+    def _overrun(self, frames):
+        self.lost += frames
+        self.overruns += 1
+        self._lost_metric.inc(frames)
+        log_event(LOG, logging.WARNING, "ring_overrun", consumer=self.consumer, lost=frames, total_lost=self.lost)
+
+    def stats(self):
+        return {"consumer": self.consumer, "frames": self.frames, "lost": self.lost, "overruns": self.overruns,
+                "behind": self.available()}
+
+
+# Attach without registering the block with this process's resource tracker, which
+# would otherwise unlink it when the consumer exits (Python < 3.13 has no track=False).
+# The producer's own process, and processes started by multiprocessing (which share
+# their parent's tracker), hold the producer's registration: unregistering would drop it.
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name)
+        if shm.name not in _created and multiprocessing.parent_process() is None:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Tail the DCM telemetry ring and report frame rate and losses")
+    parser.add_argument("--name", default=DEFAULT_NAME)
+    parser.add_argument("--interval", type=float, default=1.0, help="report interval (s)")
+    args = parser.parse_args(argv)
+
+    try:
+        ring = TelemetryRing.attach(args.name)
+    except FileNotFoundError:
+        print(f"No telemetry ring '{args.name}' (is the DCM streaming?)")
+        return 1
+    reader = ring.reader("tail")
+    try:
+        while True:
+            time.sleep(args.interval)
+            before = reader.frames
+            for _ in reader:
+                pass
+            print(f"{(reader.frames - before) / args.interval:8.1f} frames/s  lost {reader.lost}  "
+                  f"overruns {reader.overruns}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
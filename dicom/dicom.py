@@ -4,36 +4,47 @@ import tzlocal
 import numpy as np
 
 from pydicom import dcmread
+from pydicom.dataset import Dataset
 
+from params.schema import CHOICES
+from analysis.egram import MARKER_MEANINGS, EGRAM_SENSITIVITY, to_counts, to_mv
+
+from . import header_index
 from .dicom_init import patient_info_init, bradycardia_param_init, temporary_param_init, lead_waveform_init, surface_ecg_init
 
+# Files of every patient folder, by path key (see init_dir)
+PATIENT_FILES = {
+    "PT_INFO_DCM"     : "patient_info.dcm",
+    "BRADY_PARAM_DCM" : "brady_params_report.dcm",
+    "TEMP_PARAM_DCM"  : "temp_params_report.dcm",
+    "LEAD_WAVFRM_DCM" : "lead_waveform.dcm",
+    "SURFACE_ECG_DCM" : "surface_ecg.dcm",
+}
+
+# Template of each patient file, by path key
+INITIALIZERS = {
+    "PT_INFO_DCM"     : patient_info_init,
+    "BRADY_PARAM_DCM" : bradycardia_param_init,
+    "TEMP_PARAM_DCM"  : temporary_param_init,
+    "LEAD_WAVFRM_DCM" : lead_waveform_init,
+    "SURFACE_ECG_DCM" : surface_ecg_init,
+}
+
 # Initialization of DICOM files for an account's given patient
 def init_dir(username, patientID):
+    paths = patient_paths(username, patientID)
+    for name, init in INITIALIZERS.items():
+        if not os.path.exists(paths[name]):
+            header_index.on_save(paths[name], init(patientID, paths[name]))
+
+    return paths
+
+# DICOM file paths of a patient, creating the patient folder but not the files
+def patient_paths(username, patientID):
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # get base directory of your project
     PATIENT_DIR = os.path.join(BASE_DIR, "data", str(username), str(patientID)) # user-patient-specific folder in data
     os.makedirs(PATIENT_DIR, exist_ok=True) # create all directories if they don't exist
-
-    # DICOM file paths
-    paths = {
-        "PT_INFO_DCM"     : os.path.join(PATIENT_DIR, "patient_info.dcm"),
-        "BRADY_PARAM_DCM" : os.path.join(PATIENT_DIR, "brady_params_report.dcm"),
-        "TEMP_PARAM_DCM"  : os.path.join(PATIENT_DIR, "temp_params_report.dcm"),
-        "LEAD_WAVFRM_DCM" : os.path.join(PATIENT_DIR, "lead_waveform.dcm"),
-        "SURFACE_ECG_DCM" : os.path.join(PATIENT_DIR, "surface_ecg.dcm"),
-    }
-
-    if not os.path.exists(paths["PT_INFO_DCM"]):
-        patient_info_init(patientID, paths["PT_INFO_DCM"])
-    if not os.path.exists(paths["BRADY_PARAM_DCM"]):
-        bradycardia_param_init(patientID, paths["BRADY_PARAM_DCM"])
-    if not os.path.exists(paths["TEMP_PARAM_DCM"]):
-        temporary_param_init(patientID, paths["TEMP_PARAM_DCM"])
-    if not os.path.exists(paths["LEAD_WAVFRM_DCM"]):
-        lead_waveform_init(patientID, paths["LEAD_WAVFRM_DCM"])
-    if not os.path.exists(paths["SURFACE_ECG_DCM"]):
-        surface_ecg_init(patientID, paths["SURFACE_ECG_DCM"])
-        
-    return paths
+    return {name: os.path.join(PATIENT_DIR, filename) for name, filename in PATIENT_FILES.items()}
 
 def save_dicom(ds, filepath):
     dt = datetime.datetime.now(tzlocal.get_localzone())
@@ -49,6 +60,7 @@ def save_dicom(ds, filepath):
         raise ValueError("File is neither Basic Test SR nor ECG Waveform")
 
     ds.save_as(filepath)
+    header_index.on_save(filepath, ds)
 
 # Fetch the parameter value of a specified mode and file
 def get_parameter(filepath, mode, parameter, unit_flag=False):
@@ -81,6 +93,39 @@ def get_parameter(filepath, mode, parameter, unit_flag=False):
                         return None
     return None
 
+# Fetch every parameter value of every mode from a single read of the file
+def get_all_parameters(filepath):
+    ds = dcmread(filepath)
+
+    # validation
+    if ds.Modality != "SR":
+        raise TypeError("File is not a Basic Text SR")
+
+    params = {}
+    # traverse modes
+    for item in ds.ContentSequence:
+        code = item.ConceptNameCodeSequence[0].CodeValue
+        if not code.startswith("BRADY_"):
+            continue
+        mode = code[len("BRADY_"):]
+        params[mode] = {}
+
+        # traverse parameters
+        for subitem in item.ContentSequence:
+            parameter = subitem.ConceptNameCodeSequence[0].CodeMeaning
+            try:
+                mv = subitem.MeasuredValueSequence[0]
+                if parameter in CHOICES:
+                    value = mv.TextValue
+                else:
+                    value = float(mv.NumericValue)
+            # in case it doesn't exsist, is empty or the DICOM tag is missing
+            except (AttributeError, IndexError, KeyError, TypeError):
+                value = None
+            params[mode][parameter] = value
+
+    return params
+
 # Write the parameter with a new value of a specified mode and file
 def set_parameter(filepath, mode, parameter, value, save=True):
     ds = dcmread(filepath)
@@ -101,7 +146,7 @@ def set_parameter(filepath, mode, parameter, value, save=True):
 
                     # updates numeric value
                     try:
-                        if parameter == "Activity Threshold":
+                        if parameter in CHOICES:
                             subitem.MeasuredValueSequence[0].TextValue = value
                         else:
                             subitem.MeasuredValueSequence[0].NumericValue = float(value)
@@ -115,6 +160,39 @@ def set_parameter(filepath, mode, parameter, value, save=True):
     # if we get here, parameter or mode wasn't found
     raise ValueError(f"Parameter '{parameter}' not found under mode '{mode}'")
 
+# Write several parameters of a mode with one read and one save of the file
+def set_parameters(filepath, mode, values):
+    ds = dcmread(filepath)
+    put_parameters(ds, mode, values)
+    save_dicom(ds, filepath)
+
+# Write several parameters of a mode into a dataset in memory (see set_parameters)
+def put_parameters(ds, mode, values):
+    # validation
+    if ds.Modality != "SR":
+        raise TypeError("File is not a Basic Text SR")
+
+    remaining = dict(values)
+    for item in ds.ContentSequence:
+        if item.ConceptNameCodeSequence[0].CodeValue != f"BRADY_{mode}":
+            continue
+        for subitem in item.ContentSequence:
+            parameter = subitem.ConceptNameCodeSequence[0].CodeMeaning
+            if parameter not in remaining:
+                continue
+            value = remaining.pop(parameter)
+            try:
+                if parameter in CHOICES:
+                    subitem.MeasuredValueSequence[0].TextValue = value
+                else:
+                    subitem.MeasuredValueSequence[0].NumericValue = float(value)
+            except (AttributeError):
+                raise ValueError("Numberic Value tag missing or invalid structure")
+
+    # nothing is saved unless every parameter was found
+    if remaining:
+        raise ValueError(f"Parameter '{next(iter(remaining))}' not found under mode '{mode}'")
+
 # Fetch the value of a waveform parameter a specified lead and file
 def get_waveparam(filepath, label, parameter):
     ds = dcmread(filepath)
@@ -170,45 +248,163 @@ def set_waveparam(filepath, label, parameter, value, save=True):
     # if we get here, parameter or lead wasn't found
     raise ValueError(f"Lead '{label}' not found in WaveformSequence.")
  
-# Fetch the waveform data for plotting
+# Single channel leads of lead_waveform.dcm (looked up by label, a WaveformAppender may reorder the groups)
+LEADS = ("Atrial Lead", "Ventricular Lead")
+
+def _check_lead(label):
+    if label not in LEADS:
+        raise ValueError(f"Unknown lead_label: {label}")
+
+# ChannelSensitivity (mV per count) of a channel definition
+# files written before the fixed-point path carry a 1.0 placeholder but always stored mV * 1000;
+# they are told apart by the ChannelSensitivityCorrectionFactor every current writer adds
+def _channel_sensitivity(ch):
+    try:
+        sensitivity = float(ch.ChannelSensitivity)
+        units = ch.ChannelSensitivityUnitsSequence[0].CodeValue
+    except (AttributeError, IndexError, KeyError, TypeError):
+        return EGRAM_SENSITIVITY
+    if units != "mV" or sensitivity <= 0:
+        return EGRAM_SENSITIVITY
+    if sensitivity == 1.0 and "ChannelSensitivityCorrectionFactor" not in ch:
+        return EGRAM_SENSITIVITY
+    return sensitivity
+
+# Store the sensitivity (mV per count) of a channel definition
+def _set_channel_sensitivity(ch, sensitivity):
+    ch.ChannelSensitivity = float(sensitivity)
+    ch.ChannelSensitivityUnitsSequence[0].CodeValue = "mV"
+    ch.ChannelSensitivityCorrectionFactor = 1.0
+
+# Find the multiplex group index of a lead label (e.g. "Atrial Lead")
+def _waveform_group(ds, label):
+    for i, item in enumerate(ds.WaveformSequence):
+        if item.MultiplexGroupLabel == label:
+            return i
+    raise ValueError(f"Lead '{label}' not found in WaveformSequence.")
+
+# Fetch a multiplex group as a (samples, channels) int16 array (a view of the file's interleaved data),
+# with the per-channel sensitivities (mV per count) and channel labels
+def get_multiplex_waveform(filepath, label):
+    ds = dcmread(filepath)
+
+    # validation
+    if ds.Modality != "ECG":
+        raise TypeError("File is not an ECG Waveform")
+
+    seq = ds.WaveformSequence[_waveform_group(ds, label)]
+    channels = seq.ChannelDefinitionSequence
+    counts = np.frombuffer(seq.WaveformData or b"", dtype="<i2").reshape(-1, len(channels))
+    sensitivities = np.array([_channel_sensitivity(ch) for ch in channels])
+    labels = [str(ch.ChannelLabel) for ch in channels]
+    return counts, sensitivities, labels
+
+# Write a multiplex group from a (samples, channels) array in one contiguous copy
+# int16/integer arrays are stored as counts as-is, float arrays are taken as mV and quantized (saturating);
+# sensitivity (mV per count, one for every channel or one per channel) is stored as the channel sensitivity
+def set_multiplex_waveform(filepath, label, data, sensitivity=EGRAM_SENSITIVITY):
+    ds = dcmread(filepath)
+    put_multiplex_waveform(ds, label, data, sensitivity)
+    save_dicom(ds, filepath)
+
+# Write a multiplex group into a dataset in memory (see set_multiplex_waveform)
+def put_multiplex_waveform(ds, label, data, sensitivity=EGRAM_SENSITIVITY):
+    # validation
+    if ds.Modality != "ECG":
+        raise TypeError("File is not an ECG Waveform")
+
+    seq = ds.WaveformSequence[_waveform_group(ds, label)]
+    n_channels = int(seq.NumberOfWaveformChannels)
+    try:
+        sensitivities = np.broadcast_to(np.asarray(sensitivity, dtype=float), (n_channels,))
+    except ValueError:
+        raise ValueError(f"'{label}' has {n_channels} channels, got {np.size(sensitivity)} sensitivities")
+    if not np.all(sensitivities > 0):
+        raise ValueError(f"Channel sensitivity must be positive, got {sensitivity}")
+    data = np.asarray(data)
+    if data.ndim == 1 and n_channels == 1:
+        data = data.reshape(-1, 1)
+    if data.ndim != 2 or data.shape[1] != n_channels:
+        raise ValueError(f"'{label}' has {n_channels} channels, got data of shape {data.shape}")
+    counts = to_counts(data, sensitivities)
+
+    # row-major (samples, channels) is the DICOM multiplexed sample order
+    seq.WaveformData = np.ascontiguousarray(counts, dtype="<i2").tobytes()
+    seq.NumberOfWaveformSamples = counts.shape[0]
+    for ch, channel_sensitivity in zip(seq.ChannelDefinitionSequence, sensitivities):
+        _set_channel_sensitivity(ch, channel_sensitivity)
+
+# Fetch the raw int16 waveform samples of a lead and their sensitivity (mV per count)
+def get_ecg_counts(filepath, label):
+    _check_lead(label)
+    ds = dcmread(filepath)
+    seq = ds.WaveformSequence[_waveform_group(ds, label)]
+    counts = np.frombuffer(seq.WaveformData or b"", dtype="<i2")
+    return counts, _channel_sensitivity(seq.ChannelDefinitionSequence[0])
+
+# Fetch the waveform data for plotting (mV)
 def get_ecg_waveform(filepath, label):
+    counts, sensitivity = get_ecg_counts(filepath, label)
+    if counts.size == 0:
+        return np.zeros(500, dtype=float)
+    return to_mv(counts, sensitivity)
+
+# Write the waveform data of a lead (single channel groups of lead_waveform.dcm)
+def set_ecg_waveform(filepath, label, data, sensitivity=EGRAM_SENSITIVITY):
+    _check_lead(label)
+    set_multiplex_waveform(filepath, label, data, sensitivity)
+
+# Write egram event markers (AS/AP/VS/VP) for a lead, replacing that lead's previous markers
+# events are (sample, marker) pairs or EgramEvents; first_sample is the absolute sample
+# index of the first stored waveform sample, events outside the stored waveform are dropped
+def set_waveform_annotations(filepath, label, events, first_sample=0):
     ds = dcmread(filepath)
-    
-    if label == "Atrial Lead":
-        data = ds.WaveformSequence[0].WaveformData
-    elif label == "Ventricular Lead":
-        data = ds.WaveformSequence[1].WaveformData
-    # elif label == "Surface Lead":
-    #     data = ds.WaveformSequence[0].WaveformData
-    else:
-        raise ValueError(f"Unknown lead_label: {label}")
-    
-    # Ensure we return numeric data
-    if isinstance(data, bytes):
-        data = np.frombuffer(data, dtype=np.int16).astype(float) / 1000
-    else:
-        data = np.array(data, dtype=float)
 
-    if data.size == 0:
-        data = np.zeros(500, dtype=float)
+    # validation
+    if ds.Modality != "ECG":
+        raise TypeError("File is not an ECG Waveform")
+
+    group = _waveform_group(ds, label)
+    seq = ds.WaveformSequence[group]
+    n_samples = len(seq.WaveformData or b"") // (2 * int(seq.NumberOfWaveformChannels))
+
+    # keep annotations of the other leads
+    annotations = [item for item in ds.get("WaveformAnnotationSequence", [])
+                   if int(item.ReferencedWaveformChannels[0]) != group + 1]
+
+    for event in events:
+        sample, marker = (event.sample, event.marker) if hasattr(event, "marker") else event
+        position = sample - first_sample
+        if position < 0 or position >= n_samples:
+            continue
+
+        code = Dataset()
+        code.CodeValue = marker
+        code.CodingSchemeDesignator = "99LOCAL"
+        code.CodeMeaning = MARKER_MEANINGS.get(marker, marker)
 
-    return data.flatten()
+        item = Dataset()
+        item.ConceptNameCodeSequence = [code]
+        item.ReferencedWaveformChannels = [group + 1, 1]  # multiplex group, channel (1-based)
+        item.TemporalRangeType = "POINT"
+        item.ReferencedSamplePositions = [position + 1]  # 1-based sample position
+        annotations.append(item)
 
-# Write the waveform data for plotting
-def set_ecg_waveform(filepath, label, data):
+    ds.WaveformAnnotationSequence = annotations
+    save_dicom(ds, filepath)
+
+# Fetch the egram event markers of a lead as (sample, marker) pairs, sample is 0-based
+def get_waveform_annotations(filepath, label):
     ds = dcmread(filepath)
 
-    # Always store as int16 bytes (standard for waveform DICOM)
-    data = np.asarray(data, dtype=np.float32)
-    data_bytes = (data * 1000).astype(np.int16).tobytes()
-    
-    if label == "Atrial Lead":
-        ds.WaveformSequence[0].WaveformData = data_bytes
-    elif label == "Ventricular Lead":
-        ds.WaveformSequence[1].WaveformData = data_bytes
-    # elif label == "Surface Lead":
-    #     ds.WaveformSequence[0].WaveformData = data_bytes
-    else:
-        raise ValueError(f"Unknown lead_label: {label}")
-    
-    save_dicom(ds, filepath)
\ No newline at end of file
+    # validation
+    if ds.Modality != "ECG":
+        raise TypeError("File is not an ECG Waveform")
+
+    group = _waveform_group(ds, label)
+    markers = []
+    for item in ds.get("WaveformAnnotationSequence", []):
+        if int(item.ReferencedWaveformChannels[0]) != group + 1:
+            continue
+        markers.append((int(item.ReferencedSamplePositions) - 1, item.ConceptNameCodeSequence[0].CodeValue))
+    return sorted(markers)
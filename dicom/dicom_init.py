@@ -4,45 +4,10 @@ import tzlocal
 from pydicom.dataset import Dataset, FileMetaDataset
 from pydicom.uid import ExplicitVRLittleEndian, generate_uid, UID, BasicTextSRStorage, GeneralECGWaveformStorage
 
-PARAM_UNITS = {
-    "Lower Rate Limit": "ppm",
-    "Upper Rate Limit": "ppm",
-    "Maximum Sensor Rate": "ppm",
-    "Atrial Amplitude": "V",
-    "Ventricular Amplitude": "V",
-    "Atrial Pulse Width": "ms",
-    "Ventricular Pulse Width": "ms",
-    "Atrial Sensitivity": "mV",
-    "Ventricular Sensitivity": "mV",
-    "ARP": "ms",
-    "VRP": "ms",
-    "PVARP": "ms",
-    "Hysteresis": "ppm",
-    "Rate Smoothing": "%",
-    "Activity Threshold": "", 
-    "Reaction Time": "s", 
-    "Response Factor": "", 
-    "Recovery Time": "min",
-}
-
-MODE_PARAMETERS = {
-    "AOO" : ["Lower Rate Limit", "Upper Rate Limit", "Atrial Amplitude", "Atrial Pulse Width"],
-    "VOO" : ["Lower Rate Limit", "Upper Rate Limit", "Ventricular Amplitude", "Ventricular Pulse Width"],
-    "AAI" : ["Lower Rate Limit", "Upper Rate Limit", "Atrial Amplitude", "Atrial Pulse Width",
-            "Atrial Sensitivity", "ARP", "PVARP", "Hysteresis", "Rate Smoothing"],
-    "VVI" : ["Lower Rate Limit", "Upper Rate Limit", "Ventricular Amplitude", "Ventricular Pulse Width",
-            "Ventricular Sensitivity", "VRP", "Hysteresis", "Rate Smoothing"],
-    "AOOR": ["Lower Rate Limit", "Upper Rate Limit", "Maximum Sensor Rate", "Atrial Amplitude", "Atrial Pulse Width", 
-             "Activity Threshold", "Reaction Time", "Response Factor", "Recovery Time"],
-    "VOOR": ["Lower Rate Limit", "Upper Rate Limit", "Maximum Sensor Rate", "Ventricular Amplitude", "Ventricular Pulse Width", 
-             "Activity Threshold", "Reaction Time", "Response Factor", "Recovery Time"],
-    "AAIR": ["Lower Rate Limit", "Upper Rate Limit", "Maximum Sensor Rate", "Atrial Amplitude", "Atrial Pulse Width",
-            "Atrial Sensitivity", "ARP", "PVARP", "Hysteresis", "Rate Smoothing", 
-            "Activity Threshold", "Reaction Time", "Response Factor", "Recovery Time"],
-    "VVIR": ["Lower Rate Limit", "Upper Rate Limit", "Maximum Sensor Rate", "Ventricular Amplitude", "Ventricular Pulse Width",
-            "Ventricular Sensitivity", "VRP", "Hysteresis", "Rate Smoothing", 
-            "Activity Threshold", "Reaction Time", "Response Factor", "Recovery Time"],
-}
+# Parameter units and mode membership come from the shared parameter schema
+from params.schema import PARAM_UNITS, MODE_PARAMETERS, CHOICES
+from analysis.egram import EGRAM_SENSITIVITY
+
 
 def param_sequence(mode):
     mode_item = Dataset()
@@ -57,7 +22,7 @@ def param_sequence(mode):
     mode_item.ContentSequence = []
     for param_name in MODE_PARAMETERS[mode]:
         param_item = Dataset()
-        if param_name == "Activity Threshold":
+        if param_name in CHOICES:
             param_item.ValueType = "TEXT"
         else:
             param_item.ValueType = "NUM"
@@ -67,14 +32,14 @@ def param_sequence(mode):
         concept.CodingSchemeDesignator = "99EPIC"
         concept.CodeMeaning = param_name
     
-        if param_name != "Activity Threshold":
+        if param_name not in CHOICES:
             units = Dataset()
             units.CodeValue = PARAM_UNITS.get(param_name, "")
             units.CodingSchemeDesignator = "UCUM"
             units.CodeMeaning = PARAM_UNITS.get(param_name, "")
 
         mv = Dataset()
-        if param_name == "Activity Threshold":
+        if param_name in CHOICES:
             mv.TextValue = ""
         else:
             mv.NumericValue = 0
@@ -86,7 +51,8 @@ def param_sequence(mode):
         mode_item.ContentSequence.append(param_item)
     return mode_item
 
-def patient_info_init(patientID, DCM_FILE):
+# Each *_init builds the template dataset of a patient file, writes it to DCM_FILE unless save=False, and returns it
+def patient_info_init(patientID, DCM_FILE, save=True):
     # Required values for file meta information
     file_meta = FileMetaDataset()
     file_meta.MediaStorageSOPClassUID = BasicTextSRStorage # Basic Text SR SOP class
@@ -127,9 +93,11 @@ def patient_info_init(patientID, DCM_FILE):
     # Add file meta information
     ds.file_meta = file_meta
 
-    ds.save_as(DCM_FILE, enforce_file_format=True)
+    if save:
+        ds.save_as(DCM_FILE, enforce_file_format=True)
+    return ds
 
-def bradycardia_param_init(patientID, DCM_FILE):
+def bradycardia_param_init(patientID, DCM_FILE, save=True):
     # Required values for file meta information
     file_meta = FileMetaDataset()
     file_meta.MediaStorageSOPClassUID = BasicTextSRStorage # Basic Text SR SOP class
@@ -174,9 +142,11 @@ def bradycardia_param_init(patientID, DCM_FILE):
     # Add file meta information
     ds.file_meta = file_meta
 
-    ds.save_as(DCM_FILE, enforce_file_format=True)
+    if save:
+        ds.save_as(DCM_FILE, enforce_file_format=True)
+    return ds
 
-def temporary_param_init(patientID, DCM_FILE):
+def temporary_param_init(patientID, DCM_FILE, save=True):
     # Required values for file meta information
     file_meta = FileMetaDataset()
     file_meta.MediaStorageSOPClassUID = BasicTextSRStorage # Basic Text SR SOP class
@@ -221,9 +191,11 @@ def temporary_param_init(patientID, DCM_FILE):
     # Add file meta information
     ds.file_meta = file_meta
 
-    ds.save_as(DCM_FILE, enforce_file_format=True)
+    if save:
+        ds.save_as(DCM_FILE, enforce_file_format=True)
+    return ds
 
-def lead_waveform_init(patientID, DCM_FILE):
+def lead_waveform_init(patientID, DCM_FILE, save=True):
     # Required values for file meta information
     file_meta = FileMetaDataset()
     file_meta.MediaStorageSOPClassUID = GeneralECGWaveformStorage # ECG Waveform SOP class
@@ -275,11 +247,12 @@ def lead_waveform_init(patientID, DCM_FILE):
         ch.ChannelSourceSequence[0].CodeValue = lead_name
         ch.ChannelSourceSequence[0].CodingSchemeDesignator = "99LOCAL"
         ch.ChannelSourceSequence[0].CodeMeaning = f"Lead {lead_name}"
-        ch.ChannelSensitivity = 1.0  # µV per bit (placeholder)
+        ch.ChannelSensitivity = EGRAM_SENSITIVITY  # mV per int16 count
         ch.ChannelSensitivityUnitsSequence = [Dataset()]
-        ch.ChannelSensitivityUnitsSequence[0].CodeValue = "V"
+        ch.ChannelSensitivityUnitsSequence[0].CodeValue = "mV"
         ch.ChannelSensitivityUnitsSequence[0].CodingSchemeDesignator = "UCUM"
         ch.ChannelSensitivityUnitsSequence[0].CodeMeaning = "millivolt"
+        ch.ChannelSensitivityCorrectionFactor = 1.0
         ch.ChannelBaseline = 0
 
         seq.ChannelDefinitionSequence.append(ch)
@@ -294,9 +267,11 @@ def lead_waveform_init(patientID, DCM_FILE):
     # Add file meta information
     ds.file_meta = file_meta
 
-    ds.save_as(DCM_FILE, enforce_file_format=True)
+    if save:
+        ds.save_as(DCM_FILE, enforce_file_format=True)
+    return ds
 
-def surface_ecg_init(patientID, DCM_FILE):
+def surface_ecg_init(patientID, DCM_FILE, save=True):
     # Required values for file meta information
     file_meta = FileMetaDataset()
     file_meta.MediaStorageSOPClassUID = GeneralECGWaveformStorage # ECG Waveform SOP class
@@ -348,11 +323,12 @@ def surface_ecg_init(patientID, DCM_FILE):
         ch.ChannelSourceSequence[0].CodeValue = lead_name
         ch.ChannelSourceSequence[0].CodingSchemeDesignator = "99LOCAL"
         ch.ChannelSourceSequence[0].CodeMeaning = f"Lead {lead_name}"
-        ch.ChannelSensitivity = 1.0 # µV per bit (placeholder; changes based on ACD) (0.1526 for 16-bit ADC, 2.44 for 12-bit ADC)
+        ch.ChannelSensitivity = EGRAM_SENSITIVITY  # mV per int16 count
         ch.ChannelSensitivityUnitsSequence = [Dataset()]
         ch.ChannelSensitivityUnitsSequence[0].CodeValue = "mV"
         ch.ChannelSensitivityUnitsSequence[0].CodingSchemeDesignator = "UCUM"
         ch.ChannelSensitivityUnitsSequence[0].CodeMeaning = "millivolt"
+        ch.ChannelSensitivityCorrectionFactor = 1.0
         ch.ChannelBaseline = 0
         ecg_seq.ChannelDefinitionSequence.append(ch)
 
@@ -366,4 +342,6 @@ def surface_ecg_init(patientID, DCM_FILE):
     # Add file meta information
     ds.file_meta = file_meta
 
-    ds.save_as(DCM_FILE, enforce_file_format=True)
\ No newline at end of file
+    if save:
+        ds.save_as(DCM_FILE, enforce_file_format=True)
+    return ds
@@ -0,0 +1,301 @@
+# dicom/header_index.py
+# Per-user index of DICOM header fields (demographics, UIDs, modification times
+# and waveform sample counts), so listing and summary screens never open the
+# DICOM files themselves.
+#
+# data/<username>/header_index.db, one row per "<patientID>/<file>.dcm".
+# save_dicom keeps it current from the in-memory dataset. The index is a cache
+# of the files, so it is written without fsync and can always be rebuilt:
+#
+#   python -m dicom.header_index rebuild [--data-dir DIR] [--workers N]
+#   python -m dicom.header_index verify [--fix]
+import os
+import sys
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from pydicom import dcmread
+from pydicom.dataelem import RawDataElement
+
+from metrics import metrics
+from metrics.metrics import log_event
+
+LOG = metrics.get_logger("header_index")
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+INDEX_NAME = "header_index.db"
+
+# top-level tags read for the index (file meta is always read)
+HEADER_TAGS = ["PatientID", "PatientName", "PatientBirthDate", "PatientSex", "Modality",
+               "SeriesInstanceUID", "StudyInstanceUID", "WaveformSequence"]
+WAVEFORM_DATA = 0x54001010
+
+_connections = {}
+_lock = threading.Lock()
+
+
+''' DATABASE '''
+
+def _connect(user_dir):
+    db_path = os.path.join(user_dir, INDEX_NAME)
+    conn = _connections.get(db_path)
+    if conn is not None and not os.path.exists(db_path):
+        conn.close()  # user folder was deleted (e.g. clear_users), start a fresh index
+        conn = None
+    if conn is None:
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")  # rebuildable cache, see verify/rebuild
+        conn.execute("""CREATE TABLE IF NOT EXISTS headers (
+                        path TEXT PRIMARY KEY,
+                        patient_id TEXT,
+                        patient_name TEXT,
+                        birth_date TEXT,
+                        sex TEXT,
+                        modality TEXT,
+                        sop_instance_uid TEXT,
+                        series_instance_uid TEXT,
+                        study_instance_uid TEXT,
+                        mtime_ns INTEGER,
+                        size INTEGER
+                        )""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS waveforms (
+                        path TEXT NOT NULL,
+                        label TEXT NOT NULL,
+                        channels INTEGER,
+                        samples INTEGER,
+                        PRIMARY KEY (path, label)
+                        )""")
+        conn.commit()
+        _connections[db_path] = conn
+    return conn
+
+def close_all():
+    with _lock:
+        for conn in _connections.values():
+            conn.close()
+        _connections.clear()
+
+
+''' HEADER EXTRACTION '''
+
+# Header row and waveform (label, channels, samples) rows of a dataset, from memory or a partial read
+def _header(ds, stat):
+    meta = getattr(ds, "file_meta", None)
+    row = {
+        "patient_id": str(ds.get("PatientID", "")),
+        "patient_name": str(ds.get("PatientName", "")),
+        "birth_date": str(ds.get("PatientBirthDate", "")),
+        "sex": str(ds.get("PatientSex", "")),
+        "modality": str(ds.get("Modality", "")),
+        "sop_instance_uid": str(meta.get("MediaStorageSOPInstanceUID", "")) if meta is not None else "",
+        "series_instance_uid": str(ds.get("SeriesInstanceUID", "")),
+        "study_instance_uid": str(ds.get("StudyInstanceUID", "")),
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+    }
+    waveforms = []
+    for item in ds.get("WaveformSequence", []):
+        channels = int(item.get("NumberOfWaveformChannels", 1) or 1)
+        elem = item.get_item(WAVEFORM_DATA)
+        if elem is None:
+            length = 0
+        elif isinstance(elem, RawDataElement):
+            length = elem.length  # no need to convert the samples
+        else:
+            length = len(elem.value or b"")
+        waveforms.append((str(item.MultiplexGroupLabel), channels, length // (2 * channels)))
+    return row, waveforms
+
+def _read_header(filepath):
+    stat = os.stat(filepath)
+    ds = dcmread(filepath, specific_tags=HEADER_TAGS, stop_before_pixels=True)
+    return _header(ds, stat)
+
+# Index key of a file: "<patientID>/<file>.dcm" relative to its user directory
+def _key(user_dir, filepath):
+    return os.path.relpath(os.path.abspath(filepath), os.path.abspath(user_dir)).replace(os.sep, "/")
+
+def _store(conn, key, row, waveforms):
+    conn.execute("INSERT OR REPLACE INTO headers (path, " + ", ".join(row) + ") VALUES (?" + ", ?" * len(row) + ")",
+                 (key, *row.values()))
+    conn.execute("DELETE FROM waveforms WHERE path = ?", (key,))
+    conn.executemany("INSERT INTO waveforms (path, label, channels, samples) VALUES (?, ?, ?, ?)",
+                     [(key, *w) for w in waveforms])
+
+
+''' UPDATES '''
+
+# User directory of a file stored as DATA_DIR/<username>/<patientID>/<file>.dcm, or None
+def user_dir_of(filepath):
+    patient_dir = os.path.dirname(os.path.abspath(filepath))
+    user_dir = os.path.dirname(patient_dir)
+    if os.path.dirname(user_dir) != os.path.abspath(DATA_DIR):
+        return None
+    return user_dir
+
+# Record a file that was just saved, from its in-memory dataset (no re-read)
+def on_save(filepath, ds):
+    user_dir = user_dir_of(filepath)
+    if user_dir is None:
+        return
+    try:
+        row, waveforms = _header(ds, os.stat(filepath))
+        with _lock:
+            conn = _connect(user_dir)
+            _store(conn, _key(user_dir, filepath), row, waveforms)
+            conn.commit()
+    except (sqlite3.Error, OSError) as e:
+        log_event(LOG, logging.WARNING, "index_update_failed", path=filepath, error=str(e))
+
+# Re-index a file written without save_dicom (e.g. init templates, in-place waveform appends)
+def refresh(filepath):
+    user_dir = user_dir_of(filepath)
+    if user_dir is None:
+        return
+    try:
+        row, waveforms = _read_header(filepath)
+        with _lock:
+            conn = _connect(user_dir)
+            _store(conn, _key(user_dir, filepath), row, waveforms)
+            conn.commit()
+    except (sqlite3.Error, OSError) as e:
+        log_event(LOG, logging.WARNING, "index_update_failed", path=filepath, error=str(e))
+
+def remove_patient(user_dir, patient_id):
+    with _lock:
+        conn = _connect(user_dir)
+        prefix = f"{patient_id}/%"
+        conn.execute("DELETE FROM headers WHERE path LIKE ?", (prefix,))
+        conn.execute("DELETE FROM waveforms WHERE path LIKE ?", (prefix,))
+        conn.commit()
+
+
+''' QUERIES '''
+
+# Demographics of every indexed patient, from patient_info.dcm
+def list_patients(user_dir):
+    with _lock:
+        rows = _connect(user_dir).execute(
+            """SELECT patient_id, patient_name, birth_date, sex FROM headers
+               WHERE path LIKE '%/patient_info.dcm' ORDER BY patient_name, patient_id""").fetchall()
+    return [dict(zip(("patientID", "name", "birthdate", "sex"), row)) for row in rows]
+
+# Indexed files of a patient and the sample count of each waveform group
+def patient_summary(user_dir, patient_id):
+    prefix = f"{patient_id}/%"
+    with _lock:
+        conn = _connect(user_dir)
+        files = conn.execute("SELECT path, modality, sop_instance_uid, series_instance_uid, mtime_ns, size "
+                             "FROM headers WHERE path LIKE ? ORDER BY path", (prefix,)).fetchall()
+        waveforms = conn.execute("SELECT path, label, channels, samples FROM waveforms "
+                                 "WHERE path LIKE ? ORDER BY path, label", (prefix,)).fetchall()
+    return {
+        "files": [dict(zip(("path", "modality", "sop_instance_uid", "series_instance_uid", "mtime_ns", "size"), f))
+                  for f in files],
+        "waveforms": [dict(zip(("path", "label", "channels", "samples"), w)) for w in waveforms],
+    }
+
+
+''' REBUILD / VERIFY '''
+
+# DICOM files of every user directory: {user_dir: [paths]}
+def _scan(data_dir):
+    found = {}
+    for user in sorted(os.listdir(data_dir)):
+        user_dir = os.path.join(data_dir, user)
+        if not os.path.isdir(user_dir):
+            continue
+        paths = []
+        for patient in sorted(os.listdir(user_dir)):
+            patient_dir = os.path.join(user_dir, patient)
+            if os.path.isdir(patient_dir):
+                paths += [os.path.join(patient_dir, f) for f in sorted(os.listdir(patient_dir)) if f.endswith(".dcm")]
+        found[user_dir] = paths
+    return found
+
+def _read_all(paths, workers):
+    # header reads are CPU bound (pydicom parsing), so use processes
+    if workers == 1 or len(paths) < 2:
+        return [_read_header(p) for p in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_read_header, paths, chunksize=8))
+
+# Reindex every user directory under data_dir from scratch, returns the number of files indexed
+def rebuild(data_dir=None, workers=None):
+    data_dir = data_dir or DATA_DIR
+    found = _scan(data_dir)
+    headers = iter(_read_all([p for paths in found.values() for p in paths], workers))
+    for user_dir, paths in found.items():
+        with _lock:
+            conn = _connect(user_dir)
+            conn.execute("DELETE FROM headers")
+            conn.execute("DELETE FROM waveforms")
+            for path in paths:
+                _store(conn, _key(user_dir, path), *next(headers))
+            conn.commit()
+    return sum(len(paths) for paths in found.values())
+
+# Compare the index with the files on disk: {"stale": [...], "missing": [...], "orphaned": [...]} per user
+# fix=True reindexes stale/missing files (in parallel) and drops orphaned rows
+def verify(data_dir=None, fix=False, workers=None):
+    data_dir = data_dir or DATA_DIR
+    report = {}
+    for user_dir, paths in _scan(data_dir).items():
+        with _lock:
+            rows = _connect(user_dir).execute("SELECT path, mtime_ns, size FROM headers").fetchall()
+        indexed = {key: (mtime_ns, size) for key, mtime_ns, size in rows}
+        on_disk = {}
+        for path in paths:
+            stat = os.stat(path)
+            on_disk[_key(user_dir, path)] = (path, (stat.st_mtime_ns, stat.st_size))
+
+        stale = [k for k, (_, sig) in on_disk.items() if k in indexed and indexed[k] != sig]
+        missing = [k for k in on_disk if k not in indexed]
+        orphaned = [k for k in indexed if k not in on_disk]
+        report[user_dir] = {"stale": stale, "missing": missing, "orphaned": orphaned}
+
+        if fix and (stale or missing or orphaned):
+            todo = stale + missing
+            headers = _read_all([on_disk[k][0] for k in todo], workers)
+            with _lock:
+                conn = _connect(user_dir)
+                for key, header in zip(todo, headers):
+                    _store(conn, key, *header)
+                for key in orphaned:
+                    conn.execute("DELETE FROM headers WHERE path = ?", (key,))
+                    conn.execute("DELETE FROM waveforms WHERE path = ?", (key,))
+                conn.commit()
+    return report
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Rebuild or verify the DICOM header index")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="header reader processes (default: CPU count)")
+    parser.add_argument("--fix", action="store_true", help="with verify: reindex stale/missing files")
+    args = parser.parse_args(argv)
+
+    if args.command == "rebuild":
+        count = rebuild(args.data_dir, args.workers)
+        print(f"Indexed {count} files under {args.data_dir}")
+        return 0
+
+    report = verify(args.data_dir, args.fix, args.workers)
+    problems = 0
+    for user_dir, result in report.items():
+        for kind, keys in result.items():
+            for key in keys:
+                print(f"{kind:<9} {os.path.basename(user_dir)}/{key}")
+            problems += len(keys)
+    print(f"{problems} difference(s)" + (", fixed" if args.fix and problems else ""))
+    return 1 if problems and not args.fix else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+# dicom/integrity.py
+# Integrity scanner for the data/ tree.
+#
+# Walks data/<username>/<patientID>/ and validates the five files init_dir
+# creates: the file parses, has the expected Modality and PatientID, SR reports
+# contain every mode/parameter of MODE_PARAMETERS, and every waveform group
+# holds exactly NumberOfWaveformSamples x channels samples.
+#
+# Files are checked in a process pool. Results are cached in
+# data/integrity_cache.json by mtime/size and checksum: unchanged files are not
+# read at all, touched-but-identical files are hashed but not parsed.
+#
+#   python -m dicom.integrity [--data-dir DIR] [--workers N] [--no-cache]
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from pydicom import dcmread
+from pydicom.errors import InvalidDicomError
+
+from params.schema import MODE_PARAMETERS, CHOICES
+from metrics import metrics
+from metrics.metrics import log_event
+
+from .dicom import PATIENT_FILES, LEADS
+
+LOG = metrics.get_logger("integrity")
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+CACHE_NAME = "integrity_cache.json"
+CACHE_VERSION = 1
+
+# Expected Modality and multiplex groups of each file
+MODALITIES = {
+    "PT_INFO_DCM"     : "SR",
+    "BRADY_PARAM_DCM" : "SR",
+    "TEMP_PARAM_DCM"  : "SR",
+    "LEAD_WAVFRM_DCM" : "ECG",
+    "SURFACE_ECG_DCM" : "ECG",
+}
+WAVEFORM_GROUPS = {
+    "LEAD_WAVFRM_DCM" : LEADS,
+    "SURFACE_ECG_DCM" : ("Surface Lead",),
+}
+PARAM_REPORTS = ("BRADY_PARAM_DCM", "TEMP_PARAM_DCM")
+
+
+''' CHECKS '''
+
+# Every mode container and parameter item of a parameter report, with a value of the right kind
+def _check_params(ds):
+    problems = []
+    modes = {}
+    for item in ds.get("ContentSequence", []):
+        try:
+            modes[item.ConceptNameCodeSequence[0].CodeValue] = item
+        except (AttributeError, IndexError):
+            problems.append("content item without a concept name")
+
+    for mode, names in MODE_PARAMETERS.items():
+        item = modes.get(f"BRADY_{mode}")
+        if item is None:
+            problems.append(f"mode {mode} missing")
+            continue
+        params = {}
+        for subitem in item.get("ContentSequence", []):
+            try:
+                params[subitem.ConceptNameCodeSequence[0].CodeMeaning] = subitem
+            except (AttributeError, IndexError):
+                problems.append(f"{mode}: parameter item without a concept name")
+        for name in names:
+            subitem = params.get(name)
+            if subitem is None:
+                problems.append(f"{mode}: parameter '{name}' missing")
+                continue
+            try:
+                mv = subitem.MeasuredValueSequence[0]
+                if name in CHOICES:
+                    mv.TextValue
+                else:
+                    float(mv.NumericValue)
+            except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+                problems.append(f"{mode}: parameter '{name}' has no valid value")
+    return problems
+
+# Declared sample counts and channel definitions against the stored WaveformData
+def _check_waveforms(ds, labels):
+    problems = []
+    groups = {}
+    for item in ds.get("WaveformSequence", []):
+        groups[str(item.get("MultiplexGroupLabel", ""))] = item
+
+    for label in labels:
+        item = groups.get(label)
+        if item is None:
+            problems.append(f"waveform group '{label}' missing")
+            continue
+        try:
+            channels = int(item.NumberOfWaveformChannels)
+            samples = int(item.NumberOfWaveformSamples)
+            bits = int(item.WaveformBitsAllocated)
+        except (AttributeError, TypeError, ValueError):
+            problems.append(f"'{label}': channel/sample counts missing")
+            continue
+        if bits != 16:
+            problems.append(f"'{label}': {bits} bits allocated, expected 16")
+        defined = len(item.get("ChannelDefinitionSequence", []))
+        if defined != channels:
+            problems.append(f"'{label}': {defined} channel definitions for {channels} channels")
+        length = len(item.get("WaveformData", None) or b"")
+        if length != samples * channels * 2:
+            problems.append(f"'{label}': {length} bytes of WaveformData, "
+                            f"declared {samples} samples x {channels} channels")
+    return problems
+
+# Problems found in one patient file (an empty list when it is valid)
+def check_file(filepath, name, patient_id):
+    try:
+        ds = dcmread(filepath)
+    except (InvalidDicomError, OSError, EOFError, ValueError) as e:
+        return [f"unreadable: {e}"]
+
+    problems = []
+    modality = ds.get("Modality", None)
+    if modality != MODALITIES[name]:
+        problems.append(f"Modality is {modality!r}, expected {MODALITIES[name]!r}")
+    if str(ds.get("PatientID", "")) != str(patient_id):
+        problems.append(f"PatientID is {ds.get('PatientID', None)!r}, expected {patient_id!r}")
+
+    try:
+        if name in PARAM_REPORTS:
+            problems += _check_params(ds)
+        if name in WAVEFORM_GROUPS:
+            problems += _check_waveforms(ds, WAVEFORM_GROUPS[name])
+    except Exception as e:  # truncated/garbled elements only fail when their value is decoded
+        problems.append(f"unreadable: {e}")
+    return problems
+
+def _checksum(filepath):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Worker: hash the file, and only parse it when the content differs from the cached checksum
+def _check_job(job):
+    filepath, name, patient_id, known_checksum, known_problems = job
+    checksum = _checksum(filepath)
+    if checksum == known_checksum:
+        return checksum, known_problems, False
+    return checksum, check_file(filepath, name, patient_id), True
+
+
+''' CACHE '''
+
+def _load_cache(cache_path):
+    try:
+        with open(cache_path, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache.get("files", {})
+
+def _save_cache(cache_path, files):
+    tmp = cache_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"version": CACHE_VERSION, "files": files}, f)
+    os.replace(tmp, cache_path)
+
+
+''' SCAN '''
+
+# Expected files of every patient folder: [(key, path, name, patientID)], key is "<username>/<patientID>/<file>"
+def _expected_files(data_dir):
+    found = []
+    for user in sorted(os.listdir(data_dir)):
+        user_dir = os.path.join(data_dir, user)
+        if not os.path.isdir(user_dir):
+            continue
+        for patient_id in sorted(os.listdir(user_dir)):
+            patient_dir = os.path.join(user_dir, patient_id)
+            if not os.path.isdir(patient_dir):
+                continue
+            for name, filename in PATIENT_FILES.items():
+                found.append((f"{user}/{patient_id}/{filename}", os.path.join(patient_dir, filename), name, patient_id))
+    return found
+
+def scan(data_dir=None, workers=None, use_cache=True, progress=None):
+    '''
+    Validate every patient file under data_dir.
+    progress(done, total) is called as files are checked.
+    Returns {"files", "parsed", "cached", "problems": {key: [messages]}}; missing files are reported as ["missing"].
+    '''
+    data_dir = data_dir or DATA_DIR
+    cache_path = os.path.join(data_dir, CACHE_NAME)
+    cache = _load_cache(cache_path) if use_cache else {}
+    begin = time.perf_counter()
+
+    expected = _expected_files(data_dir)
+    results = {}
+    jobs = []
+    for key, path, name, patient_id in expected:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            results[key] = ["missing"]
+            continue
+        entry = cache.get(key)
+        if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            results[key] = entry["problems"]  # unchanged since the last scan, not even hashed
+            continue
+        jobs.append((key, stat, (path, name, patient_id,
+                                 entry["checksum"] if entry else None, entry["problems"] if entry else None)))
+
+    total = len(expected)
+    done = total - len(jobs)
+    if progress:
+        progress(done, total)
+
+    new_cache = {key: entry for key, entry in cache.items() if key in results and results[key] != ["missing"]}
+    parsed = 0
+    if jobs:
+        if workers == 1 or len(jobs) < 2:
+            outcomes = map(_check_job, [job for _, _, job in jobs])
+            pool = None
+        else:
+            # parsing is CPU bound (pydicom), so use processes
+            pool = ProcessPoolExecutor(max_workers=workers)
+            outcomes = pool.map(_check_job, [job for _, _, job in jobs], chunksize=4)
+        try:
+            for (key, stat, _), (checksum, problems, was_parsed) in zip(jobs, outcomes):
+                results[key] = problems
+                parsed += was_parsed
+                new_cache[key] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+                                  "checksum": checksum, "problems": problems}
+                done += 1
+                if progress:
+                    progress(done, total)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    if use_cache:
+        _save_cache(cache_path, new_cache)
+
+    problems = {key: msgs for key, msgs in results.items() if msgs}
+    cached = total - parsed - sum(msgs == ["missing"] for msgs in results.values())
+    log_event(LOG, logging.INFO, "integrity_scan", files=total, parsed=parsed, cached=cached,
+              problems=len(problems), seconds=round(time.perf_counter() - begin, 3))
+    return {"files": total, "parsed": parsed, "cached": cached, "problems": dict(sorted(problems.items()))}
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Validate the patient DICOM files under data/")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="checker processes (default: CPU count)")
+    parser.add_argument("--no-cache", action="store_true", help="re-check every file and leave the cache untouched")
+    args = parser.parse_args(argv)
+
+    def show(done, total):
+        if sys.stderr.isatty():
+            sys.stderr.write(f"\rChecked {done}/{total} files")
+            sys.stderr.flush()
+
+    result = scan(args.data_dir, args.workers, use_cache=not args.no_cache, progress=show)
+    if sys.stderr.isatty():
+        sys.stderr.write("\n")
+    for key, messages in result["problems"].items():
+        for message in messages:
+            print(f"{key}: {message}")
+    print(f"{result['files']} files, {result['parsed']} parsed, {result['cached']} from cache, "
+          f"{len(result['problems'])} with problems")
+    return 1 if result["problems"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+# dicom/param_history.py
+# Append-only history of committed parameter changes for one patient.
+#
+# The brady/temp SR files only hold the current values. Every save records the
+# parameters that changed as a delta line in <patient>/parameter_history.jsonl:
+#   {"t": <unix time>, "u": user, "s": "BRADY"|"TEMP", "m": mode, "k": parameter, "old": ..., "new": ...}
+# and every SNAPSHOT_EVERY deltas a full copy of the values:
+#   {"t": <unix time>, "count": <deltas before it>, "state": {set: {mode: {parameter: value}}}}
+# The first line is always a snapshot of the values when the history started.
+# A line torn by a crash mid-write is cut off when the log is next opened, so
+# later changes are appended on lines of their own.
+#
+# Values as of a time T are rebuilt from the last snapshot before T plus at most
+# SNAPSHOT_EVERY deltas, found with a binary search over the timestamps.
+#
+#   python -m dicom.param_history <log>                      list every change
+#   python -m dicom.param_history <log> --at 2025-01-31T12:00
+#   python -m dicom.param_history <log> --diff 2025-01-01 2025-02-01
+import os
+import sys
+import copy
+import json
+import time
+import bisect
+import threading
+import datetime
+from collections import namedtuple
+
+# Deltas between two stored snapshots
+SNAPSHOT_EVERY = 100
+
+Delta = namedtuple("Delta", ["t", "user", "param_set", "mode", "key", "old", "new"])
+
+
+class ParameterHistory:
+    def __init__(self, path, initial=None, snapshot_every=SNAPSHOT_EVERY):
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self._lock = threading.Lock()
+        self._times = []         # timestamp of each delta (non-decreasing)
+        self._deltas = []
+        self._snapshot_counts = []  # number of deltas applied before each snapshot
+        self._snapshots = []
+        self._state = {}
+        self._line_open = False  # the log's last line has no newline yet
+
+        if os.path.exists(path):
+            self._load()
+        if not self._snapshots:
+            # new history: the current values are the starting point
+            self._state = copy.deepcopy(initial or {})
+            self._write_snapshot(time.time())
+
+    ''' LOADING '''
+    def _load(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        offset = kept = 0  # kept: end of the last complete entry
+        for line in data.splitlines(keepends=True):
+            offset += len(line)
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # torn or corrupt line, the entries after it still count
+            kept = offset
+            if "state" in entry:
+                self._state = entry["state"]
+                self._snapshot_counts.append(len(self._deltas))
+                self._snapshots.append(copy.deepcopy(entry["state"]))
+            else:
+                delta = Delta(entry["t"], entry["u"], entry["s"], entry["m"], entry["k"], entry["old"], entry["new"])
+                self._times.append(delta.t)
+                self._deltas.append(delta)
+                self._apply(self._state, delta)
+        if kept < len(data):
+            # torn write at the end of the log: drop it so the next append starts a fresh line
+            with open(self.path, "r+b") as f:
+                f.truncate(kept)
+        self._line_open = kept > 0 and not data[:kept].endswith(b"\n")
+
+    ''' WRITING '''
+    @staticmethod
+    def _apply(state, delta):
+        state.setdefault(delta.param_set, {}).setdefault(delta.mode, {})[delta.key] = delta.new
+
+    def _append(self, entries):
+        with open(self.path, "a") as f:
+            if self._line_open:
+                f.write("\n")
+                self._line_open = False
+            for entry in entries:
+                f.write(json.dumps(entry, separators=(",", ":")))
+                f.write("\n")
+
+    def _write_snapshot(self, t):
+        self._append([{"t": t, "count": len(self._deltas), "state": self._state}])
+        self._snapshot_counts.append(len(self._deltas))
+        self._snapshots.append(copy.deepcopy(self._state))
+
+    # Record the committed values of one mode; changes is {parameter: (old, new)}, unchanged ones are skipped
+    def record(self, user, param_set, mode, changes, t=None):
+        with self._lock:
+            t = time.time() if t is None else t
+            if self._times and t < self._times[-1]:
+                t = self._times[-1]  # keep the timestamps sorted if the clock steps back
+            deltas = [Delta(t, user, param_set, mode, key, old, new)
+                      for key, (old, new) in changes.items() if old != new]
+            if not deltas:
+                return 0
+
+            self._append([{"t": d.t, "u": d.user, "s": d.param_set, "m": d.mode, "k": d.key,
+                           "old": d.old, "new": d.new} for d in deltas])
+            for delta in deltas:
+                self._times.append(delta.t)
+                self._deltas.append(delta)
+                self._apply(self._state, delta)
+            if len(self._deltas) - self._snapshot_counts[-1] >= self.snapshot_every:
+                self._write_snapshot(t)
+            return len(deltas)
+
+    ''' QUERIES '''
+    def __len__(self):
+        return len(self._deltas)
+
+    @property
+    def current(self):
+        return copy.deepcopy(self._state)
+
+    # Values after the first `count` deltas
+    def _state_after(self, count):
+        i = bisect.bisect_right(self._snapshot_counts, count) - 1
+        state = copy.deepcopy(self._snapshots[i])
+        for delta in self._deltas[self._snapshot_counts[i]:count]:
+            self._apply(state, delta)
+        return state
+
+    def values_at(self, t):
+        """Every parameter value as of time t: {param_set: {mode: {parameter: value}}}."""
+        with self._lock:
+            return self._state_after(bisect.bisect_right(self._times, t))
+
+    def diff(self, t1, t2):
+        """Parameters whose value differs between t1 and t2: {(param_set, mode, parameter): (value at t1, value at t2)}."""
+        with self._lock:
+            before = self._state_after(bisect.bisect_right(self._times, t1))
+            after = self._state_after(bisect.bisect_right(self._times, t2))
+        changed = {}
+        for param_set in before.keys() | after.keys():
+            for mode in before.get(param_set, {}).keys() | after.get(param_set, {}).keys():
+                old = before.get(param_set, {}).get(mode, {})
+                new = after.get(param_set, {}).get(mode, {})
+                for key in old.keys() | new.keys():
+                    if old.get(key) != new.get(key):
+                        changed[(param_set, mode, key)] = (old.get(key), new.get(key))
+        return changed
+
+    def changes(self, start=None, end=None):
+        """Deltas recorded in [start, end)."""
+        with self._lock:
+            lo = 0 if start is None else bisect.bisect_left(self._times, start)
+            hi = len(self._times) if end is None else bisect.bisect_left(self._times, end)
+            return self._deltas[lo:hi]
+
+
+def _timestamp(text):
+    return datetime.datetime.fromisoformat(text).timestamp()
+
+def _format_time(t):
+    return datetime.datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M:%S")
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Inspect a patient's parameter change history")
+    parser.add_argument("log")
+    parser.add_argument("--at", help="print every value as of this ISO time")
+    parser.add_argument("--diff", nargs=2, metavar=("FROM", "TO"), help="print the values that differ between two ISO times")
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.log):
+        parser.error(f"{args.log} does not exist")
+
+    history = ParameterHistory(args.log)
+    if args.at:
+        for param_set, modes in sorted(history.values_at(_timestamp(args.at)).items()):
+            for mode, params in sorted(modes.items()):
+                for key, value in params.items():
+                    print(f"{param_set:<6} {mode:<5} {key:<24} {value}")
+    elif args.diff:
+        for (param_set, mode, key), (old, new) in sorted(history.diff(*map(_timestamp, args.diff)).items()):
+            print(f"{param_set:<6} {mode:<5} {key:<24} {old} -> {new}")
+    else:
+        for d in history.changes():
+            print(f"{_format_time(d.t)} {d.user:<12} {d.param_set:<6} {d.mode:<5} {d.key:<24} {d.old} -> {d.new}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# dicom/patients.py
+# Patient provisioning shared by the patient selection screen and the headless
+# service: the per-user patients.json registry, patient IDs, and the initial
+# demographics, example waveforms and default parameters of a new patient.
+import os
+import json
+import random
+
+import numpy as np
+
+from . import header_index
+from .dicom import PATIENT_FILES, INITIALIZERS, set_parameters, put_parameters, put_multiplex_waveform
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # project root
+DEFAULT_PARAMS_FILE = os.path.join(BASE_DIR, "data", "default_params.json")
+
+
+''' REGISTRY '''
+
+def user_dir(username):
+    return os.path.join(BASE_DIR, "data", username)
+
+# Load patients.json of a user ({"patients": [{"patientID", "name", "birthdate", "sex"}]})
+def load_patients(patients_file):
+    if os.path.exists(patients_file):
+        with open(patients_file, "r") as f:
+            return json.load(f)
+    return {"patients": []}
+
+def save_patients(patients_file, patients_data):
+    with open(patients_file, "w") as f:
+        json.dump(patients_data, f, indent=2)
+
+# Registered patients of a user with their demographics from the header index, in registry order.
+# A patient missing from the index (files written before it existed) is indexed from a header-only
+# read of its patient_info.dcm; one whose files are gone keeps its patients.json entry.
+def list_patients(username):
+    directory = user_dir(username)
+    registered = load_patients(os.path.join(directory, "patients.json"))["patients"]
+    indexed = {p["patientID"]: p for p in header_index.list_patients(directory)}
+    missing = [p["patientID"] for p in registered if p["patientID"] not in indexed]
+    for patient_id in missing:
+        header_index.refresh(os.path.join(directory, patient_id, PATIENT_FILES["PT_INFO_DCM"]))
+    if missing:
+        indexed = {p["patientID"]: p for p in header_index.list_patients(directory)}
+    patients = []
+    for entry in registered:
+        patient = indexed.get(entry["patientID"])
+        if patient is None:
+            patients.append(entry)
+            continue
+        birthdate = patient["birthdate"]
+        if len(birthdate) == 8:  # DICOM DA (YYYYMMDD)
+            birthdate = f"{birthdate[:4]}-{birthdate[4:6]}-{birthdate[6:]}"
+        patients.append(dict(patient, birthdate=birthdate))
+    return patients
+
+# Helper function to generate unique patient ID
+def generate_patient_id(existing_ids):
+    while True:
+        pid = str(random.randint(10000, 99999))
+        if pid not in existing_ids:
+            return pid
+
+
+''' NEW PATIENT FILES '''
+
+# Default parameters of every mode ({mode: {parameter: value}}), as given to a new patient
+def load_default_parameters():
+    with open(DEFAULT_PARAMS_FILE, "r") as f:
+        return json.load(f)
+
+# Create the DICOM files of a new patient (paths from dicom.patient_paths): each template is filled
+# in with the demographics, example waveforms and default parameters in memory, then written and indexed once
+def write_patient_files(paths, patient_id, name, birthdate, sex):
+    defaults = load_default_parameters()
+    for file, path in paths.items():
+        ds = INITIALIZERS[file](patient_id, path, save=False)
+        ds.PatientName = name
+        ds.PatientID = patient_id
+        if file == "PT_INFO_DCM":
+            ds.PatientSex = sex
+            ds.PatientBirthDate = birthdate.replace("-", "")
+        # Example Waveform Data
+        elif file == "LEAD_WAVFRM_DCM":
+            put_multiplex_waveform(ds, "Atrial Lead", np.sin(np.linspace(0, 4 * np.pi, 500)))
+            put_multiplex_waveform(ds, "Ventricular Lead", np.sin(np.linspace(0, 8 * np.pi, 500)))
+        elif file == "SURFACE_ECG_DCM":
+            # (500 samples, 12 leads), each lead phase shifted
+            t = np.linspace(0, 2 * np.pi, 500)[:, None]
+            put_multiplex_waveform(ds, "Surface Lead", np.sin(t + np.arange(12) * np.pi / 6))
+        elif file in ("BRADY_PARAM_DCM", "TEMP_PARAM_DCM"):
+            for mode, params in defaults.items():
+                put_parameters(ds, mode, params)
+        # written like the templates themselves (dicom_init), the creation date/time is already now
+        ds.save_as(path, enforce_file_format=True)
+        header_index.on_save(path, ds)
+
+# Reset the parameter files of an existing patient to the defaults, one read and save per mode and file
+# (write_patient_files already writes new patients with them)
+def default_parameters(paths):
+    for mode, params in load_default_parameters().items():
+        set_parameters(paths["BRADY_PARAM_DCM"], mode, params)
+        set_parameters(paths["TEMP_PARAM_DCM"], mode, params)
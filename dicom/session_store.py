@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import logging
+import threading
+
+from metrics import metrics
+from metrics.metrics import log_event
+
+from .dicom import get_all_parameters
+
+LOG = metrics.get_logger("session_store")
+
+# Journal entries appended before the cache is compacted back into one snapshot
+COMPACT_AFTER = 200
+
+# In-memory parameter state for one Basic Text SR file (brady or temp), mirrored
+# into a compact JSON-lines cache next to the patient's DICOM files.
+#
+# Cache layout:
+#   line 1   : {"mtime": <DICOM st_mtime_ns>, "data": {mode: {parameter: value}}}
+#   line 2.. : {"m": mode, "k": parameter, "v": value}  (changed parameter)
+#              {"mtime": <DICOM st_mtime_ns>}           (DICOM saved with these values)
+#
+# The cache is only trusted while the recorded mtime matches the DICOM file,
+# otherwise it is rebuilt from a single read of the DICOM file.
+class SessionStore:
+    def __init__(self, cache_path, dicom_path, delay=0.5):
+        self.cache_path = cache_path
+        self.dicom_path = dicom_path
+        self.delay = delay  # seconds of quiet before dirty keys are flushed
+
+        self._lock = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._dirty = {}          # (mode, parameter) -> value waiting to be written
+        self._saved = {}          # values as they currently stand in the cache file
+        self._pending_mtime = None
+        self._deadline = None
+        self._closed = False
+        self._journal_len = 0
+        self._cache_mtime = None
+
+        self.data = self._load()
+        self._saved = json.loads(json.dumps(self.data))
+
+        self._writer = threading.Thread(target=self._run, name="SessionStoreWriter", daemon=True)
+        self._writer.start()
+
+    ''' LOADING '''
+    def _dicom_mtime(self):
+        return os.stat(self.dicom_path).st_mtime_ns
+
+    def _read_cache(self):
+        with open(self.cache_path, "r") as f:
+            lines = f.read().splitlines()
+        header = json.loads(lines[0])
+        data, mtime = header["data"], header["mtime"]
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break  # torn write at the end of the journal, ignore the rest
+            if "mtime" in entry:
+                mtime = entry["mtime"]
+            else:
+                data.setdefault(entry["m"], {})[entry["k"]] = entry["v"]
+        self._journal_len = len(lines) - 1
+        return data, mtime
+
+    def _load(self):
+        if os.path.exists(self.cache_path):
+            try:
+                data, mtime = self._read_cache()
+                if mtime == self._dicom_mtime():
+                    self._cache_mtime = mtime
+                    return data
+            except (OSError, ValueError, KeyError, IndexError, TypeError):
+                pass  # missing, stale format or corrupt cache, rebuild below
+
+        # Rebuild from the DICOM file (one parse for every mode)
+        data = get_all_parameters(self.dicom_path)
+        for params in data.values():
+            for param, value in params.items():
+                if value is None:
+                    params[param] = ""
+        self._write_snapshot(data, self._dicom_mtime())
+        return data
+
+    ''' WRITING '''
+    def _write_snapshot(self, data, mtime):
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"mtime": mtime, "data": data}, f, separators=(",", ":"))
+            f.write("\n")
+        os.replace(tmp_path, self.cache_path)
+        self._journal_len = 0
+        self._cache_mtime = mtime
+
+    def _append(self, entries):
+        with open(self.cache_path, "a") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, separators=(",", ":")))
+                f.write("\n")
+                if "mtime" in entry:
+                    self._cache_mtime = entry["mtime"]
+        self._journal_len += len(entries)
+
+    def _take_pending(self):
+        # must be called with self._lock held
+        entries = [{"m": mode, "k": key, "v": value} for (mode, key), value in self._dirty.items()]
+        for (mode, key), value in self._dirty.items():
+            self._saved.setdefault(mode, {})[key] = value
+        if self._pending_mtime is not None:
+            entries.append({"mtime": self._pending_mtime})
+        self._dirty = {}
+        self._pending_mtime = None
+        self._deadline = None
+        return entries
+
+    def _write(self, entries):
+        if not entries:
+            return
+        with self._io_lock:
+            if self._journal_len + len(entries) > COMPACT_AFTER:
+                with self._lock:
+                    data = json.loads(json.dumps(self._saved))
+                mtime = next((e["mtime"] for e in reversed(entries) if "mtime" in e), self._cache_mtime)
+                self._write_snapshot(data, mtime)
+            else:
+                self._append(entries)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._closed and (self._deadline is None or self._deadline > time.monotonic()):
+                    timeout = None if self._deadline is None else self._deadline - time.monotonic()
+                    self._lock.wait(timeout)
+                if self._closed:
+                    return
+                entries = self._take_pending()
+            try:
+                self._write(entries)
+            except OSError as e:
+                log_event(LOG, logging.ERROR, "session_cache_write_failed", path=self.cache_path, error=str(e))
+
+    ''' PUBLIC INTERFACE '''
+    def get(self, mode):
+        return self.data.setdefault(mode, {})
+
+    def set(self, mode, parameter, value):
+        with self._lock:
+            self.data.setdefault(mode, {})[parameter] = value
+            # only parameters that differ from the cache file are journaled
+            if self._saved.get(mode, {}).get(parameter) == value:
+                self._dirty.pop((mode, parameter), None)
+                return
+            self._dirty[(mode, parameter)] = value
+            self._deadline = time.monotonic() + self.delay
+            self._lock.notify()
+
+    # Record that the DICOM file now holds the in-memory values
+    def mark_synced(self):
+        with self._lock:
+            self._pending_mtime = self._dicom_mtime()
+            self._deadline = time.monotonic() + self.delay
+            self._lock.notify()
+
+    # Write any pending changes immediately
+    def flush(self):
+        with self._lock:
+            entries = self._take_pending()
+        self._write(entries)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._lock.notify()
+        self._writer.join()
+        self.flush()
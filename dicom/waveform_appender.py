@@ -0,0 +1,186 @@
+# dicom/waveform_appender.py
+# Append sample blocks to a waveform multiplex group in place, without
+# re-serializing the file.
+#
+# The file is rewritten once when the appender opens it. The target group is
+# moved to the end of the WaveformSequence, and the sequence and its last item
+# are switched to undefined length. The file then ends with
+#   ... (5400,1010) OW <len> <samples> | item delimiter | sequence delimiter
+# A checkpoint writes the pending samples over the two delimiters, writes the
+# delimiters again after them, and patches the WaveformData length and
+# NumberOfWaveformSamples. Its cost depends on the block size only, and the
+# file is a valid DICOM after every checkpoint.
+#
+# Appended blocks are stored at the group's channel sensitivities (mV per count):
+# samples already in the group keep their scale.
+import os
+import struct
+
+import numpy as np
+from pydicom import dcmread
+
+from analysis.egram import to_counts
+
+from . import header_index
+from .dicom import save_dicom, _waveform_group, _channel_sensitivity, _set_channel_sensitivity
+
+DELIMITERS = bytes.fromhex("feff0de000000000" "feffdde000000000")  # item + sequence delimitation
+WAVEFORM_DATA_HEADER = bytes.fromhex("00541010") + b"OW\x00\x00"      # (5400,1010) OW, then the 4-byte length
+SAMPLES_HEADER = bytes.fromhex("3a001000") + b"UL\x04\x00"           # (003A,0010) UL, length 4
+MAX_LENGTH = 0xFFFFFFFE
+
+
+class WaveformAppender:
+    '''
+    Streams int16 samples into one multiplex group of an ECG waveform file.
+    Only one appender per file; other writers must not save the file while it is open.
+    sensitivity (mV per count, one value or one per channel) is only taken for a group holding
+    no samples yet; for one that does, it must match the stored sensitivities.
+    '''
+
+    def __init__(self, filepath, label, checkpoint_samples=1000, fsync=False, sensitivity=None):
+        self.filepath = filepath
+        self.label = label
+        self.sensitivity = sensitivity
+        self.checkpoint_samples = checkpoint_samples
+        self.fsync = fsync
+        self._pending = []
+        self._pending_samples = 0
+
+        self._prepare()
+        self._file = open(filepath, "r+b")
+
+    ''' SETUP '''
+    def _prepare(self):
+        ds = dcmread(self.filepath)
+
+        # validation
+        if ds.Modality != "ECG":
+            raise TypeError("File is not an ECG Waveform")
+
+        group = _waveform_group(ds, self.label)
+        last = len(ds.WaveformSequence) - 1
+        if group != last:
+            self._move_group_last(ds, group)
+
+        seq = ds.WaveformSequence[last]
+        self.channels = int(seq.NumberOfWaveformChannels)
+        data = seq.WaveformData or b""
+        seq.WaveformData = data
+        seq.NumberOfWaveformSamples = len(data) // (2 * self.channels)
+        self.sensitivities = self._sensitivities(seq, bool(data))
+        for ch, sensitivity in zip(seq.ChannelDefinitionSequence, self.sensitivities):
+            _set_channel_sensitivity(ch, sensitivity)
+        ds["WaveformSequence"].is_undefined_length = True
+        seq.is_undefined_length_sequence_item = True
+        save_dicom(ds, self.filepath)
+
+        self.samples = int(seq.NumberOfWaveformSamples)
+        self._locate(len(data))
+
+    # Sensitivity of each channel: the stored one, or the requested one for an empty group
+    def _sensitivities(self, seq, has_samples):
+        stored = np.array([_channel_sensitivity(ch) for ch in seq.ChannelDefinitionSequence])
+        if self.sensitivity is None:
+            return stored
+        try:
+            requested = np.broadcast_to(np.asarray(self.sensitivity, dtype=float), stored.shape)
+        except ValueError:
+            raise ValueError(f"'{self.label}' has {self.channels} channels, got {np.size(self.sensitivity)} sensitivities")
+        if not np.all(requested > 0):
+            raise ValueError(f"Channel sensitivity must be positive, got {self.sensitivity}")
+        if has_samples and not np.allclose(requested, stored, rtol=1e-9, atol=0):
+            raise ValueError(f"'{self.label}' stores samples at {stored.tolist()} mV per count, "
+                             f"not {requested.tolist()}")
+        return requested.copy()
+
+    # Move a group to the end of the WaveformSequence, keeping annotation references
+    def _move_group_last(self, ds, group):
+        items = list(ds.WaveformSequence)
+        order = [i for i in range(len(items)) if i != group] + [group]
+        new_index = {old: new for new, old in enumerate(order)}
+        ds.WaveformSequence = [items[i] for i in order]
+        for item in ds.get("WaveformAnnotationSequence", []):
+            refs = list(item.ReferencedWaveformChannels)
+            refs[0] = new_index[int(refs[0]) - 1] + 1
+            item.ReferencedWaveformChannels = refs
+
+    # Find the byte offsets of the WaveformData length and NumberOfWaveformSamples value
+    def _locate(self, data_length):
+        with open(self.filepath, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            self._data_end = size - len(DELIMITERS)
+            header = self._data_end - data_length - len(WAVEFORM_DATA_HEADER) - 4
+            f.seek(header)
+            head = f.read(len(WAVEFORM_DATA_HEADER) + 4)
+            f.seek(self._data_end)
+            tail = f.read()
+            if head[:len(WAVEFORM_DATA_HEADER)] != WAVEFORM_DATA_HEADER or tail != DELIMITERS:
+                raise ValueError(f"Unexpected layout at the end of {self.filepath}")
+            self._length_offset = header + len(WAVEFORM_DATA_HEADER)
+
+            # the group's NumberOfWaveformSamples is the last one before its WaveformData
+            f.seek(0)
+            found = f.read(header).rfind(SAMPLES_HEADER)
+            if found < 0:
+                raise ValueError(f"NumberOfWaveformSamples not found in {self.filepath}")
+            self._samples_offset = found + len(SAMPLES_HEADER)
+            f.seek(self._samples_offset)
+            if struct.unpack("<I", f.read(4))[0] != self.samples:
+                raise ValueError(f"NumberOfWaveformSamples mismatch in {self.filepath}")
+        self._data_length = data_length
+
+    ''' APPEND '''
+    def append(self, block):
+        """Queue a (samples, channels) block, or 1-D for single-channel groups; float input is mV."""
+        block = np.asarray(block)
+        if block.ndim == 1 and self.channels == 1:
+            block = block.reshape(-1, 1)
+        if block.ndim != 2 or block.shape[1] != self.channels:
+            raise ValueError(f"'{self.label}' has {self.channels} channels, got data of shape {block.shape}")
+        counts = to_counts(block, self.sensitivities)
+
+        self._pending.append(np.ascontiguousarray(counts, dtype="<i2").tobytes())
+        self._pending_samples += counts.shape[0]
+        if self._pending_samples >= self.checkpoint_samples:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Write the pending samples and patch the lengths, leaving a valid file."""
+        if not self._pending:
+            return
+        data = b"".join(self._pending)
+        length = self._data_length + len(data)
+        if length > MAX_LENGTH:
+            raise ValueError(f"WaveformData of '{self.label}' would exceed the 4 GB element limit")
+
+        f = self._file
+        f.seek(self._data_end)
+        f.write(data)
+        f.write(DELIMITERS)
+        f.seek(self._length_offset)
+        f.write(struct.pack("<I", length))
+        f.seek(self._samples_offset)
+        f.write(struct.pack("<I", self.samples + self._pending_samples))
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+        self._data_end += len(data)
+        self._data_length = length
+        self.samples += self._pending_samples
+        self._pending = []
+        self._pending_samples = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.checkpoint()
+            self._file.close()
+            header_index.refresh(self.filepath)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -1,6 +1,8 @@
 from auth.auth import init_db, check_login, add_user, clear_users
+from metrics.metrics import configure_from_env
 import tkinter as tk
 from tkinter import messagebox
+import multiprocessing
 
 # Attempt to login with entered username and password
 def attempt_login(user, pwd, root):
@@ -41,6 +43,7 @@ def clearing_users():
 
 def main():
     init_db() # initialize users.db
+    configure_from_env() # DCM_METRICS / DCM_METRICS_EXPORT
 
     root = tk.Tk()
     root.title("DCM Login")
@@ -86,4 +89,5 @@ def main():
     root.mainloop()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # frozen builds start the device I/O process from this executable
     main()
\ No newline at end of file
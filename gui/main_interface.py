@@ -2,14 +2,34 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import time
-import json
 import os
+import queue
+from concurrent.futures import Future, CancelledError
 from datetime import datetime
-from dicom.dicom import init_dir, get_parameter, set_parameter, get_ecg_waveform
+from dicom.dicom import init_dir, set_parameters, get_ecg_waveform, get_multiplex_waveform
+from dicom.session_store import SessionStore
+from dicom.param_history import ParameterHistory
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.pyplot as plt
 import numpy as np
 from comm.serial_comm import PacemakerSerial
+from comm import device_process
+from comm.port_discovery import PortWatcher
+from comm.scheduler import CommandScheduler, SchedulerFull, INTERROGATE
+from comm.telemetry_ring import TelemetryRing, MAX_SAMPLES
+from comm.stream_queue import StreamQueue, DROP_OLDEST
+from params import schema
+from analysis.egram import EgramAnalyzer, to_mv
+from metrics import metrics
+from metrics.metrics import log_event
+import logging
+
+LOG = metrics.get_logger("gui")
+RENDER_MS = metrics.histogram("dcm_gui_render_ms", "GUI render time", view="waveform")
+MODE_SWITCH_MS = metrics.histogram("dcm_gui_render_ms", "GUI render time", view="parameters")
+
+# Telemetry indicator (color, text) of each comm.link_monitor state
+LINK_STATE_DISPLAY = {"OK": ("green", "OK"), "DEGRADED": ("orange", "Degraded"), "LOST": ("red", "Lost")}
 
 class ActivityThresholdWrapper:
     """
@@ -40,113 +60,36 @@ class ActivityThresholdWrapper:
 
 class DCMMainInterface:
     
-    # PARAMETER MAPPINGS (GUI <-> Serial Protocol)
-    GUI_TO_SERIAL_MAPPING = {
-        "Lower Rate Limit": "LRL",
-        "Upper Rate Limit": "URL",
-        "Maximum Sensor Rate": "MSR",
-        "Atrial Amplitude": "ATR_PULSE_AMP",
-        "Ventricular Amplitude": "VENT_PULSE_AMP",
-        "Atrial Pulse Width": "ATR_PULSE_WIDTH",
-        "Ventricular Pulse Width": "VENT_PULSE_WIDTH",
-        "Atrial Sensitivity": "ATR_CMP_REF_PWM",
-        "Ventricular Sensitivity": "VENT_CMP_REF_PWM",
-        "ARP": "ARP",
-        "VRP": "VRP",
-        "Reaction Time": "REACTION_TIME",
-        "Response Factor": "RESPONSE_FACTOR",
-        "Recovery Time": "RECOVERY_TIME",
-        "Activity Threshold": "ACTIVITY_THRESHOLD",
-    }
-
-    # Reverse mapping for interrogate (serial -> GUI)
-    SERIAL_TO_GUI_MAPPING = {v: k for k, v in GUI_TO_SERIAL_MAPPING.items()}
+    # PARAMETER MAPPINGS (GUI <-> Serial Protocol), see params/schema.py
+    GUI_TO_SERIAL_MAPPING = schema.GUI_TO_SERIAL_MAPPING
+    SERIAL_TO_GUI_MAPPING = schema.SERIAL_TO_GUI_MAPPING
     
     # Activity Threshold dropdown values
-    # Maps display string to float value for serial protocol
-    ACTIVITY_THRESHOLD_OPTIONS = ["V-Low", "Low", "Med-Low", "Med", "Med-High", "High", "V-High"]
-    ACTIVITY_THRESHOLD_TO_FLOAT = {
-        "V-Low": 1.05,
-        "Low": 1.1,
-        "Med-Low": 1.2,
-        "Med": 1.3,
-        "Med-High": 1.4,
-        "High": 1.5,
-        "V-High": 1.6
-    }
-    FLOAT_TO_ACTIVITY_THRESHOLD = {v: k for k, v in ACTIVITY_THRESHOLD_TO_FLOAT.items()}
-    
-    ''' UNIT CONVERSION CONSTANTS '''
-    
-    # Pulse Width
-    PULSE_WIDTH_MULTIPLIER = 25  # GUI_ms * 25 = serial_value
-    
-    # Sensitivity to PWM conversion
-    SENSITIVITY_PWM_BASE = 25      # PWM value at 0 mV
-    SENSITIVITY_PWM_SCALE = 23     # PWM increase per mV (so 10mV -> 255)
+    ACTIVITY_THRESHOLD_OPTIONS = schema.ACTIVITY_THRESHOLD_OPTIONS
+    ACTIVITY_THRESHOLD_TO_FLOAT = schema.ACTIVITY_THRESHOLD_TO_FLOAT
+    FLOAT_TO_ACTIVITY_THRESHOLD = schema.FLOAT_TO_ACTIVITY_THRESHOLD
     
     # PARAMETER RANGES AND DEFINITIONS
-    PARAMETER_RANGES = {
-        "Lower Rate Limit": (30, 175),
-        "Upper Rate Limit": (50, 175),
-        "Maximum Sensor Rate": (50, 175),
-        "Atrial Amplitude": (0.0, 7.0),
-        "Atrial Pulse Width": (0.05, 1.9),
-        "Ventricular Amplitude": (0.0, 7.0),
-        "Ventricular Pulse Width": (0.05, 1.9),
-        "Atrial Sensitivity": (0.0, 10.0),
-        "Ventricular Sensitivity": (0.0, 10.0),
-        "VRP": (150, 500),
-        "ARP": (150, 500),
-        "PVARP": (150, 500),
-        "Hysteresis": (30, 175),
-        "Rate Smoothing": (0, 25),
-        "Reaction Time": (10, 50),
-        "Response Factor": (1, 16),
-        "Recovery Time": (2, 16),
-    }
-    
-    # Define mode-specific parameters
-    MODE_PARAMETERS = {
-        "AOO" : ["Lower Rate Limit", "Upper Rate Limit", "Atrial Amplitude", "Atrial Pulse Width"],
-        "VOO" : ["Lower Rate Limit", "Upper Rate Limit", "Ventricular Amplitude", "Ventricular Pulse Width"],
-        "AAI" : ["Lower Rate Limit", "Upper Rate Limit", "Atrial Amplitude", "Atrial Pulse Width",
-                "Atrial Sensitivity", "ARP", "PVARP", "Hysteresis", "Rate Smoothing"],
-        "VVI" : ["Lower Rate Limit", "Upper Rate Limit", "Ventricular Amplitude", "Ventricular Pulse Width",
-                "Ventricular Sensitivity", "VRP", "Hysteresis", "Rate Smoothing"],
-        "AOOR": ["Lower Rate Limit", "Upper Rate Limit", "Maximum Sensor Rate", "Atrial Amplitude", "Atrial Pulse Width", 
-                 "Activity Threshold", "Reaction Time", "Response Factor", "Recovery Time"],
-        "VOOR": ["Lower Rate Limit", "Upper Rate Limit", "Maximum Sensor Rate", "Ventricular Amplitude", "Ventricular Pulse Width", 
-                 "Activity Threshold", "Reaction Time", "Response Factor", "Recovery Time"],
-        "AAIR": ["Lower Rate Limit", "Upper Rate Limit", "Maximum Sensor Rate", "Atrial Amplitude", "Atrial Pulse Width",
-                "Atrial Sensitivity", "ARP", "PVARP", "Hysteresis", "Rate Smoothing", 
-                "Activity Threshold", "Reaction Time", "Response Factor", "Recovery Time"],
-        "VVIR": ["Lower Rate Limit", "Upper Rate Limit", "Maximum Sensor Rate", "Ventricular Amplitude", "Ventricular Pulse Width",
-                "Ventricular Sensitivity", "VRP", "Hysteresis", "Rate Smoothing", 
-                "Activity Threshold", "Reaction Time", "Response Factor", "Recovery Time"],
-    }
+    PARAMETER_RANGES = schema.PARAMETER_RANGES
+    MODE_PARAMETERS = schema.MODE_PARAMETERS
+    
+    # Mode-switch latency target for the parameter panel (ms)
+    MODE_SWITCH_TARGET_MS = 10
+    
+    # Egram frames the display may fall behind by before the oldest are dropped
+    DISPLAY_QUEUE_FRAMES = 64
+    
+    # Interval of the Tk poll running work handed over by worker threads (ms)
+    UI_POLL_MS = 20
+    
+    # Interval of the egram polls of an in-process link while streaming (ms)
+    STREAM_POLL_MS = 50
+    
+    # Interval of the link health re-evaluation while streaming (ms)
+    LINK_CHECK_MS = 500
     
     # Parameter display names
-    PARAMETER_LABELS = {
-        "Lower Rate Limit": ("Lower Rate Limit (ppm)", "ppm"),
-        "Upper Rate Limit": ("Upper Rate Limit (ppm)", "ppm"),
-        "Maximum Sensor Rate": ("Maximum Sensor Rate (ppm)", "ppm"),
-        "Atrial Amplitude": ("Atrial Amplitude (V)", "V"),
-        "Atrial Pulse Width": ("Atrial Pulse Width (ms)", "ms"),
-        "Ventricular Amplitude": ("Ventricular Amplitude (V)", "V"),
-        "Ventricular Pulse Width": ("Ventricular Pulse Width (ms)", "ms"),
-        "Atrial Sensitivity": ("Atrial Sensitivity (mV)", "mV"),
-        "Ventricular Sensitivity": ("Ventricular Sensitivity (mV)", "mV"),
-        "VRP": ("VRP (ms)", "ms"),
-        "ARP": ("ARP (ms)", "ms"),
-        "PVARP": ("PVARP (ms)", "ms"),
-        "Hysteresis": ("Hysteresis (ppm)", "ppm"),
-        "Rate Smoothing": ("Rate Smoothing (%)", "%"),
-        "Activity Threshold": ("Activity Threshold", ""),
-        "Reaction Time": ("Reaction Time (s)", "s"),
-        "Response Factor": ("Response Factor", ""),
-        "Recovery Time": ("Recovery Time (min)", "min"),
-    }
+    PARAMETER_LABELS = schema.PARAMETER_LABELS
     
     ''' UNIT CONVERSION METHODS '''
     
@@ -155,92 +98,25 @@ class DCMMainInterface:
         Convert GUI parameter values to serial protocol values.
         Handles unit conversions between human-readable GUI and device protocol.
         """
-        if gui_key == "Activity Threshold":
-            # gui_value is the string like "Med", convert to float
-            if isinstance(gui_value, str):
-                return self.ACTIVITY_THRESHOLD_TO_FLOAT.get(gui_value, 1.3)  # Default Med
-            return float(gui_value)  # Already a float from interrogate
-        
-        if gui_key in ["Atrial Pulse Width", "Ventricular Pulse Width"]:
-            # Convert ms to device units (e.g., 0.4ms -> 10)
-            return int(round(gui_value * self.PULSE_WIDTH_MULTIPLIER))
-        
-        # Sensitivity: GUI is in mV (0-10), serial expects PWM (0-255)
-        if gui_key in ["Atrial Sensitivity", "Ventricular Sensitivity"]:
-            # Linear mapping from mV to PWM
-            # Higher sensitivity (lower mV threshold) = higher PWM value
-            pwm = int(self.SENSITIVITY_PWM_BASE + (gui_value * self.SENSITIVITY_PWM_SCALE))
-            return max(0, min(255, pwm))  # Clamp to valid PWM range
-        
-        # Amplitude: GUI is in V, serial expects float - no conversion needed
-        if gui_key in ["Atrial Amplitude", "Ventricular Amplitude"]:
-            return float(gui_value)
-        
-        # Rate limits, refractory periods: direct integer pass-through
-        if gui_key in ["Lower Rate Limit", "Upper Rate Limit", "Maximum Sensor Rate",
-                       "ARP", "VRP", "Reaction Time", "Recovery Time", "Response Factor"]:
-            return int(gui_value)
-        
-        # Default: return as-is
-        return gui_value
+        if gui_key not in self.GUI_TO_SERIAL_MAPPING:
+            return gui_value
+        return schema.to_serial_value(gui_key, gui_value)
     
     def _convert_serial_to_gui(self, serial_key, serial_value):
         """
         Convert serial protocol values back to GUI display values.
         Reverses the unit conversions for device readback.
         """
-        # Activity Threshold: serial is float, GUI expects string
-        if serial_key == "ACTIVITY_THRESHOLD":
-            # Find closest matching threshold value
-            if serial_value in self.FLOAT_TO_ACTIVITY_THRESHOLD:
-                return self.FLOAT_TO_ACTIVITY_THRESHOLD[serial_value]
-            # Find closest match if exact value not found
-            closest = min(self.FLOAT_TO_ACTIVITY_THRESHOLD.keys(), 
-                         key=lambda x: abs(x - serial_value))
-            return self.FLOAT_TO_ACTIVITY_THRESHOLD[closest]
-        
-        # Pulse Width: serial is integer counts, GUI expects ms
-        if serial_key in ["ATR_PULSE_WIDTH", "VENT_PULSE_WIDTH"]:
-            # Convert device units back to ms
-            return round(serial_value / self.PULSE_WIDTH_MULTIPLIER, 2)
-        
-        # Sensitivity: serial is PWM (0-255), GUI expects mV (0-10)
-        if serial_key in ["ATR_CMP_REF_PWM", "VENT_CMP_REF_PWM"]:
-            # Reverse linear mapping from PWM to mV
-            mv = (serial_value - self.SENSITIVITY_PWM_BASE) / self.SENSITIVITY_PWM_SCALE
-            return round(max(0, min(10, mv)), 2)  # Clamp to valid range
-        
-        # Amplitude: serial is float, GUI expects float - no conversion needed
-        if serial_key in ["ATR_PULSE_AMP", "VENT_PULSE_AMP"]:
-            return round(float(serial_value), 2)
-        
-        # Default: return as-is
-        return serial_value
+        if serial_key not in self.SERIAL_TO_GUI_MAPPING:
+            return serial_value
+        return schema.from_serial_value(serial_key, serial_value)
     
     def _get_serial_defaults(self):
         """
         Get default serial parameter values for parameters not shown in current mode.
         These match the Simulink INIT state defaults.
         """
-        return {
-            "response_type": 1,      # 1 = parameter echo mode, 0 = signal mode
-            "ARP": 250,              # ms
-            "VRP": 320,              # ms
-            "ATR_PULSE_AMP": 3.5,    # V
-            "VENT_PULSE_AMP": 3.5,   # V
-            "ATR_PULSE_WIDTH": 10,   # device units (0.4ms * 25)
-            "VENT_PULSE_WIDTH": 10,  # device units
-            "ATR_CMP_REF_PWM": 90,   # PWM value
-            "VENT_CMP_REF_PWM": 90,  # PWM value
-            "REACTION_TIME": 30,     # seconds
-            "RECOVERY_TIME": 5,      # minutes
-            "FIXED_AV_DELAY": 150,   # ms
-            "RESPONSE_FACTOR": 8,
-            "ACTIVITY_THRESHOLD": 1.3,  # Med (float value)
-            "LRL": 60,               # ppm
-            "URL": 120,              # ppm
-            "MSR": 120,              # ppm
-        }
+        return dict(schema.SERIAL_DEFAULTS)
     
     ''' INITIALIZATION '''
     
@@ -267,8 +143,8 @@ class DCMMainInterface:
         self.paths = init_dir(self.username, self.patientID)
         self.initialize_json_files()
 
-        self.json_path = self.brady_json_path
-        self.current_json_data = self.brady_data if self.current_param_type == "BRADY" else self.temp_data
+        self.current_store = self.brady_store if self.current_param_type == "BRADY" else self.temp_store
+        self.current_json_data = self.current_store.data
         self.current_dcm_path = self.paths["BRADY_PARAM_DCM"] if self.current_param_type == "BRADY" else self.paths["TEMP_PARAM_DCM"]
         
         # Simulated device connection state
@@ -276,52 +152,72 @@ class DCMMainInterface:
         self.connection_status = "Disconnected"
         self.last_device = None
         
-        # Add serial communication
-        self.pacemaker_serial = PacemakerSerial()
+        # Worker threads never call Tk: they queue (fn, args) here and the Tk poll runs them
+        self.ui_events = queue.Queue()
+        
+        # Add serial communication (DCM_DEVICE_PROCESS=1: in a child process, away from plotting and Tk)
+        self.pacemaker_serial = device_process.DeviceProcess() if device_process.enabled() else PacemakerSerial()
+        # Telemetry indicator follows the measured link health
+        self.pacemaker_serial.monitor.on_change = self.on_link_state
+        # Automatic reconnect after the USB link drops
+        self.pacemaker_serial.on_connection = self.on_connection_state
+        # Ports are enumerated in the background and kept up to date on hot-plug
+        self.port_watcher = PortWatcher(on_change=self.on_ports_changed, on_jlink=self.on_jlink_plugged).start()
+        self.pacemaker_serial.port_watcher = self.port_watcher
+        # Programming, interrogation and egram polls share the link through one priority scheduler
+        self.scheduler = CommandScheduler(self.pacemaker_serial).start()
+        # Decoded egram frames are shared with local consumer processes (python -m comm.telemetry_ring)
+        try:
+            self.pacemaker_serial.telemetry = TelemetryRing.create()
+        except OSError as e:
+            log_event(LOG, logging.WARNING, "telemetry_ring_unavailable", error=str(e))
         
         # Flag to prevent multiple rapid button clicks
         self._programming_in_progress = False
         self._interrogating_in_progress = False
         
+        # Called with (mode, elapsed_ms) after each parameter panel update
+        self.mode_switch_hook = self.report_mode_switch
+        
         # Initialize parameters
         self.create_main_interface()
         self.current_parameters = self.load_user_parameters()
 
-        self.atrium_buffer = np.zeros(500)
-        self.vent_buffer = np.zeros(500)
+        self.atrium_buffer = np.zeros(500, dtype=np.int16)  # egram counts, see analysis.egram
+        self.vent_buffer = np.zeros(500, dtype=np.int16)
         
         # IMPORTANT — plot the buffer, NOT a static array
         self.atrium_curve = self.waveformPlot.plot(self.atrium_buffer, pen='r')
         self.vent_curve = self.waveformPlot.plot(self.vent_buffer, pen='b')
 
         self.streaming_enabled = False
+        # Frames waiting for the display: bounded, the oldest go when Tk falls behind
+        self.display_queue = StreamQueue("display", maxsize=self.DISPLAY_QUEUE_FRAMES, policy=DROP_OLDEST)
+        self._display_drain_pending = False
+        self._stream_timer = None
+        self._ring_frame = (np.empty(MAX_SAMPLES, dtype=np.int16), np.empty(MAX_SAMPLES, dtype=np.int16))
+        
+        # Streaming egram analysis (event markers, heart rate)
+        self.egram_analyzer = EgramAnalyzer()
 
+        self.root.after(self.UI_POLL_MS, self.process_ui_events)
+        self.root.after(self.LINK_CHECK_MS, self.check_link_health)
         self.root.mainloop()
 
     def initialize_json_files(self):
-        self.brady_data = self.load_or_create_json(self.brady_json_path, "BRADY_PARAM_DCM")
-        self.temp_data  = self.load_or_create_json(self.temp_json_path, "TEMP_PARAM_DCM")
-
-    def load_or_create_json(self, json_path, dicom_key):
-        # Create or load JSON containing pacing parameters for all modes.
-        if os.path.exists(json_path):
-            # Load existing session
-            with open(json_path, "r") as f:
-               data = json.load(f)
-            return data
-            
-        data = {}
-        # Initialize from DICOM files
-        for mode, params in self.MODE_PARAMETERS.items():
-            data[mode] = {}
-            for param in params:
-                val = get_parameter(self.paths[dicom_key], mode, param)
-                data[mode][param] = val if val is not None else ""
-        
-        with open(json_path, 'w') as f:
-            json.dump(data, f, indent=4)
-        
-        return data
+        # Session state is cached next to the DICOM files and reused while the DICOM is unchanged
+        self.brady_store = SessionStore(self.brady_json_path, self.paths["BRADY_PARAM_DCM"])
+        self.temp_store  = SessionStore(self.temp_json_path, self.paths["TEMP_PARAM_DCM"])
+        self.brady_data = self.brady_store.data
+        self.temp_data  = self.temp_store.data
+        # Every committed change is kept in the patient's parameter history
+        self.history = ParameterHistory(os.path.join(self.patient_dir, "parameter_history.jsonl"),
+                                        initial={"BRADY": self.brady_data, "TEMP": self.temp_data})
+
+    def close_json_files(self):
+        # Flush pending changes and stop the background writers
+        self.brady_store.close()
+        self.temp_store.close()
     
     ''' GUI CREATION METHODS '''
     
@@ -410,6 +306,10 @@ class DCMMainInterface:
         ttk.Label(control_frame, text="Device Operations:", font=("Arial", 9, "bold")).pack(pady=(5,2))
         ttk.Button(control_frame, text="Interrogate Device", command=self.interrogate_device).pack(fill=tk.X, pady=2)
         ttk.Button(control_frame, text="Program Parameters", command=self.program_parameters).pack(fill=tk.X, pady=2)
+        ttk.Button(control_frame, text="Verify Parameters", command=self.verify_parameters).pack(fill=tk.X, pady=2)
+        self.stream_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(control_frame, text="Stream Egrams", variable=self.stream_var,
+                        command=lambda: self.set_streaming(self.stream_var.get())).pack(fill=tk.X, pady=2)
         
         ttk.Separator(control_frame, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=10)
         
@@ -449,8 +349,10 @@ class DCMMainInterface:
         canvas.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
         
-        self.parameter_entries = {}
+        self.parameter_entries = {}   # entries of the current mode
         self.parameter_widgets = {}
+        self.parameter_rows = {}      # widget pool: every row built so far, keyed by parameter
+        self.last_mode_switch_ms = None
         
         # Display parameters for current mode
         self.display_mode_parameters()
@@ -504,85 +406,99 @@ class DCMMainInterface:
     
     def display_mode_parameters(self):
         # Display only parameters relevant to the current mode
-        # Clear existing widgets
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
+        # Rows are built once per parameter and then shown, hidden and re-gridded
+        start = time.perf_counter()
         
-        self.parameter_entries.clear()
-        self.parameter_widgets.clear()
+        # Ensure current_parameters exists
+        if not hasattr(self, "current_parameters") or self.current_parameters is None:
+            self.current_parameters = {}
         
         # Get parameters for current mode
-        mode_params = self.MODE_PARAMETERS.get(self.current_mode, [])
+        mode_params = [p for p in self.MODE_PARAMETERS.get(self.current_mode, []) if p in self.PARAMETER_LABELS]
         
-        # Display each parameter
-        for row, param_key in enumerate(mode_params):
-            if param_key not in self.PARAMETER_LABELS:
-                continue
-                
-            label_text, unit = self.PARAMETER_LABELS[param_key]
+        # Hide rows that are not part of this mode
+        for param_key, row in self.parameter_rows.items():
+            if param_key not in mode_params and row['row'] is not None:
+                for widget in (row['label'], row['entry'], row['range']):
+                    widget.grid_remove()
+                row['row'] = None
+        
+        self.parameter_entries.clear()
+        self.parameter_widgets.clear()
+        
+        # Show each parameter, building its row on first use
+        for row_index, param_key in enumerate(mode_params):
+            row = self.parameter_rows.get(param_key)
+            if row is None:
+                row = self._build_parameter_row(param_key)
+                self.parameter_rows[param_key] = row
             
-            # Create label
-            label = ttk.Label(self.scrollable_frame, text=label_text)
-            label.grid(row=row, column=0, sticky=tk.W, padx=5, pady=5)
+            if row['row'] != row_index:
+                row['label'].grid(row=row_index, column=0, sticky=tk.W, padx=5, pady=5)
+                row['entry'].grid(row=row_index, column=1, padx=5, pady=5)
+                row['range'].grid(row=row_index, column=2, sticky=tk.W, padx=5, pady=5)
+                row['row'] = row_index
             
-            # Ensure current_parameters exists
-            if not hasattr(self, "current_parameters") or self.current_parameters is None:
-                self.current_parameters = {}
+            self.parameter_entries[param_key] = row['wrapper']
+            self.parameter_widgets[param_key] = row
             
-            # for Activity Threshold dropdown
-            if param_key == "Activity Threshold":
-                # Get default value
-                default_value = self.current_parameters.get(param_key, self.get_nominal_value(param_key))
-                if default_value not in self.ACTIVITY_THRESHOLD_OPTIONS:
-                    default_value = "Med"  # Fallback to nominal
-                
-                # Create StringVar and Combobox
-                var = tk.StringVar(value=default_value)
-                dropdown = ttk.Combobox(self.scrollable_frame, textvariable=var,
-                                       values=self.ACTIVITY_THRESHOLD_OPTIONS,
-                                       state="readonly", width=12)
-                dropdown.grid(row=row, column=1, padx=5, pady=5)
-                
+            # Only touch entries whose value actually differs
+            value = self.current_parameters.get(param_key, self.get_nominal_value(param_key))
+            self._set_entry_value(param_key, value)
+        
+        self.last_mode_switch_ms = (time.perf_counter() - start) * 1000
+        if self.mode_switch_hook is not None:
+            self.mode_switch_hook(self.current_mode, self.last_mode_switch_ms)
+    
+    def _build_parameter_row(self, param_key):
+        # Create the label, entry/dropdown and range label for one parameter (not gridded)
+        label_text, unit = self.PARAMETER_LABELS[param_key]
+        label = ttk.Label(self.scrollable_frame, text=label_text)
+        
+        # for Activity Threshold dropdown
+        if param_key == "Activity Threshold":
+            var = tk.StringVar(value="Med")
+            dropdown = ttk.Combobox(self.scrollable_frame, textvariable=var,
+                                   values=self.ACTIVITY_THRESHOLD_OPTIONS,
+                                   state="readonly", width=12)
+            range_label = ttk.Label(self.scrollable_frame, text="[V-Low...V-High]", 
+                                   foreground="gray")
+            return {
+                'label': label,
+                'entry': dropdown,
+                'range': range_label,
+                'var': var,
                 # Store reference (use a wrapper that mimics Entry interface)
-                self.parameter_entries[param_key] = ActivityThresholdWrapper(var, dropdown)
-                
-                # Create range label
-                range_label = ttk.Label(self.scrollable_frame, text="[V-Low...V-High]", 
-                                       foreground="gray")
-                range_label.grid(row=row, column=2, sticky=tk.W, padx=5, pady=5)
-                
-                # Store widgets
-                self.parameter_widgets[param_key] = {
-                    'label': label,
-                    'entry': dropdown,
-                    'range': range_label,
-                    'var': var
-                }
-            else:
-                # Regular numeric entry
-                min_val, max_val = self.PARAMETER_RANGES[param_key]
-                
-                # Create entry
-                entry = ttk.Entry(self.scrollable_frame, width=15)
-                entry.grid(row=row, column=1, padx=5, pady=5)
-
-                # Get default value
-                default_value = self.current_parameters.get(param_key, self.get_nominal_value(param_key))
-                entry.insert(0, str(default_value))
-                
-                self.parameter_entries[param_key] = entry
-                
-                # Create range label
-                range_label = ttk.Label(self.scrollable_frame, text=f"[{min_val}-{max_val}]", 
-                                       foreground="gray")
-                range_label.grid(row=row, column=2, sticky=tk.W, padx=5, pady=5)
-                
-                # Store widgets
-                self.parameter_widgets[param_key] = {
-                    'label': label,
-                    'entry': entry,
-                    'range': range_label
-                }
+                'wrapper': ActivityThresholdWrapper(var, dropdown),
+                'row': None
+            }
+        
+        # Regular numeric entry
+        min_val, max_val = self.PARAMETER_RANGES[param_key]
+        entry = ttk.Entry(self.scrollable_frame, width=15)
+        range_label = ttk.Label(self.scrollable_frame, text=f"[{min_val}-{max_val}]", 
+                               foreground="gray")
+        return {
+            'label': label,
+            'entry': entry,
+            'range': range_label,
+            'wrapper': entry,
+            'row': None
+        }
+    
+    def _set_entry_value(self, param_key, value):
+        # Write a value into a parameter entry only if it changes what is shown
+        entry = self.parameter_entries[param_key]
+        if entry.get() != str(value):
+            entry.delete(0, tk.END)
+            entry.insert(0, str(value))
+    
+    def report_mode_switch(self, mode, elapsed_ms):
+        # Default timing hook for display_mode_parameters
+        MODE_SWITCH_MS.observe(elapsed_ms)
+        if elapsed_ms > self.MODE_SWITCH_TARGET_MS:
+            log_event(LOG, logging.WARNING, "slow_mode_switch", mode=mode,
+                      elapsed_ms=round(elapsed_ms, 2), target_ms=self.MODE_SWITCH_TARGET_MS)
 
     def start_serial_stream(self):
         params = self.build_programming_params()
@@ -611,24 +527,79 @@ class DCMMainInterface:
     
         self.update_waveform_plot() 
 
-    def start_streaming_timer(self):
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.poll_streaming_data)
-        self.timer.start(50)     # 20 Hz update, adjust as needed
+    # Egram streaming on/off. A device process polls frames back to back in its child and publishes them
+    # to the telemetry ring, which Tk reads; an in-process link is polled through the scheduler on the Tk timer.
+    def set_streaming(self, enabled):
+        if enabled == self.streaming_enabled:
+            return
+        ring = self.pacemaker_serial.telemetry
+        process = isinstance(self.pacemaker_serial, device_process.DeviceProcess) and ring is not None
+        if process:
+            command = self.pacemaker_serial.start_streaming if enabled else self.pacemaker_serial.stop_streaming
+            try:
+                self.scheduler.submit(INTERROGATE, command, name="start_streaming" if enabled else "stop_streaming")
+            except SchedulerFull:
+                messagebox.showwarning("Busy", "Device is busy, try again shortly")
+                self.stream_var.set(self.streaming_enabled)
+                return
+        self.streaming_enabled = enabled
+        self.stream_var.set(enabled)
+        if self._stream_timer is not None:
+            self.root.after_cancel(self._stream_timer)
+            self._stream_timer = None
+        if not enabled:
+            return
+        if process:
+            self.display_reader = ring.reader("display")
+            self._stream_timer = self.root.after(self.UI_POLL_MS, self.read_streaming_frames)
+        else:
+            self._stream_timer = self.root.after(self.STREAM_POLL_MS, self.poll_streaming_data)
 
     def poll_streaming_data(self):
         if not self.streaming_enabled:
             return
     
-        # Try to get new samples
-        atrium_vals, vent_vals = serial_comm.get_signals()
-    
-        if atrium_vals is None:
+        # Polls queue behind programming and interrogation; a full stream queue drops the oldest poll
+        self.scheduler.poll_signals().add_done_callback(self.queue_streaming_frame)
+        self._stream_timer = self.root.after(self.STREAM_POLL_MS, self.poll_streaming_data)
+
+    # Tk timer in process mode: move the frames the child published since the last tick to the display
+    def read_streaming_frames(self):
+        if not self.streaming_enabled:
             return
-    
-        # Append 11 samples, remove oldest 11
-        self.atrium_buffer = np.concatenate([self.atrium_buffer[11:], atrium_vals])
-        self.ventricle_buffer = np.concatenate([self.ventricle_buffer[11:], vent_vals])
+        vent, atr = self._ring_frame
+        while True:
+            frame = self.display_reader.read_into(vent, atr)
+            if frame is None:
+                break
+            n = frame[1]
+            self.display_queue.put(vent[:n].copy(), atr[:n].copy(), seq=frame[0])
+        if len(self.display_queue):
+            self.show_streaming_frames()
+        self._stream_timer = self.root.after(self.UI_POLL_MS, self.read_streaming_frames)
+
+    def queue_streaming_frame(self, future):
+        # Called on the scheduler thread: queue the frame and have Tk drain the queue once
+        if future.cancelled() or future.exception() is not None:
+            return
+        ok, signals = future.result()
+        if not ok:
+            return
+        self.display_queue.put(*signals)
+        if not self._display_drain_pending:
+            self._display_drain_pending = True
+            self.run_on_ui(self.show_streaming_frames)
+
+    def show_streaming_frames(self):
+        self._display_drain_pending = False
+        for _, vent_vals, atrium_vals in self.display_queue.drain():
+            # Append the frame's samples, remove as many of the oldest
+            n = len(vent_vals)
+            self.atrium_buffer = np.concatenate([self.atrium_buffer[n:], atrium_vals])
+            self.vent_buffer = np.concatenate([self.vent_buffer[n:], vent_vals])
+        
+            # Detect AS/AP/VS/VP markers and update heart rate
+            self.egram_analyzer.process_frame(vent_vals, atrium_vals)
     
         # Update plot
         self.update_waveform_plot()
@@ -640,11 +611,20 @@ class DCMMainInterface:
             self.vent_curve.setData(self.vent_buffer)
 
     def plot_waveform(self):
+        with RENDER_MS.time():
+            self._plot_waveform()
+
+    def _plot_waveform(self):
         if self.lead_type == "Atrial Lead" or self.lead_type == "Ventricular Lead":
             filepath = self.paths["LEAD_WAVFRM_DCM"]
             data = get_ecg_waveform(filepath, self.lead_type)
         elif self.lead_type == "Surface Lead":
-            # Load both atrial and ventricular waveforms
+            # 12-lead surface ECG when one has been stored
+            surface_path = self.paths.get("SURFACE_ECG_DCM")
+            if surface_path and self._plot_surface_ecg(surface_path):
+                return
+
+            # otherwise overlay the atrial and ventricular waveforms
             atrial_path = self.paths["LEAD_WAVFRM_DCM"]
             ventricular_path = self.paths["LEAD_WAVFRM_DCM"]
 
@@ -716,30 +696,32 @@ class DCMMainInterface:
 
         self.canvas.draw()
     
+    def _plot_surface_ecg(self, filepath):
+        counts, sensitivities, labels = get_multiplex_waveform(filepath, "Surface Lead")
+        if counts.size == 0:
+            return False
+
+        # (samples, leads) in mV, each lead shifted down one row so all 12 plot in a single call
+        data = to_mv(counts, sensitivities)
+        spacing = max(np.ptp(data, axis=0).max(), 0.1) * 1.2
+        offsets = -spacing * np.arange(data.shape[1])
+
+        self.ax.clear()
+        self.ax.plot(data + offsets, color='black', linewidth=0.8)
+        self.ax.set_yticks(offsets)
+        self.ax.set_yticklabels(labels)
+        self.ax.set_title("Surface Lead Waveform")
+        self.ax.set_xlabel("Sample #")
+        self.ax.set_ylim(offsets[-1] - spacing, spacing)
+        self.ax.set_xlim(0, len(data))
+
+        self.canvas.draw()
+        return True
+
     def get_nominal_value(self, param_key):
         
         # Get nominal/default value for a parameter (GUI units)
-        nominal_values = {
-            "Lower Rate Limit": 60,
-            "Upper Rate Limit": 120,
-            "Maximum Sensor Rate": 120,
-            "Atrial Amplitude": 3.5,
-            "Atrial Pulse Width": 0.4,
-            "Ventricular Amplitude": 3.5,
-            "Ventricular Pulse Width": 0.4,
-            "Atrial Sensitivity": 2.5,
-            "Ventricular Sensitivity": 2.5,
-            "VRP": 320,
-            "ARP": 250,
-            "PVARP": 250,
-            "Hysteresis": 60,
-            "Rate Smoothing": 0,
-            "Activity Threshold": "Med",
-            "Reaction Time": 30,
-            "Response Factor": 8,
-            "Recovery Time": 5,
-        }
-        return nominal_values.get(param_key, 0)
+        return schema.NOMINAL_VALUES.get(param_key, 0)
     
     ''' EVENT HANDLERS '''
     
@@ -771,61 +753,25 @@ class DCMMainInterface:
         self.current_param_type = new_type
         if new_type == "BRADY":
             self.current_dcm_path = self.paths["BRADY_PARAM_DCM"]
-            self.json_path = self.brady_json_path
-            self.current_json_data = self.brady_data
+            self.current_store = self.brady_store
         else:
             self.current_dcm_path = self.paths["TEMP_PARAM_DCM"]
-            self.json_path = self.temp_json_path
-            self.current_json_data = self.temp_data
+            self.current_store = self.temp_store
+        self.current_json_data = self.current_store.data
 
         self.current_set_label.config(text=self.current_param_type)
         self.current_parameters = self.current_json_data.get(self.current_mode, {})
         self.load_user_parameters()
-        self.display_mode_parameters()
         messagebox.showinfo("Parameter Set Switched", f"Now editing {new_type} parameters.")
     
     ''' VALIDATION '''
     
     def validate_parameter(self, param_key, value):
-        # Activity Threshold dropdown
-        if param_key == "Activity Threshold":
-            if value in self.ACTIVITY_THRESHOLD_OPTIONS:
-                return True, ""
-            return False, f"Activity Threshold must be one of: {', '.join(self.ACTIVITY_THRESHOLD_OPTIONS)}"
-        
-        try:
-            num_value = float(value)
-            min_val, max_val = self.PARAMETER_RANGES[param_key]
-            
-            if num_value < min_val or num_value > max_val:
-                return False, f"{self.PARAMETER_LABELS[param_key][0]} must be between {min_val} and {max_val}"
-            
-            return True, ""
-        except ValueError:
-            return False, f"{self.PARAMETER_LABELS[param_key][0]} must be a valid number"
+        return schema.validate_parameter(param_key, value)
     
     def validate_all_parameters(self):
-        errors = []
-        
-        for param_key, entry in self.parameter_entries.items():
-            value = entry.get()
-            is_valid, error_msg = self.validate_parameter(param_key, value)
-            
-            if not is_valid:
-                errors.append(error_msg)
-        
-        if not errors:
-            try:
-                if 'Lower Rate Limit' in self.parameter_entries and 'Upper Rate Limit' in self.parameter_entries:
-                    lrl = float(self.parameter_entries['Lower Rate Limit'].get())
-                    url = float(self.parameter_entries['Upper Rate Limit'].get())
-                    
-                    if lrl > url:
-                        errors.append("Lower Rate Limit cannot be greater than Upper Rate Limit")
-            except ValueError:
-                pass
-        
-        return errors
+        values = {param_key: entry.get() for param_key, entry in self.parameter_entries.items()}
+        return schema.validate_parameters(values)
     
     def create_action_buttons(self, parent):
         button_frame = ttk.Frame(parent)
@@ -841,6 +787,7 @@ class DCMMainInterface:
     
     def connect_device(self):
         """Connect to real pacemaker device via serial port"""
+        self.port_watcher.wait_ready(2)  # first enumeration started with the window
         ports = self.pacemaker_serial.list_ports()
         
         if not ports:
@@ -881,19 +828,7 @@ class DCMMainInterface:
             success, result = self.pacemaker_serial.connect(port_name)
             
             if success:
-                self.connected_device = result
-                self.connection_status = "Connected"
-                self.connection_indicator.config(fg="green")
-                self.connection_text.config(text="Connected")
-                self.device_label.config(text=result)
-                self.telemetry_indicator.config(fg="green")
-                self.telemetry_text.config(text="OK")
-                
-                if self.last_device and self.last_device != result:
-                    self.device_warning.config(text="⚠ Different Device!")
-                    self.root.after(5000, lambda: self.device_warning.config(text=""))
-                
-                self.last_device = result
+                self.show_connected(result)
                 port_dialog.destroy()
                 messagebox.showinfo("Connected", f"Connected to device:\n{result}\nPort: {port_name}")
             else:
@@ -905,8 +840,49 @@ class DCMMainInterface:
         ttk.Button(button_frame, text="Connect", command=do_connect).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Cancel", command=port_dialog.destroy).pack(side=tk.LEFT, padx=5)
             
+    def show_connected(self, result):
+        self.connected_device = result
+        self.connection_status = "Connected"
+        self.connection_indicator.config(fg="green")
+        self.connection_text.config(text="Connected")
+        self.device_label.config(text=result)
+        self.telemetry_indicator.config(fg="green")
+        self.telemetry_text.config(text="OK")
+        
+        device = self.pacemaker_serial.device_identity or self.pacemaker_serial.port_name
+        if self.last_device and self.last_device != device:
+            self.device_warning.config(text="⚠ Different Device!")
+            self.root.after(5000, lambda: self.device_warning.config(text=""))
+            # nothing verified on the previous device says anything about this one
+            self.pacemaker_serial.invalidate_state_cache(all_devices=True)
+        
+        self.last_device = device
+        # plugging this device in again connects without asking
+        self.port_watcher.remember(self.pacemaker_serial.device_identity)
+
+    def on_ports_changed(self, added, removed, ports):
+        # Called from the watcher thread: a reconnect waiting for the port can try right away
+        self.pacemaker_serial.notify_port_change()
+
+    def on_jlink_plugged(self, info, known):
+        # Called from the watcher thread: hand over to the Tk event loop
+        self.run_on_ui(self.offer_auto_connect, info, known)
+
+    def offer_auto_connect(self, info, known):
+        if self.connection_status != "Disconnected":
+            return
+        if not known and not messagebox.askyesno("Pacemaker Detected",
+                                                 f"J-Link device plugged in on {info.device}.\nConnect now?"):
+            return
+        success, result = self.pacemaker_serial.connect(info.device)
+        if success:
+            self.show_connected(result)
+        else:
+            messagebox.showerror("Connection Failed", f"Failed to connect to {info.device}:\n{result}")
+
     def disconnect_device(self):
         """Disconnect from pacemaker"""
+        self.scheduler.cancel()
         self.pacemaker_serial.disconnect()
         self.connection_status = "Disconnected"
         self.connected_device = None
@@ -935,6 +911,48 @@ class DCMMainInterface:
             self.telemetry_indicator.config(fg="green")
             self.telemetry_text.config(text="OK")
     
+    def on_link_state(self, old, new, stats):
+        # Called from the thread doing serial I/O: hand the update to the Tk event loop and return
+        self.run_on_ui(self.show_link_state, new, stats)
+
+    def check_link_health(self):
+        # a stream that goes silent records no transactions: re-evaluate the link on a timer
+        self.root.after(self.LINK_CHECK_MS, self.check_link_health)
+        if self.streaming_enabled and self.pacemaker_serial.connected:
+            self.pacemaker_serial.monitor.check()
+
+    def show_link_state(self, state, stats):
+        if self.connection_status != "Connected":
+            return
+        color, text = LINK_STATE_DISPLAY[state]
+        self.telemetry_indicator.config(fg=color)
+        self.telemetry_text.config(text=text if state == "OK" else
+                                   f"{text} ({stats['error_rate']:.0%} errors, p95 {stats['latency_p95_ms']:.0f} ms)")
+
+    def on_connection_state(self, state, info):
+        # Called from the reconnect thread: hand the update to the Tk event loop and return
+        self.run_on_ui(self.show_connection_state, state, info)
+
+    def show_connection_state(self, state, info):
+        if self.connection_status == "Disconnected":
+            return
+        if state == "reconnecting":
+            self.connection_status = "Reconnecting"
+            self.connection_indicator.config(fg="orange")
+            self.connection_text.config(text="Reconnecting...")
+        elif state == "connected":
+            self.connection_status = "Connected"
+            self.connection_indicator.config(fg="green")
+            self.connection_text.config(text=f"Connected (restored in {info['last_recover_ms']:.0f} ms)")
+        else:
+            self.connection_status = "Disconnected"
+            self.connected_device = None
+            self.connection_indicator.config(fg="red")
+            self.connection_text.config(text="Disconnected")
+            self.telemetry_indicator.config(fg="gray")
+            self.telemetry_text.config(text="N/A")
+            messagebox.showerror("Connection Lost", f"Could not reconnect to the device on {info['port']}")
+
     def simulate_different_device(self):
         if self.connection_status != "Connected":
             messagebox.showwarning("Warning", "No device connected")
@@ -950,13 +968,49 @@ class DCMMainInterface:
                               f"Different device detected!\n\nPrevious: {old_device}\nCurrent: {new_device}")
         self.root.after(5000, lambda: self.device_warning.config(text=""))
     
+    ''' WORKER THREAD HANDOVER '''
+    
+    # Run fn(*args) on the Tk thread; callable from any thread, unlike Tk itself
+    def run_on_ui(self, fn, *args):
+        self.ui_events.put((fn, args))
+    
+    def process_ui_events(self):
+        # next poll first: a handler opening a dialog keeps the display running under it
+        self.root.after(self.UI_POLL_MS, self.process_ui_events)
+        while True:
+            try:
+                fn, args = self.ui_events.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                fn(*args)
+            except Exception as e:
+                log_event(LOG, logging.ERROR, "ui_event_failed", handler=getattr(fn, "__name__", repr(fn)),
+                          error=str(e))
+    
+    # Submit a scheduler command without waiting for it: on_done(future) runs on the Tk thread
+    def run_command(self, submit, on_done):
+        try:
+            future = submit()
+        except SchedulerFull as e:
+            future = Future()
+            future.set_exception(e)
+        future.add_done_callback(lambda done: self.run_on_ui(on_done, done))
+        return future
+    
+    # (ok, result, *extra) of a finished command; (False, reason, *extra) when it failed or was cancelled
+    @staticmethod
+    def command_result(done, *extra):
+        if done.cancelled():
+            return (False, "Command cancelled (device disconnected)") + extra
+        error = done.exception()
+        if error is not None:
+            return (False, str(error)) + extra
+        return done.result()
+    
     def interrogate_device(self):
         """Read parameters from connected pacemaker with unit conversion"""
 
-        self.streaming_enabled = False
-        ok, data = self.pacemaker_serial.interrogate_device()
-        self.streaming_enabled = True
-
         if not self.pacemaker_serial.connected:
             messagebox.showwarning("Warning", "Please connect to a device first")
             return
@@ -980,8 +1034,13 @@ class DCMMainInterface:
         progress_bar.start()
         progress.update()
         
+        # runs ahead of any queued egram polls; the result comes back through the Tk poll
+        self.run_command(self.scheduler.interrogate,
+                         lambda done: self.finish_interrogation(progress, progress_bar, done))
+    
+    def finish_interrogation(self, progress, progress_bar, done):
         try:
-            success, result = self.pacemaker_serial.interrogate_device()
+            success, result = self.command_result(done)
             
             progress_bar.stop()
             progress.destroy()
@@ -1012,9 +1071,6 @@ class DCMMainInterface:
     def program_parameters(self):
         """Program parameters to connected pacemaker with unit conversion"""
 
-        self.streaming_enabled = False
-        self.streaming_enabled = True
-
         if not self.pacemaker_serial.connected:
             messagebox.showwarning("Warning", "Please connect to a device first")
             return
@@ -1024,6 +1080,7 @@ class DCMMainInterface:
             return
         self._programming_in_progress = True
         
+        submitted = False
         try:
             # Validate parameters before programming
             errors = self.validate_all_parameters()
@@ -1037,38 +1094,20 @@ class DCMMainInterface:
                                     "This will update the pacemaker settings."):
                 return
             
-            # Start with default serial parameters
-            serial_params = self._get_serial_defaults()
-            
-            # Override with actual GUI values, applying unit conversion
-            for gui_key, entry in self.parameter_entries.items():
-                try:
-                    # Activity Threshold is a string dropdown, not a float
-                    if gui_key == "Activity Threshold":
-                        gui_value = entry.get()  # Returns string like "Med"
-                    else:
-                        gui_value = float(entry.get())
-                    
-                    serial_key = self.GUI_TO_SERIAL_MAPPING.get(gui_key, gui_key)
-                    
-                    # Convert GUI value to serial units
-                    serial_value = self._convert_gui_to_serial(gui_key, gui_value)
-                    serial_params[serial_key] = serial_value
-                    
-                except ValueError:
-                    messagebox.showerror("Error", f"Invalid value for {gui_key}")
-                    return
-            
-            # Debug: Print conversion results (only once)
-            print(f"\n=== Programming {self.current_mode} ===")
+            # Convert the whole GUI parameter set (already validated) to serial units
+            gui_values = {}
             for gui_key, entry in self.parameter_entries.items():
+                # Activity Threshold is a string dropdown, not a float
                 if gui_key == "Activity Threshold":
-                    gui_val = entry.get()
+                    gui_values[gui_key] = entry.get()  # Returns string like "Med"
                 else:
-                    gui_val = float(entry.get())
-                serial_key = self.GUI_TO_SERIAL_MAPPING.get(gui_key, gui_key)
-                serial_val = serial_params.get(serial_key)
-                print(f"  {gui_key}: {gui_val} (GUI) -> {serial_key}: {serial_val} (Serial)")
+                    gui_values[gui_key] = float(entry.get())
+            serial_params = schema.to_serial(gui_values)
+            
+            # Debug: log conversion results
+            log_event(LOG, logging.DEBUG, "program_conversion", mode=self.current_mode,
+                      conversions={gui_key: [gui_val, serial_params[self.GUI_TO_SERIAL_MAPPING[gui_key]]]
+                                   for gui_key, gui_val in gui_values.items() if gui_key in self.GUI_TO_SERIAL_MAPPING})
             
             # Show progress
             progress = tk.Toplevel(self.root)
@@ -1083,14 +1122,44 @@ class DCMMainInterface:
             progress_bar.start()
             progress.update()
             
-            # Send to device
-            success, message = self.pacemaker_serial.program_parameters(self.current_mode, serial_params)
+            # Read the device back first (one transaction) and only send the parameters when it differs:
+            # the readback, not the state cache, decides, so a device that reset or drifted is still programmed
+            mode = self.current_mode
+            self.run_command(lambda: self.scheduler.verify_only(mode, serial_params),
+                             lambda done: self.program_on_mismatch(progress, progress_bar, mode, serial_params, done))
+            submitted = True
+        finally:
+            # stays set while the command runs, finish_programming clears it
+            self._programming_in_progress = submitted
+    
+    # Readback of a Program click: done when the device already holds the parameters, otherwise
+    # send them and read back again (waits at most for the frame in flight, whatever the streaming load)
+    def program_on_mismatch(self, progress, progress_bar, mode, serial_params, done):
+        if done.cancelled() or done.exception() is not None or not done.result()[0]:
+            self.run_command(lambda: self.scheduler.verify(mode, serial_params, force=True),
+                             lambda done: self.finish_programming(progress, progress_bar, done))
+        else:
+            self.finish_programming(progress, progress_bar, done, unchanged=True)
+
+    # Append the sent/read values of mismatching parameters to a result message
+    @staticmethod
+    def format_differences(message, differences):
+        if differences:
+            message += "\n\n" + "\n".join(f"{name}: sent {d['sent']}, read {d['received']}"
+                                          for name, d in differences.items())
+        return message
+
+    def finish_programming(self, progress, progress_bar, done, unchanged=False):
+        try:
+            success, message, differences = self.command_result(done, {})
+            message = self.format_differences(message, differences)
+            if success and unchanged:
+                message = "Device already holds these parameters (verified by readback), nothing sent"
             
             progress_bar.stop()
             progress.destroy()
             
             if success:
-                time.sleep(0.3)
                 messagebox.showinfo("Success",
                                 f"{message}\n\nDevice: {self.connected_device}\nMode: {self.current_mode}")
                 # Auto-save to DCM after successful programming
@@ -1100,6 +1169,42 @@ class DCMMainInterface:
         finally:
             self._programming_in_progress = False
     
+    def verify_parameters(self):
+        """Read the device back and compare it with the displayed parameters, without programming"""
+
+        if not self.pacemaker_serial.connected:
+            messagebox.showwarning("Warning", "Please connect to a device first")
+            return
+        
+        # Shares the flag with programming: a verify and a program of the same panel never overlap
+        if self._programming_in_progress:
+            return
+        
+        errors = self.validate_all_parameters()
+        if errors:
+            messagebox.showerror("Validation Error", "Cannot verify parameters:\n\n" + "\n".join(errors))
+            return
+        self._programming_in_progress = True
+        
+        gui_values = {}
+        for gui_key, entry in self.parameter_entries.items():
+            gui_values[gui_key] = entry.get() if gui_key == "Activity Threshold" else float(entry.get())
+        serial_params = schema.to_serial(gui_values)
+        
+        self.run_command(lambda: self.scheduler.verify_only(self.current_mode, serial_params),
+                         self.finish_verification)
+
+    def finish_verification(self, done):
+        try:
+            success, message, differences = self.command_result(done, {})
+            message = self.format_differences(message, differences)
+            if success:
+                messagebox.showinfo("Verified", f"{message}\n\nDevice: {self.connected_device}\nMode: {self.current_mode}")
+            else:
+                messagebox.showwarning("Verification Failed", message)
+        finally:
+            self._programming_in_progress = False
+    
     ''' PARAMETER MANAGEMENT '''
     
     def reset_to_nominal(self):
@@ -1127,40 +1232,42 @@ class DCMMainInterface:
                                "Cannot save parameters:\n\n" + "\n".join(errors))
             return
 
-        for key, entry in self.parameter_entries.items():
-            try:
-                # Activity Threshold is a string, not a float
-                if key == "Activity Threshold":
-                    value = entry.get()  # String like "Med"
-                else:
-                    value = float(entry.get())
-                self.current_parameters[key] = value
-                self.current_json_data[self.current_mode][key] = value
-                set_parameter(self.current_dcm_path, self.current_mode, key, value)
-            except ValueError:
-                messagebox.showerror("Error", f"Invalid value for {key}")
-                return
-
-        with open(self.json_path, 'w') as f:
-            json.dump(self.current_json_data, f, indent=4)
+        error = self.commit_parameters()
+        if error:
+            messagebox.showerror("Error", error)
+            return
         messagebox.showinfo("Saved", f"Parameters saved to DCM storage for user: {self.username}")
     
     def save_parameters_silent(self):
+        self.commit_parameters()
+    
+    # Write the mode's entries to the DICOM file (one read, one save), the session cache and the history;
+    # returns an error message when an entry is not a number or the file lacks a parameter, and nothing is written
+    def commit_parameters(self):
+        values = {}
         for key, entry in self.parameter_entries.items():
             try:
                 # Activity Threshold is a string, not a float
                 if key == "Activity Threshold":
-                    value = entry.get()  # String like "Med"
+                    values[key] = entry.get()  # String like "Med"
                 else:
-                    value = float(entry.get())
-                self.current_parameters[key] = value
-                self.current_json_data[self.current_mode][key] = value
-                set_parameter(self.current_dcm_path, self.current_mode, key, value)
+                    values[key] = float(entry.get())
             except ValueError:
-                return
+                return f"Invalid value for {key}"
 
-        with open(self.json_path, 'w') as f:
-            json.dump(self.current_json_data, f, indent=4)
+        stored = self.current_store.get(self.current_mode)
+        changes = {key: (stored.get(key), value) for key, value in values.items()}
+        try:
+            set_parameters(self.current_dcm_path, self.current_mode, values)
+        except ValueError as e:
+            log_event(LOG, logging.ERROR, "save_parameters_failed", mode=self.current_mode, error=str(e))
+            return str(e)
+        for key, value in values.items():
+            self.current_parameters[key] = value
+            self.current_store.set(self.current_mode, key, value)
+        self.current_store.mark_synced()
+        self.history.record(self.username, self.current_param_type, self.current_mode, changes)
+        return None
     
     # =============================================================
     # SESSION MANAGEMENT
@@ -1169,26 +1276,31 @@ class DCMMainInterface:
     def logout(self):
         if messagebox.askyesno("Logout", "Logout and return to login screen?"):
             self.save_parameters_silent()
-            for path in [self.brady_json_path, self.temp_json_path]:
-                try:
-                    if os.path.exists(path):
-                        os.remove(path)
-                except Exception as e:
-                    print(f"Could not remove path: {e}")
+            self.close_json_files()
+            self.port_watcher.stop()
+            self.scheduler.stop()
+            self.close_device_link()
 
             self.root.destroy()
             import gui.login
             gui.login.main()
 
+    def close_device_link(self):
+        ring = self.pacemaker_serial.telemetry
+        if isinstance(self.pacemaker_serial, device_process.DeviceProcess):
+            self.pacemaker_serial.close()
+        elif ring is not None:
+            self.pacemaker_serial.telemetry = None
+        if ring is not None:
+            ring.close()
+
     def back_to_patient_selection(self):
         if messagebox.askyesno("Return", "Return to patient selection? Unsaved changes will be lost."):
             self.save_parameters_silent()
-            for path in [self.brady_json_path, self.temp_json_path]:
-                try:
-                    if os.path.exists(path):
-                        os.remove(path)
-                except Exception as e:
-                    print(f"Could not remove path: {e}")
+            self.close_json_files()
+            self.port_watcher.stop()
+            self.scheduler.stop()
+            self.close_device_link()
 
             self.root.destroy()
             main_root = tk.Tk()
@@ -1200,10 +1312,9 @@ class DCMMainInterface:
         self.root.title(f"PACEMAKER DCM - {self.current_param_type} - User: {self.username}")
         params = {}
 
-        for param, entry in self.parameter_entries.items():
-            entry.delete(0, tk.END)
+        for param in self.parameter_entries:
             entry_value = self.current_json_data.get(self.current_mode, {}).get(param, self.get_nominal_value(param))
-            entry.insert(0, entry_value)
+            self._set_entry_value(param, entry_value)
             params[param] = entry_value
 
         return params
\ No newline at end of file
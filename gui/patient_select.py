@@ -1,30 +1,9 @@
 import tkinter as tk
 from tkinter import messagebox, simpledialog, ttk
 import os
-import json
-import random
-from pydicom import dcmread
-from dicom.dicom import init_dir, save_dicom, set_parameter, set_ecg_waveform
-import numpy as np
-
-# Helper function to generate unique patient ID
-def generate_patient_id(existing_ids):
-    while True:
-        pid = str(random.randint(10000, 99999))
-        if pid not in existing_ids:
-            return pid
-        
-# Set default paramters of
-def default_parameters(paths):
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # project root
-    default_dir = os.path.join(BASE_DIR, "data", "default_params.json")
-    with open(default_dir, "r") as f:
-        default_params = json.load(f)
-
-    for mode, params in default_params.items():
-        for param_name, value in params.items():
-            set_parameter(paths["BRADY_PARAM_DCM"], mode, param_name, value)
-            set_parameter(paths["TEMP_PARAM_DCM"], mode, param_name, value)
+from dicom.dicom import patient_paths
+from dicom import header_index
+from dicom.patients import load_patients, save_patients, list_patients, generate_patient_id, write_patient_files
 
 
 class PatientSelectApp:
@@ -52,6 +31,10 @@ class PatientSelectApp:
         self.listbox.pack(fill="both", expand=True, pady=(0, 15))
         self.listbox.bind("<<ListboxSelect>>", self.on_select)
 
+        # Demographics and stored files of the selected patient, from the header index
+        self.summary_label = tk.Label(main_frame, text="", justify="left", anchor="w")
+        self.summary_label.pack(fill="x")
+
         # Buttons
         button_frame = tk.Frame(main_frame)
         button_frame.pack(pady=(10, 0))
@@ -70,26 +53,23 @@ class PatientSelectApp:
 
     # Load patients from JSON
     def load_patients(self):
-        if os.path.exists(self.patients_file):
-            with open(self.patients_file, "r") as f:
-                self.patients_data = json.load(f)
-        else:
-            self.patients_data = {"patients": []}
+        self.patients_data = load_patients(self.patients_file)
 
     # Save patients to JSON
     def save_patients(self):
-        with open(self.patients_file, "w") as f:
-            json.dump(self.patients_data, f, indent=2)
+        save_patients(self.patients_file, self.patients_data)
 
-    # Refresh the listbox
+    # Refresh the listbox (names from the header index, no DICOM file is opened)
     def refresh_list(self):
+        self.patients = list_patients(self.username)
         self.listbox.delete(0, tk.END)
-        for patient in self.patients_data["patients"]:
+        for patient in self.patients:
             display_name = f"{patient['name']} ({patient['patientID']})"
             self.listbox.insert(tk.END, display_name)
+        self.summary_label.config(text="")
 
         # Disable proceed/remove if no patients
-        if not self.patients_data["patients"]:
+        if not self.patients:
             self.proceed_btn.config(state=tk.DISABLED)
             self.remove_btn.config(state=tk.DISABLED)
         else:
@@ -101,11 +81,18 @@ class PatientSelectApp:
         selection = self.listbox.curselection()
         if selection:
             idx = selection[0]
-            self.selected_patient_id = self.patients_data["patients"][idx]["patientID"]
+            patient = self.patients[idx]
+            self.selected_patient_id = patient["patientID"]
             self.remove_btn.config(state=tk.NORMAL)
+            summary = header_index.patient_summary(self.user_dir, self.selected_patient_id)
+            samples = ", ".join(f"{w['label']}: {w['samples']}" for w in summary["waveforms"])
+            self.summary_label.config(text=f"Born {patient['birthdate']}, {patient['sex']}\n"
+                                           f"{len(summary['files'])} DICOM files"
+                                           + (f"\nSamples - {samples}" if samples else ""))
         else:
             self.selected_patient_id = None
             self.remove_btn.config(state=tk.DISABLED)
+            self.summary_label.config(text="")
 
     # Proceed to main interface
     def proceed(self):
@@ -145,33 +132,13 @@ class PatientSelectApp:
         existing_ids = [p["patientID"] for p in self.patients_data["patients"]]
         patient_id = generate_patient_id(existing_ids)
 
-        # Create patient folder, initialize DICOMs and update patient_info
-        paths = init_dir(self.username, patient_id)
+        # Create patient folder and its DICOMs with the demographics and default parameters filled in
+        paths = patient_paths(self.username, patient_id)
         
         try:
-            for file, path in paths.items():
-                ds = dcmread(path)
-                ds.PatientName = name
-                ds.PatientID = patient_id
-                if file == "PT_INFO_DCM":
-                    ds.PatientSex = sex
-                    ds.PatientBirthDate = birthdate.replace("-", "")
-                # Example Waveform Data
-                elif file == "LEAD_WAVFRM_DCM":
-                    set_ecg_waveform(path, "Atrial Lead", np.sin(np.linspace(0, 4 * np.pi, 500)))
-                    set_ecg_waveform(path, "Ventricular Lead", np.sin(np.linspace(0, 8 * np.pi, 500)))
-                    continue
-                elif file == "SURFACE_ECG_DCM":
-                    set_ecg_waveform(path, "Surface Lead", np.sin(np.linspace(0, 2 * np.pi, 500)))
-                    continue
-                save_dicom(ds, path)
-        except Exception as e:
-            messagebox.showerror("DICOM Error", f"Failed to update patient_info: {e}")
-
-        try:
-            default_parameters(paths)
+            write_patient_files(paths, patient_id, name, birthdate, sex)
         except Exception as e:
-            messagebox.showerror("DICOM Error", f"Failed to update parameters: {e}")
+            messagebox.showerror("DICOM Error", f"Failed to create patient files: {e}")
 
         # Add patient record
         new_patient = {
@@ -196,6 +163,7 @@ class PatientSelectApp:
                 p for p in self.patients_data["patients"] if p["patientID"] != self.selected_patient_id
             ]
             self.save_patients()
+            header_index.remove_patient(self.user_dir, self.selected_patient_id)
             # Remove patient folder
             patient_folder = os.path.join(self.user_dir, self.selected_patient_id)
             if os.path.exists(patient_folder):
@@ -0,0 +1,276 @@
+# metrics/metrics.py
+# Counters, gauges and latency histograms for the device link and the GUI,
+# a snapshot/export API (JSON lines or Prometheus text file) and structured
+# (JSON lines) logging. Everything is off by default; a disabled instrument
+# costs one attribute check per call.
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+
+# Latency histogram bucket upper bounds (ms)
+DEFAULT_BUCKETS_MS = (0.1, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_start")
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe((time.perf_counter() - self._start) * 1000.0)
+        return False
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, registry, name, help, labels):
+        self._registry = registry
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount=1):
+        if self._registry.enabled:
+            self.value += amount
+
+    def _sample(self):
+        return {"value": self.value}
+
+    def _reset(self):
+        self.value = 0
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        if self._registry.enabled:
+            self.value = value
+
+    def dec(self, amount=1):
+        if self._registry.enabled:
+            self.value -= amount
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, labels, buckets=DEFAULT_BUCKETS_MS):
+        self._registry = registry
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._reset()
+
+    def observe(self, value):
+        if self._registry.enabled:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager observing the elapsed time of its block in ms."""
+        if not self._registry.enabled:
+            return _NULL_TIMER
+        return _Timer(self)
+
+    def _sample(self):
+        return {"count": self.count, "sum": self.sum,
+                "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts))}
+
+    def _reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.enabled = False
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._exporter = None
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = cls(self, name, help, dict(labels), **kwargs)
+                self._metrics[key] = metric
+            elif not isinstance(metric, cls):
+                raise TypeError(f"Metric '{name}' already registered as a {metric.kind}")
+            return metric
+
+    ''' INSTRUMENTS (create once, keep a reference on the hot path) '''
+    def counter(self, name, help="", **labels):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help="", **labels):
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS_MS, **labels):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    ''' CONTROL '''
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            for metric in self._metrics.values():
+                metric._reset()
+
+    ''' SNAPSHOT / EXPORT '''
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            "timestamp": time.time(),
+            "metrics": [dict(name=m.name, type=m.kind, help=m.help, labels=m.labels, **m._sample()) for m in metrics],
+        }
+
+    def export_jsonl(self, path):
+        # one snapshot per line, appended
+        with open(path, "a") as f:
+            f.write(json.dumps(self.snapshot(), separators=(",", ":")))
+            f.write("\n")
+
+    def export_prometheus(self, path):
+        # Prometheus text exposition format, replaced atomically for textfile collectors
+        lines = []
+        described = set()
+        for m in self.snapshot()["metrics"]:
+            if m["name"] not in described:
+                described.add(m["name"])
+                if m["help"]:
+                    lines.append(f"# HELP {m['name']} {m['help']}")
+                lines.append(f"# TYPE {m['name']} {m['type']}")
+            if m["type"] == "histogram":
+                cumulative = 0
+                for bound, count in m["buckets"].items():
+                    cumulative += count
+                    lines.append(f"{m['name']}_bucket{_labels(m['labels'], le=bound)} {cumulative}")
+                lines.append(f"{m['name']}_sum{_labels(m['labels'])} {m['sum']}")
+                lines.append(f"{m['name']}_count{_labels(m['labels'])} {m['count']}")
+            else:
+                lines.append(f"{m['name']}{_labels(m['labels'])} {m['value']}")
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+    def start_exporter(self, path, interval=5.0, fmt="prometheus"):
+        """Export to `path` every `interval` seconds from a background thread."""
+        export = self.export_prometheus if fmt == "prometheus" else self.export_jsonl
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    export(path)
+                except OSError as e:
+                    LOG.warning("metrics_export_failed", extra={"fields": {"path": path, "error": str(e)}})
+
+        self.stop_exporter()
+        thread = threading.Thread(target=run, name="MetricsExporter", daemon=True)
+        self._exporter = (thread, stop)
+        thread.start()
+
+    def stop_exporter(self):
+        if self._exporter is not None:
+            thread, stop = self._exporter
+            stop.set()
+            thread.join()
+            self._exporter = None
+
+
+def _labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+''' STRUCTURED LOGGING '''
+
+class JsonLineFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, event and any `fields` passed via extra."""
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, default=str)
+
+
+def get_logger(name):
+    """Logger under the 'dcm' hierarchy, writing JSON lines to stderr by default."""
+    root = logging.getLogger("dcm")
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonLineFormatter())
+        root.addHandler(handler)
+        root.setLevel(os.environ.get("DCM_LOG_LEVEL", "WARNING").upper())
+        root.propagate = False
+    return logging.getLogger(f"dcm.{name}")
+
+
+def log_event(logger, level, event, **fields):
+    """Log `event` with structured fields, skipping all formatting when the level is off."""
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+''' DEFAULT REGISTRY '''
+
+REGISTRY = MetricsRegistry()
+LOG = get_logger("metrics")
+
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+snapshot = REGISTRY.snapshot
+
+
+def configure_from_env():
+    '''
+    DCM_METRICS=1              enable collection
+    DCM_METRICS_EXPORT=<path>  also export every DCM_METRICS_INTERVAL seconds (default 5),
+                               as JSON lines if the path ends in .jsonl, else Prometheus text
+    '''
+    if os.environ.get("DCM_METRICS", "") not in ("", "0"):
+        REGISTRY.enable()
+        path = os.environ.get("DCM_METRICS_EXPORT")
+        if path:
+            fmt = "jsonl" if path.endswith(".jsonl") else "prometheus"
+            REGISTRY.start_exporter(path, float(os.environ.get("DCM_METRICS_INTERVAL", "5")), fmt)
@@ -0,0 +1,406 @@
+# params/schema.py
+# Single source of truth for the programmable parameters: ranges, increments,
+# units, nominal values, serial field, scale/offset and mode membership.
+# Used by the GUI, the serial layer, the DICOM layer and the tests.
+import bisect
+from decimal import Decimal, ROUND_HALF_UP
+from collections import namedtuple
+
+import numpy as np
+
+ParamSpec = namedtuple("ParamSpec", ["name", "unit", "lo", "hi", "increment", "nominal", "serial", "scale", "offset"])
+
+''' UNIT CONVERSION CONSTANTS '''
+
+# Pulse Width
+PULSE_WIDTH_MULTIPLIER = 25    # GUI_ms * 25 = serial_value
+
+# Sensitivity to PWM conversion
+SENSITIVITY_PWM_BASE = 25      # PWM value at 0 mV
+SENSITIVITY_PWM_SCALE = 23     # PWM increase per mV (so 10mV -> 255)
+
+# Activity Threshold dropdown values
+# Maps display string to float value for serial protocol
+ACTIVITY_THRESHOLD_OPTIONS = ["V-Low", "Low", "Med-Low", "Med", "Med-High", "High", "V-High"]
+ACTIVITY_THRESHOLD_TO_FLOAT = {
+    "V-Low": 1.05,
+    "Low": 1.1,
+    "Med-Low": 1.2,
+    "Med": 1.3,
+    "Med-High": 1.4,
+    "High": 1.5,
+    "V-High": 1.6
+}
+FLOAT_TO_ACTIVITY_THRESHOLD = {v: k for k, v in ACTIVITY_THRESHOLD_TO_FLOAT.items()}
+
+''' PARAMETER TABLE '''
+
+# serial value = GUI value * scale + offset (rounded for integer fields)
+PARAMETERS = [
+    #         name                       unit    lo     hi     incr  nominal  serial              scale                   offset
+    ParamSpec("Lower Rate Limit",        "ppm",  30,    175,   1,    60,      "LRL",              1,                      0),
+    ParamSpec("Upper Rate Limit",        "ppm",  50,    175,   1,    120,     "URL",              1,                      0),
+    ParamSpec("Maximum Sensor Rate",     "ppm",  50,    175,   1,    120,     "MSR",              1,                      0),
+    ParamSpec("Atrial Amplitude",        "V",    0.0,   7.0,   0.1,  3.5,     "ATR_PULSE_AMP",    1,                      0),
+    ParamSpec("Ventricular Amplitude",   "V",    0.0,   7.0,   0.1,  3.5,     "VENT_PULSE_AMP",   1,                      0),
+    ParamSpec("Atrial Pulse Width",      "ms",   0.05,  1.9,   0.01, 0.4,     "ATR_PULSE_WIDTH",  PULSE_WIDTH_MULTIPLIER, 0),
+    ParamSpec("Ventricular Pulse Width", "ms",   0.05,  1.9,   0.01, 0.4,     "VENT_PULSE_WIDTH", PULSE_WIDTH_MULTIPLIER, 0),
+    ParamSpec("Atrial Sensitivity",      "mV",   0.0,   10.0,  0.01, 2.5,     "ATR_CMP_REF_PWM",  SENSITIVITY_PWM_SCALE,  SENSITIVITY_PWM_BASE),
+    ParamSpec("Ventricular Sensitivity", "mV",   0.0,   10.0,  0.01, 2.5,     "VENT_CMP_REF_PWM", SENSITIVITY_PWM_SCALE,  SENSITIVITY_PWM_BASE),
+    ParamSpec("ARP",                     "ms",   150,   500,   1,    250,     "ARP",              1,                      0),
+    ParamSpec("VRP",                     "ms",   150,   500,   1,    320,     "VRP",              1,                      0),
+    ParamSpec("PVARP",                   "ms",   150,   500,   1,    250,     None,               None,                   None),
+    ParamSpec("Hysteresis",              "ppm",  30,    175,   1,    60,      None,               None,                   None),
+    ParamSpec("Rate Smoothing",          "%",    0,     25,    1,    0,       None,               None,                   None),
+    ParamSpec("Activity Threshold",      "",     None,  None,  None, "Med",   "ACTIVITY_THRESHOLD", None,                 None),
+    ParamSpec("Reaction Time",           "s",    10,    50,    1,    30,      "REACTION_TIME",    1,                      0),
+    ParamSpec("Response Factor",         "",     1,     16,    1,    8,       "RESPONSE_FACTOR",  1,                      0),
+    ParamSpec("Recovery Time",           "min",  2,     16,    1,    5,       "RECOVERY_TIME",    1,                      0),
+]
+
+# Parameters chosen from a fixed list rather than typed in
+CHOICES = {"Activity Threshold": ACTIVITY_THRESHOLD_TO_FLOAT}
+
+# Define mode-specific parameters
+MODE_PARAMETERS = {
+    "AOO" : ["Lower Rate Limit", "Upper Rate Limit", "Atrial Amplitude", "Atrial Pulse Width"],
+    "VOO" : ["Lower Rate Limit", "Upper Rate Limit", "Ventricular Amplitude", "Ventricular Pulse Width"],
+    "AAI" : ["Lower Rate Limit", "Upper Rate Limit", "Atrial Amplitude", "Atrial Pulse Width",
+            "Atrial Sensitivity", "ARP", "PVARP", "Hysteresis", "Rate Smoothing"],
+    "VVI" : ["Lower Rate Limit", "Upper Rate Limit", "Ventricular Amplitude", "Ventricular Pulse Width",
+            "Ventricular Sensitivity", "VRP", "Hysteresis", "Rate Smoothing"],
+    "AOOR": ["Lower Rate Limit", "Upper Rate Limit", "Maximum Sensor Rate", "Atrial Amplitude", "Atrial Pulse Width",
+             "Activity Threshold", "Reaction Time", "Response Factor", "Recovery Time"],
+    "VOOR": ["Lower Rate Limit", "Upper Rate Limit", "Maximum Sensor Rate", "Ventricular Amplitude", "Ventricular Pulse Width",
+             "Activity Threshold", "Reaction Time", "Response Factor", "Recovery Time"],
+    "AAIR": ["Lower Rate Limit", "Upper Rate Limit", "Maximum Sensor Rate", "Atrial Amplitude", "Atrial Pulse Width",
+            "Atrial Sensitivity", "ARP", "PVARP", "Hysteresis", "Rate Smoothing",
+            "Activity Threshold", "Reaction Time", "Response Factor", "Recovery Time"],
+    "VVIR": ["Lower Rate Limit", "Upper Rate Limit", "Maximum Sensor Rate", "Ventricular Amplitude", "Ventricular Pulse Width",
+            "Ventricular Sensitivity", "VRP", "Hysteresis", "Rate Smoothing",
+            "Activity Threshold", "Reaction Time", "Response Factor", "Recovery Time"],
+}
+
+# Mode codes sent in the MODE byte of the serial packet
+MODE_CODES = {
+    "AOO": 1, "VOO": 2, "AAI": 3, "VVI": 4,
+    "AOOR": 5, "VOOR": 6, "AAIR": 7, "VVIR": 8
+}
+
+# Wire format of every serial field (struct codes, little endian)
+SERIAL_FORMATS = {
+    "response_type": "B",
+    "mode": "B",
+    "ARP": "H",
+    "VRP": "H",
+    "ATR_PULSE_AMP": "f",
+    "VENT_PULSE_AMP": "f",
+    "ATR_PULSE_WIDTH": "H",
+    "VENT_PULSE_WIDTH": "H",
+    "ATR_CMP_REF_PWM": "B",
+    "VENT_CMP_REF_PWM": "B",
+    "REACTION_TIME": "H",
+    "RECOVERY_TIME": "H",
+    "FIXED_AV_DELAY": "B",
+    "RESPONSE_FACTOR": "B",
+    "ACTIVITY_THRESHOLD": "B",
+    "LRL": "B",
+    "URL": "B",
+    "MSR": "B",
+}
+SERIAL_TYPES = {k: float if fmt == "f" else int for k, fmt in SERIAL_FORMATS.items()}
+SERIAL_LIMITS = {"B": (0, 255), "H": (0, 65535)}
+SERIAL_DTYPES = {"B": np.uint8, "H": np.uint16, "f": np.float32}
+
+# Default serial parameter values for parameters not shown in current mode.
+# These match the Simulink INIT state defaults.
+SERIAL_DEFAULTS = {
+    "response_type": 1,      # 1 = parameter echo mode, 0 = signal mode
+    "ARP": 250,              # ms
+    "VRP": 320,              # ms
+    "ATR_PULSE_AMP": 3.5,    # V
+    "VENT_PULSE_AMP": 3.5,   # V
+    "ATR_PULSE_WIDTH": 10,   # device units (0.4ms * 25)
+    "VENT_PULSE_WIDTH": 10,  # device units
+    "ATR_CMP_REF_PWM": 90,   # PWM value
+    "VENT_CMP_REF_PWM": 90,  # PWM value
+    "REACTION_TIME": 30,     # seconds
+    "RECOVERY_TIME": 5,      # minutes
+    "FIXED_AV_DELAY": 150,   # ms
+    "RESPONSE_FACTOR": 8,
+    "ACTIVITY_THRESHOLD": 1.3,  # Med (float value)
+    "LRL": 60,               # ppm
+    "URL": 120,              # ppm
+    "MSR": 120,              # ppm
+}
+
+''' DERIVED LOOKUPS '''
+
+SPECS = {p.name: p for p in PARAMETERS}
+PARAM_UNITS = {p.name: p.unit for p in PARAMETERS}
+PARAMETER_RANGES = {p.name: (p.lo, p.hi) for p in PARAMETERS if p.name not in CHOICES}
+PARAMETER_LABELS = {p.name: (f"{p.name} ({p.unit})" if p.unit else p.name, p.unit) for p in PARAMETERS}
+NOMINAL_VALUES = {p.name: p.nominal for p in PARAMETERS}
+GUI_TO_SERIAL_MAPPING = {p.name: p.serial for p in PARAMETERS if p.serial}
+SERIAL_TO_GUI_MAPPING = {v: k for k, v in GUI_TO_SERIAL_MAPPING.items()}
+
+_THRESHOLD_FLOATS = sorted(FLOAT_TO_ACTIVITY_THRESHOLD)
+_THRESHOLD_ARRAY = np.array(_THRESHOLD_FLOATS)
+
+# Increment tolerance, in units of the increment
+_INCREMENT_TOL = 1e-6
+
+
+def _on_increment(value, increment):
+    steps = value / increment
+    return abs(steps - round(steps)) <= _INCREMENT_TOL
+
+
+def _to_wire(field, raw):
+    # Round and clamp a raw serial value to the field's wire format
+    fmt = SERIAL_FORMATS[field]
+    if fmt == "f":
+        return float(raw)
+    lo, hi = SERIAL_LIMITS[fmt]
+    return max(lo, min(hi, int(round(raw))))
+
+
+def _nearest_threshold(value):
+    # Closest Activity Threshold float (ties go to the lower threshold)
+    i = bisect.bisect_left(_THRESHOLD_FLOATS, value)
+    if i == 0:
+        return _THRESHOLD_FLOATS[0]
+    if i == len(_THRESHOLD_FLOATS):
+        return _THRESHOLD_FLOATS[-1]
+    lower, upper = _THRESHOLD_FLOATS[i - 1], _THRESHOLD_FLOATS[i]
+    return lower if value - lower <= upper - value else upper
+
+''' LOOKUP TABLES '''
+
+# Every legal GUI value of a serial parameter with its wire value, computed once in exact
+# decimal arithmetic (no float drift: 1.1 ms * 25 = 27.5 rounds to 28 like 1.3 ms * 25 = 32.5 -> 33).
+#   values[i] = lo + i * increment, codes[i] = its wire value (float32 for 'f' fields)
+#   decode    = {wire value: canonical GUI value}, the legal value closest to the exact inverse,
+#               so encode(decode[code]) == code for every code in the table
+ParamTable = namedtuple("ParamTable", ["lo", "increment", "values", "codes", "code_array", "decode"])
+
+
+def _build_table(spec):
+    fmt = SERIAL_FORMATS[spec.serial]
+    lo, increment, hi = Decimal(str(spec.lo)), Decimal(str(spec.increment)), Decimal(str(spec.hi))
+    exact = [lo + i * increment for i in range(int((hi - lo) / increment) + 1)]
+    integral = all(v == v.to_integral_value() for v in (lo, increment))
+    values = [int(v) if integral else float(v) for v in exact]
+
+    if fmt == "f":
+        codes = [float(np.float32(v)) for v in values]
+        decode = dict(zip(codes, values))
+    else:
+        wire_lo, wire_hi = SERIAL_LIMITS[fmt]
+        codes = [max(wire_lo, min(wire_hi, int((v * spec.scale + spec.offset).to_integral_value(ROUND_HALF_UP))))
+                 for v in exact]
+        decode, best = {}, {}
+        for value, v, code in zip(values, exact, codes):
+            distance = abs(v - (Decimal(code) - spec.offset) / spec.scale)
+            if code not in best or distance < best[code]:
+                best[code], decode[code] = distance, value
+    return ParamTable(float(spec.lo), float(spec.increment), values, codes,
+                      np.array(codes, dtype=SERIAL_DTYPES[fmt]), decode)
+
+
+TABLES = {p.name: _build_table(p) for p in PARAMETERS if p.serial and p.name not in CHOICES}
+
+
+def _table_index(table, value):
+    # Position of a GUI value in its table, None when it is out of range or off-increment
+    steps = (value - table.lo) / table.increment
+    i = round(steps)
+    if 0 <= i < len(table.codes) and abs(steps - i) <= _INCREMENT_TOL:
+        return i
+    return None
+
+''' VALIDATION '''
+
+def validate_parameter(name, value):
+    label = PARAMETER_LABELS[name][0]
+
+    # Activity Threshold dropdown
+    if name in CHOICES:
+        if isinstance(value, str) and value in CHOICES[name]:
+            return True, ""
+        return False, f"{name} must be one of: {', '.join(CHOICES[name])}"
+
+    spec = SPECS[name]
+    try:
+        num_value = float(value)
+    except (TypeError, ValueError):
+        return False, f"{label} must be a valid number"
+
+    if num_value < spec.lo or num_value > spec.hi:
+        return False, f"{label} must be between {spec.lo} and {spec.hi}"
+    if not _on_increment(num_value, spec.increment):
+        return False, f"{label} must be in increments of {spec.increment}"
+    return True, ""
+
+
+def validate_parameters(values):
+    # Validate a whole {name: value} parameter set, returns a list of error messages
+    errors = []
+    for name, value in values.items():
+        is_valid, error_msg = validate_parameter(name, value)
+        if not is_valid:
+            errors.append(error_msg)
+
+    if not errors and "Lower Rate Limit" in values and "Upper Rate Limit" in values:
+        if float(values["Lower Rate Limit"]) > float(values["Upper Rate Limit"]):
+            errors.append("Lower Rate Limit cannot be greater than Upper Rate Limit")
+    return errors
+
+''' UNIT CONVERSION '''
+
+def mode_code(mode):
+    return MODE_CODES.get(mode, 0)
+
+
+def to_serial_value(name, value):
+    # Convert one GUI value to its serial protocol value
+    spec = SPECS[name]
+    if name in CHOICES:
+        # value is the string like "Med" (or already a float from interrogate)
+        if isinstance(value, str):
+            return CHOICES[name].get(value, SERIAL_DEFAULTS[spec.serial])
+        return float(value)
+    table = TABLES[name]
+    i = _table_index(table, float(value))
+    if i is not None:
+        return table.codes[i]
+    # values validation would reject still get the arithmetic conversion
+    return _to_wire(spec.serial, float(value) * spec.scale + spec.offset)
+
+
+def from_serial_value(field, raw):
+    # Convert one serial protocol value back to its GUI display value
+    name = SERIAL_TO_GUI_MAPPING[field]
+    spec = SPECS[name]
+    if name in CHOICES:
+        return FLOAT_TO_ACTIVITY_THRESHOLD[_nearest_threshold(raw)]
+    value = TABLES[name].decode.get(raw)
+    if value is not None:
+        return value
+    # a code no legal value encodes to
+    if spec.scale == 1 and spec.offset == 0 and SERIAL_TYPES[field] is int:
+        return raw
+    value = (raw - spec.offset) / spec.scale
+    return round(max(spec.lo, min(spec.hi, value)), 2)
+
+
+# Value as the device stores it: float32 for 'f' fields, the encoder's int() for the others
+def wire_value(field, value):
+    if SERIAL_FORMATS[field] == "f":
+        return float(np.float32(value))
+    return int(value)
+
+
+def to_serial(values):
+    # Convert a {GUI name: value} set into a full serial parameter set
+    serial_params = dict(SERIAL_DEFAULTS)
+    for name, value in values.items():
+        spec = SPECS.get(name)
+        if spec is not None and spec.serial:
+            serial_params[spec.serial] = to_serial_value(name, value)
+    return serial_params
+
+
+def from_serial(serial_params):
+    # Convert serial fields with a GUI counterpart into a {GUI name: value} set
+    return {SERIAL_TO_GUI_MAPPING[field]: from_serial_value(field, raw)
+            for field, raw in serial_params.items() if field in SERIAL_TO_GUI_MAPPING}
+
+''' VECTORIZED PATH (parameter sweeps) '''
+
+# Per-mode arrays, columns in MODE_PARAMETERS order
+_COMPILED = {}
+for _mode, _names in MODE_PARAMETERS.items():
+    _specs = [SPECS[n] for n in _names]
+    _COMPILED[_mode] = {
+        "lo": np.array([np.nan if s.name in CHOICES else s.lo for s in _specs], dtype=float),
+        "hi": np.array([np.nan if s.name in CHOICES else s.hi for s in _specs], dtype=float),
+        "inc": np.array([np.nan if s.name in CHOICES else s.increment for s in _specs], dtype=float),
+        "choice": np.array([s.name in CHOICES for s in _specs]),
+        "lrl": _names.index("Lower Rate Limit"),
+        "url": _names.index("Upper Rate Limit"),
+    }
+
+
+def validate_batch(mode, values, chunk_size=1 << 18):
+    '''
+    Validate many candidate parameter sets at once.
+    values is an (n, k) array with columns in MODE_PARAMETERS[mode] order;
+    Activity Threshold columns hold the serial float (e.g. 1.3 for "Med").
+    Returns a boolean mask of the valid rows.
+    '''
+    compiled = _COMPILED[mode]
+    values = np.asarray(values, dtype=float)
+    if values.ndim != 2 or values.shape[1] != len(MODE_PARAMETERS[mode]):
+        raise ValueError(f"Expected an (n, {len(MODE_PARAMETERS[mode])}) array for {mode}")
+
+    numeric = ~compiled["choice"]
+    lo, hi, inc = compiled["lo"][numeric], compiled["hi"][numeric], compiled["inc"][numeric]
+    valid = np.empty(len(values), dtype=bool)
+
+    # chunked so temporaries stay bounded for multi-million row sweeps
+    for start in range(0, len(values), chunk_size):
+        block = values[start:start + chunk_size]
+        nums = block[:, numeric]
+        steps = nums / inc
+        ok = np.all((nums >= lo) & (nums <= hi) & (np.abs(steps - np.rint(steps)) <= _INCREMENT_TOL), axis=1)
+        if compiled["choice"].any():
+            ok &= np.all(np.isin(block[:, compiled["choice"]], _THRESHOLD_ARRAY), axis=1)
+        ok &= block[:, compiled["lrl"]] <= block[:, compiled["url"]]
+        valid[start:start + chunk_size] = ok
+    return valid
+
+
+def _table_lookup(table, column):
+    # Codes of a column of GUI values and the mask of values found in the table (None when all are)
+    steps = column - table.lo
+    steps *= 1 / table.increment
+    index = np.rint(steps)
+    np.subtract(steps, index, out=steps)
+    np.abs(steps, out=steps)
+    if len(index) and index.min() >= 0 and index.max() < len(table.codes) and steps.max() <= _INCREMENT_TOL:
+        return table.code_array.take(index.astype(np.intp)), None
+    on_table = (index >= 0) & (index < len(table.codes)) & (steps <= _INCREMENT_TOL)
+    return table.code_array.take(np.where(on_table, index, 0).astype(np.intp)), on_table
+
+
+def to_serial_batch(mode, values):
+    '''
+    Convert many parameter sets at once.
+    Returns {serial field: array} with the field's wire dtype for every
+    serial field of the mode.
+    '''
+    values = np.asarray(values, dtype=float)
+    fields = {}
+    for col, name in enumerate(MODE_PARAMETERS[mode]):
+        spec = SPECS[name]
+        if not spec.serial:
+            continue
+        fmt = SERIAL_FORMATS[spec.serial]
+        if name in CHOICES:
+            # the encoder truncates the threshold float into its byte
+            raw = np.trunc(values[:, col])
+        elif spec.scale == 1 and spec.offset == 0:
+            raw = values[:, col]  # no arithmetic, already equal to the table's codes
+        else:
+            coded, on_table = _table_lookup(TABLES[name], values[:, col])
+            if on_table is None:
+                fields[spec.serial] = coded
+                continue
+            # off-table values get the arithmetic conversion, as in to_serial_value
+            raw = np.where(on_table, coded, values[:, col] * spec.scale + spec.offset)
+        if fmt != "f":
+            lo, hi = SERIAL_LIMITS[fmt]
+            raw = np.clip(np.rint(raw), lo, hi)
+        fields[spec.serial] = raw.astype(SERIAL_DTYPES[fmt])
+    return fields
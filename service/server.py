@@ -0,0 +1,178 @@
+# service/server.py
+# Local IPC endpoint for the headless DCM service (HTTP + JSON on 127.0.0.1).
+#
+#   POST /login   {"username": ..., "password": ...}  -> {"ok": true, "result": {"token": ...}}
+#   POST /<call>  {keyword arguments}, header X-DCM-Token: <token>
+#                 -> {"ok": bool, "result": ...}
+#
+# Each login gets its own DCMService session (user, patient, parameter stores);
+# all sessions share one DeviceSession, so several clients can drive the same
+# device without interleaving transactions.
+#
+#   python -m service.server [--port 8750]
+#
+#   client = DCMClient("http://127.0.0.1:8750")
+#   client.login("user", "pass"); client.select_patient("12345"); client.program("AAI")
+import sys
+import json
+import secrets
+import logging
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from metrics import metrics
+from metrics.metrics import log_event
+
+from comm.device_process import DeviceProcess
+
+from .service import DCMService, DeviceSession, PatientRegistry
+
+LOG = metrics.get_logger("service_server")
+
+DEFAULT_PORT = 8750
+TOKEN_HEADER = "X-DCM-Token"
+
+# Session methods callable over IPC
+CALLS = ("logout", "list_patients", "add_patient", "select_patient", "get_parameters", "save_parameters",
+         "connect", "disconnect", "status", "program", "interrogate", "verify", "stream")
+
+REQUESTS = metrics.counter("dcm_service_requests_total", "IPC requests handled")
+REQUEST_MS = metrics.histogram("dcm_service_request_ms", "IPC request handling time")
+
+
+class DCMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", DEFAULT_PORT), device=None):
+        super().__init__(address, DCMRequestHandler)
+        self.device = device or DeviceSession()
+        self.patients = PatientRegistry()  # a patient selected by several clients has one set of stores
+        self.sessions = {}  # token -> DCMService
+        self._lock = threading.Lock()
+
+    def login(self, username, password):
+        session = DCMService(self.device, self.patients)
+        ok, message = session.login(username, password)
+        if not ok:
+            return False, message
+        token = secrets.token_hex(16)
+        with self._lock:
+            self.sessions[token] = session
+        return True, {"token": token, "message": message}
+
+    # (status, ok, result): 400 for arguments the call does not take, 500 when it raised
+    def call(self, token, name, kwargs):
+        with self._lock:
+            session = self.sessions.get(token)
+        if session is None:
+            return 200, False, "Not logged in"
+        try:
+            ok, result = getattr(session, name)(**kwargs)
+        except TypeError as e:
+            return 400, False, f"Invalid arguments: {e}"
+        except Exception as e:
+            log_event(LOG, logging.ERROR, "ipc_call_failed", call=name, error=f"{type(e).__name__}: {e}")
+            return 500, False, f"{name} failed: {type(e).__name__}: {e}"
+        if name == "logout":
+            with self._lock:
+                self.sessions.pop(token, None)
+            session.close()
+        return 200, ok, result
+
+    def server_close(self):
+        with self._lock:
+            sessions, self.sessions = list(self.sessions.values()), {}
+        for session in sessions:
+            session.close()
+        super().server_close()
+
+
+class DCMRequestHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        with REQUEST_MS.time():
+            REQUESTS.inc()
+            name = self.path.strip("/")
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                kwargs = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(kwargs, dict):
+                    raise ValueError("Request body must be a JSON object")
+            except ValueError as e:
+                return self._reply(400, False, f"Invalid request: {e}")
+
+            if name == "login":
+                ok, result = self.server.login(kwargs.get("username"), kwargs.get("password"))
+                return self._reply(200, ok, result)
+            if name not in CALLS:
+                return self._reply(404, False, f"Unknown call {name}")
+            return self._reply(*self.server.call(self.headers.get(TOKEN_HEADER), name, kwargs))
+
+    def _reply(self, status, ok, result):
+        body = json.dumps({"ok": ok, "result": result}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log_event(LOG, logging.DEBUG, "ipc_request", request=format % args)
+
+
+class DCMClient:
+    ''' Client of a DCMServer: client.<call>(**kwargs) returns (ok, result) like DCMService '''
+
+    def __init__(self, url=f"http://127.0.0.1:{DEFAULT_PORT}", timeout=30):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.token = None
+
+    def _post(self, name, kwargs):
+        request = urllib.request.Request(f"{self.url}/{name}", data=json.dumps(kwargs).encode(), method="POST",
+                                         headers={"Content-Type": "application/json", TOKEN_HEADER: self.token or ""})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                reply = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            reply = json.loads(e.read())
+        return reply["ok"], reply["result"]
+
+    def login(self, username, password):
+        ok, result = self._post("login", {"username": username, "password": password})
+        if not ok:
+            return False, result
+        self.token = result["token"]
+        return True, result["message"]
+
+    def __getattr__(self, name):
+        if name not in CALLS:
+            raise AttributeError(name)
+        return lambda **kwargs: self._post(name, kwargs)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the headless DCM service on a local port")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--device-process", action="store_true",
+                        help="run the serial session in a supervised child process")
+    args = parser.parse_args(argv)
+
+    metrics.configure_from_env()
+    link = DeviceProcess() if args.device_process else None
+    server = DCMServer(("127.0.0.1", args.port), device=DeviceSession(link))
+    print(f"DCM service listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.device.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
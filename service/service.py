@@ -0,0 +1,450 @@
+# service/service.py
+# Headless DCM: the login, patient, parameter and device operations of the GUI
+# as a Python API, for scripted test rigs and the local IPC server (server.py).
+#
+# Every public method returns (ok, result), with an error message as the result
+# when ok is False. A DeviceSession owns the serial link and serializes its
+# transactions by priority (comm.scheduler), so several DCMService sessions
+# (one per client) can share it.
+import os
+import re
+import time
+import logging
+import threading
+from concurrent.futures import CancelledError
+
+import numpy as np
+
+from auth import auth
+from params import schema
+from comm.serial_comm import PacemakerSerial
+from comm.device_process import DeviceProcess, enabled as device_process_enabled
+from comm.scheduler import CommandScheduler, SchedulerFull, PROGRAM
+from comm.telemetry_ring import TelemetryRing
+from dicom import header_index
+from dicom.dicom import init_dir, patient_paths, set_parameters
+from dicom.patients import (user_dir, load_patients, save_patients, list_patients, generate_patient_id,
+                            write_patient_files)
+from dicom.session_store import SessionStore
+from dicom.param_history import ParameterHistory
+from metrics import metrics
+from metrics.metrics import log_event
+
+LOG = metrics.get_logger("service")
+
+PARAM_SETS = ("BRADY", "TEMP")
+STREAM_TIMEOUT_S = 5.0   # longest wait for the frames of one stream call from the telemetry ring
+RING_POLL_S = 0.005
+
+
+class DeviceSession:
+    ''' The pacemaker link shared by every client, driven through one priority command scheduler '''
+
+    # Without a link: a PacemakerSerial, run in a child process when DCM_DEVICE_PROCESS=1.
+    # A device process streams into a telemetry ring (the link's own, or one created here).
+    def __init__(self, link=None):
+        self.link = link or (DeviceProcess() if device_process_enabled() else PacemakerSerial())
+        self.scheduler = CommandScheduler(self.link).start()
+        self.ring = None
+        self._own_ring = False
+        self._streams = 0
+        self._stream_lock = threading.Lock()
+        if isinstance(self.link, DeviceProcess):
+            self.ring = self.link.telemetry
+            if self.ring is None:
+                try:
+                    self.ring = self.link.telemetry = TelemetryRing.create()
+                    self._own_ring = True
+                except OSError as e:
+                    log_event(LOG, logging.WARNING, "telemetry_ring_unavailable", error=str(e))
+
+    # negotiate: switch to the fastest link the firmware supports after connecting
+    def connect(self, port=None, baudrate=115200, negotiate=False):
+        return self.scheduler.submit(PROGRAM, self._connect, port, baudrate, negotiate, name="connect").result()
+
+    def _connect(self, port, baudrate, negotiate):
+        port = port or self.link.find_jlink_port()
+        if port is None:
+            return False, "No JLink port found"
+        ok, msg = self.link.connect(port, baudrate)
+        if ok and negotiate:
+            ok, msg = self.link.negotiate_link()
+        return bool(ok), msg
+
+    # Commands other clients still have queued fail with "Device disconnected"
+    def disconnect(self):
+        self.scheduler.cancel(error=ConnectionError("Device disconnected"))
+        self.scheduler.submit(PROGRAM, self.link.disconnect, name="disconnect").result()
+        return True, "Disconnected"
+
+    def close(self):
+        self.disconnect()
+        self.scheduler.stop()
+        if isinstance(self.link, DeviceProcess):
+            self.link.close()
+        if self._own_ring:
+            self.ring.close()
+
+    def status(self):
+        return True, {"connected": bool(self.link.connected),
+                      "port": self.link.port_name,
+                      "recording": self.link.recorder is not None,
+                      "link": self.link.link_info(),
+                      "health": self.link.monitor.stats(),
+                      "reconnect": dict(self.link.reconnect_stats),
+                      "verified": self.link.cached_state() is not None,
+                      "pending": self.scheduler.pending()}
+
+    # Run a scheduler command: (result, None), or (None, message) when not connected, its queue is full,
+    # or it was cancelled or failed by a disconnect
+    def _run(self, command, *args):
+        if not self.link.connected:
+            return None, "Device not connected"
+        try:
+            return command(*args).result(), None
+        except CancelledError:
+            return None, "Command cancelled"
+        except (SchedulerFull, ConnectionError) as e:
+            return None, str(e)
+
+    def program(self, mode, serial_params):
+        result, error = self._run(self.scheduler.program, mode, serial_params)
+        return (False, error) if error else result
+
+    def interrogate(self):
+        result, error = self._run(self.scheduler.interrogate)
+        if error:
+            return False, error
+        ok, result = result
+        if not ok:
+            return False, result
+        return True, {"mode": result.get("mode"), "parameters": schema.from_serial(result)}
+
+    # program=False: only read back and compare
+    def verify(self, mode, serial_params, program=True):
+        command = self.scheduler.verify if program else self.scheduler.verify_only
+        result, error = self._run(command, mode, serial_params)
+        if error:
+            return False, error
+        ok, message, differences = result
+        return ok, {"message": message, "differences": differences}
+
+    # One stream poll per frame, so programming from another client gets in between frames.
+    # A device process instead polls back to back while any client streams; frames come from the ring.
+    def stream(self, frames=1):
+        if not isinstance(frames, int) or frames < 1:
+            return False, "frames must be a positive integer"
+        if not self.link.connected:
+            return False, "Device not connected"
+        if self.ring is not None:
+            return self._stream_ring(frames)
+        vent, atr = [], []
+        for _ in range(frames):
+            ok, signals = self._poll()
+            if not ok:
+                return False, signals if isinstance(signals, str) else "Incomplete data"
+            vent += signals[0].tolist()
+            atr += signals[1].tolist()
+        return True, {"vent": vent, "atr": atr}
+
+    def _stream_ring(self, frames):
+        reader = self.ring.reader("service")
+        with self._stream_lock:
+            if self._streams == 0:
+                ok, msg = self.link.start_streaming()
+                if not ok:
+                    return False, msg
+            self._streams += 1
+        try:
+            vent, atr = [], []
+            vent_frame = np.empty(self.ring.max_samples, dtype=np.int16)
+            atr_frame = np.empty(self.ring.max_samples, dtype=np.int16)
+            deadline = time.monotonic() + STREAM_TIMEOUT_S
+            while reader.frames < frames:
+                frame = reader.read_into(vent_frame, atr_frame)
+                if frame is None:
+                    if not self.link.connected:
+                        return False, "Device not connected"
+                    if time.monotonic() > deadline:
+                        return False, "Incomplete data"
+                    time.sleep(RING_POLL_S)
+                    continue
+                n = frame[1]
+                vent += vent_frame[:n].tolist()
+                atr += atr_frame[:n].tolist()
+            return True, {"vent": vent, "atr": atr}
+        finally:
+            with self._stream_lock:
+                self._streams -= 1
+                if self._streams == 0:
+                    self.link.stop_streaming()
+
+    # One egram frame; a poll dropped from the full stream queue by other clients' polls is sent again
+    def _poll(self):
+        while True:
+            try:
+                return self.scheduler.poll_signals().result()
+            except CancelledError:
+                if not self.link.connected:
+                    return False, "Device not connected"
+            except ConnectionError as e:
+                return False, str(e)
+
+
+class OpenPatient:
+    ''' Parameter stores and history of a selected patient, shared by every session that selected it '''
+
+    def __init__(self, paths):
+        patient_dir = os.path.dirname(paths["PT_INFO_DCM"])
+        # same session caches and history as the main interface
+        self.stores = {
+            "BRADY": SessionStore(os.path.join(patient_dir, "brady_params.json"), paths["BRADY_PARAM_DCM"]),
+            "TEMP": SessionStore(os.path.join(patient_dir, "temp_params.json"), paths["TEMP_PARAM_DCM"]),
+        }
+        self.history = ParameterHistory(os.path.join(patient_dir, "parameter_history.jsonl"),
+                                        initial={name: store.data for name, store in self.stores.items()})
+        self.lock = threading.RLock()  # one save (DICOM, stores, history) at a time
+        self.sessions = 0
+
+    def close(self):
+        for store in self.stores.values():
+            store.close()
+
+
+class PatientRegistry:
+    ''' The open patients by directory: a patient's files are cached once, however many sessions select it '''
+
+    def __init__(self):
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def open(self, paths):
+        key = os.path.dirname(paths["PT_INFO_DCM"])
+        with self._lock:
+            patient = self._open.get(key)
+            if patient is None:
+                patient = self._open[key] = OpenPatient(paths)
+            patient.sessions += 1
+        return patient
+
+    # The last session to release a patient closes its stores
+    def release(self, patient):
+        with self._lock:
+            patient.sessions -= 1
+            if patient.sessions > 0:
+                return
+            for key, open_patient in list(self._open.items()):
+                if open_patient is patient:
+                    del self._open[key]
+        patient.close()
+
+
+class DCMService:
+    ''' One client's session: logged in user, selected patient and its parameter stores '''
+
+    # patients: registry shared with other sessions (DCMServer), so they see each other's saves
+    def __init__(self, device=None, patients=None):
+        self.device = device or DeviceSession()
+        self.patients = patients or PatientRegistry()
+        self.username = None
+        self.patient_id = None
+        self.paths = None
+        self.patient = None
+        self.stores = {}
+        self.history = None
+        self._lock = threading.RLock()
+
+    ''' ACCOUNT '''
+    def register(self, username, password):
+        if not isinstance(username, str) or not isinstance(password, str) or not username or not password:
+            return False, "Invalid credentials"
+        try:
+            auth.init_db()
+            auth.add_user(username, password)
+        except ValueError as e:
+            return False, str(e)
+        return True, f"{username} registered"
+
+    def login(self, username, password):
+        auth.init_db()
+        if not isinstance(username, str) or not isinstance(password, str):
+            return False, "Invalid credentials"
+        if not username or not password or not auth.check_login(username, password):
+            log_event(LOG, logging.WARNING, "login_failed", username=username)
+            return False, "Invalid credentials"
+        with self._lock:
+            self._close_patient()
+            self.username = username
+        return True, f"Logged in as {username}"
+
+    def logout(self):
+        with self._lock:
+            self._close_patient()
+            self.username = None
+        return True, "Logged out"
+
+    ''' PATIENTS '''
+    def _patients_file(self):
+        return os.path.join(user_dir(self.username), "patients.json")
+
+    def _check(self, patient=True):
+        if self.username is None:
+            return "Not logged in"
+        if patient and self.patient_id is None:
+            return "No patient selected"
+        return None
+
+    def list_patients(self):
+        error = self._check(patient=False)
+        if error:
+            return False, error
+        return True, list_patients(self.username)
+
+    def add_patient(self, name, birthdate, sex):
+        error = self._check(patient=False)
+        if error:
+            return False, error
+        if not all(isinstance(value, str) for value in (name, birthdate, sex)):
+            return False, "Name, birthdate and sex must be strings"
+        birthdate, sex = birthdate.strip(), sex.strip().upper()
+        if not name:
+            return False, "Patient name is required"
+        if not re.match(r"\d{4}-\d{2}-\d{2}$", birthdate):
+            return False, "Birthdate must be in YYYY-MM-DD format"
+        if sex not in ("M", "F"):
+            return False, "Sex must be 'M' or 'F'"
+
+        with self._lock:
+            os.makedirs(user_dir(self.username), exist_ok=True)
+            patients_data = load_patients(self._patients_file())
+            patient_id = generate_patient_id([p["patientID"] for p in patients_data["patients"]])
+            paths = patient_paths(self.username, patient_id)
+            try:
+                write_patient_files(paths, patient_id, name, birthdate, sex)
+            except (OSError, ValueError, TypeError) as e:
+                return False, f"Failed to create patient files: {e}"
+            patients_data["patients"].append({"patientID": patient_id, "name": name, "birthdate": birthdate, "sex": sex})
+            save_patients(self._patients_file(), patients_data)
+        return True, patient_id
+
+    def select_patient(self, patient_id):
+        error = self._check(patient=False)
+        if error:
+            return False, error
+        patient_id = str(patient_id)
+        if patient_id not in (p["patientID"] for p in load_patients(self._patients_file())["patients"]):
+            return False, f"Unknown patient {patient_id}"
+
+        with self._lock:
+            self._close_patient()
+            self.paths = init_dir(self.username, patient_id)
+            self.patient = self.patients.open(self.paths)
+            self.stores = self.patient.stores
+            self.history = self.patient.history
+            self.patient_id = patient_id
+        return True, header_index.patient_summary(user_dir(self.username), patient_id)
+
+    def _close_patient(self):
+        if self.patient is not None:
+            self.patients.release(self.patient)
+        self.patient = None
+        self.stores = {}
+        self.history = None
+        self.paths = None
+        self.patient_id = None
+
+    ''' PARAMETERS '''
+    def _mode_values(self, mode, param_set, values=None):
+        # Stored values of a mode, overridden by `values`; (values, error)
+        if not isinstance(param_set, str) or param_set not in PARAM_SETS:
+            return None, f"Unknown parameter set {param_set}"
+        if not isinstance(mode, str) or mode not in schema.MODE_PARAMETERS:
+            return None, f"Unknown mode {mode}"
+        if values is not None and not isinstance(values, dict):
+            return None, "Parameter values must be a {name: value} object"
+        stored = self.stores[param_set].get(mode)
+        merged = {name: stored.get(name, schema.NOMINAL_VALUES[name]) for name in schema.MODE_PARAMETERS[mode]}
+        for name, value in (values or {}).items():
+            if name not in merged:
+                return None, f"'{name}' is not a {mode} parameter"
+            merged[name] = value
+        errors = schema.validate_parameters(merged)
+        if errors:
+            return None, "; ".join(errors)
+        return {name: value if name in schema.CHOICES else float(value) for name, value in merged.items()}, None
+
+    def get_parameters(self, mode, param_set="BRADY"):
+        error = self._check()
+        if error:
+            return False, error
+        with self._lock, self.patient.lock:
+            values, error = self._mode_values(mode, param_set)
+        return (False, error) if error else (True, values)
+
+    def save_parameters(self, mode, values, param_set="BRADY"):
+        error = self._check()
+        if error:
+            return False, error
+        with self._lock, self.patient.lock:
+            merged, error = self._mode_values(mode, param_set, values)
+            if error:
+                return False, error
+            store = self.stores[param_set]
+            changes = {name: (store.get(mode).get(name), value) for name, value in merged.items()}
+            set_parameters(self.paths[f"{param_set}_PARAM_DCM"], mode, merged)
+            for name, value in merged.items():
+                store.set(mode, name, value)
+            store.mark_synced()
+            self.history.record(self.username, param_set, mode, changes)
+        return True, merged
+
+    ''' DEVICE '''
+    def connect(self, port=None, baudrate=115200, negotiate=False):
+        return self.device.connect(port, baudrate, negotiate)
+
+    def disconnect(self):
+        return self.device.disconnect()
+
+    def status(self):
+        ok, status = self.device.status()
+        status.update(username=self.username, patient_id=self.patient_id)
+        return ok, status
+
+    # Program the stored parameters of a mode (overridden by `values`), saving them when the device accepts them
+    def program(self, mode, values=None, param_set="BRADY", save=True):
+        error = self._check()
+        if error:
+            return False, error
+        with self._lock:
+            merged, error = self._mode_values(mode, param_set, values)
+        if error:
+            return False, error
+        start = time.perf_counter()
+        ok, message = self.device.program(mode, schema.to_serial(merged))
+        log_event(LOG, logging.INFO, "service_program", mode=mode, ok=ok,
+                  ms=round((time.perf_counter() - start) * 1000, 1))
+        if ok and save:
+            self.save_parameters(mode, merged, param_set)
+        return ok, message
+
+    def interrogate(self):
+        return self.device.interrogate()
+
+    # Program then read back and compare (echo test); program=False only reads back and compares
+    def verify(self, mode, values=None, param_set="BRADY", program=True):
+        error = self._check()
+        if error:
+            return False, error
+        with self._lock:
+            merged, error = self._mode_values(mode, param_set, values)
+        if error:
+            return False, error
+        return self.device.verify(mode, schema.to_serial(merged), program)
+
+    def stream(self, frames=1):
+        return self.device.stream(frames)
+
+    def close(self):
+        with self._lock:
+            self._close_patient()
+            self.username = None
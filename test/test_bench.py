@@ -0,0 +1,34 @@
+from bench.bench import compare, keep_best, measure, run
+
+
+def result(min_s, tolerance=0.0):
+    return {"min_s": min_s, "median_s": min_s, "tolerance": tolerance}
+
+
+def test_compare_flags_regressions_beyond_threshold():
+    baseline = {"results": {"a": result(1.0), "b": result(1.0), "c": result(1.0)}}
+    current = {"results": {"a": result(1.2), "b": result(1.3), "c": result(1.4, 0.5), "d": result(1.0)}}
+    regressions, lines = compare(current, baseline, threshold=0.25)
+    assert regressions == ["b"]
+    assert any(line.startswith("d") and "new" in line for line in lines)
+
+
+def test_measure_calibrates_calls_per_round():
+    stats = measure(lambda: None, rounds=3, min_round_time=0.001)
+    assert stats["rounds"] == 3
+    assert stats["number"] > 1
+    assert 0 < stats["min_s"] <= stats["median_s"]
+
+
+def test_confirmation_rerun_keeps_the_best_time():
+    baseline = {"results": {"a": result(1.0), "b": result(1.0)}}
+    current = {"results": {"a": result(2.0), "b": result(1.0)}}
+    keep_best(current, {"results": {"a": result(1.1)}})
+    keep_best(current, {"results": {"a": result(1.5)}})
+    assert current["results"]["a"]["min_s"] == 1.1
+    assert compare(current, baseline, threshold=0.25)[0] == []
+
+
+def test_run_selects_benchmarks_by_name():
+    results = run(rounds=2, min_round_time=0.001, names=["serial.encode_parameters"])["results"]
+    assert list(results) == ["serial.encode_parameters"]
@@ -0,0 +1,87 @@
+import os
+import signal
+import time
+
+import pytest
+
+from comm.device_process import DeviceProcess
+from comm.simulator import open_port
+from comm.telemetry_ring import TelemetryRing
+from params import schema
+
+
+@pytest.fixture
+def device():
+    device = DeviceProcess(port_opener=open_port)
+    device.telemetry = TelemetryRing.create(f"dcm_test_devproc_{os.getpid()}", slots=64)
+    yield device
+    device.close()
+    device.telemetry.close()
+
+
+def wait_for(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_commands_run_in_the_child_and_samples_arrive_through_shared_memory(device):
+    assert device.pid != os.getpid()
+    assert device.connect("SIM0") == (True, "Connected")
+    assert device.connected and device.port_name == "SIM0"
+    assert device.negotiate_link(max_samples=32)[0]
+    assert device.link_info()["samples_per_channel"] == 32
+
+    params = dict(schema.SERIAL_DEFAULTS, LRL=72)
+    ok, message, differences = device.echo_test_parameters("AAI", params)
+    assert ok and not differences
+    assert device.interrogate_device()[1]["LRL"] == 72
+
+    reader = device.telemetry.reader("test")
+    assert device.program_parameters("AAI", dict(params, response_type=0))[0]
+    assert device.start_streaming()[0]
+    # the parent hogging its own GIL does not hold up the child's serial reads
+    busy_until = time.monotonic() + 0.3
+    while time.monotonic() < busy_until:
+        sum(range(1000))
+    assert reader.available() >= 3
+    seq, vent, atr = reader.next()
+    assert len(vent) == 32
+
+
+def test_restarts_the_child_and_replays_the_session(device):
+    events = []
+    device.on_connection = lambda state, info: events.append(state)
+    assert device.connect("SIM0")[0]
+    streaming = dict(schema.SERIAL_DEFAULTS, response_type=0, LRL=80)
+    assert device.program_parameters("VVI", streaming)[0]
+    assert device.start_streaming(0.01)[0]
+    wait_for(lambda: device.telemetry.published > 0)
+
+    old_pid = device.pid
+    os.kill(old_pid, signal.SIGKILL)
+    wait_for(lambda: events == ["reconnecting", "connected"])
+    assert device.pid != old_pid and device.restarts == 1
+    assert device.connected and device.reconnect_stats["process_restarts"] == 1
+
+    # streaming resumed into the same ring, with the programmed parameters restored
+    published = device.telemetry.published
+    wait_for(lambda: device.telemetry.published > published)
+    assert device.stop_streaming()[0]
+    assert device.program_parameters("VVI", dict(streaming, response_type=1))[0]
+    assert device.interrogate_device()[1]["LRL"] == 80
+
+
+def test_records_in_the_child(device, tmp_path):
+    from comm.recorder import SessionReplay, RX
+    path = str(tmp_path / "session.dcmrec")
+    assert device.connect("SIM0")[0]
+    assert device.start_recording(path) == (True, path)
+    assert device.recorder == path
+    assert device.negotiate_link(max_samples=128)[0]
+    assert device.program_parameters("VOO", dict(schema.SERIAL_DEFAULTS, response_type=0))[0]
+    assert device.get_signals()[0]
+    assert device.stop_recording()[0] and device.recorder is None
+    frames = list(SessionReplay(path).iter_records(direction=RX, command="signals"))
+    assert frames and len(frames[-1].data) == 8 * 128
@@ -0,0 +1,70 @@
+import numpy as np
+
+from analysis.egram import EgramAnalyzer, EGRAM_SENSITIVITY, to_counts
+from dicom.dicom_init import lead_waveform_init
+from dicom.dicom import (set_ecg_waveform, get_ecg_waveform, get_ecg_counts,
+                         set_waveform_annotations, get_waveform_annotations)
+
+
+def synthetic_egram(beats=6, rr=1000, av=150, n=None):
+    # atrial paced beats followed by sensed ventricular R waves, 1 kHz
+    n = n or beats * rr
+    atr = np.zeros(n)
+    vent = np.zeros(n)
+    for b in range(beats):
+        a = b * rr + 100
+        atr[a:a + 2] = 5.0                                   # pacing spike
+        v = a + av
+        vent[v:v + 40] = 4.0 * np.hanning(40)                # sensed R wave
+    return vent, atr
+
+
+def test_markers_and_rate():
+    vent, atr = synthetic_egram()
+    analyzer = EgramAnalyzer()
+    events = []
+    for i in range(0, len(vent), 11):                       # 11-sample frames like decode_signals
+        events += analyzer.process_frame(vent[i:i + 11], atr[i:i + 11])
+
+    assert [e.marker for e in events] == ["AP", "VS"] * 6
+    assert [e.sample for e in events if e.marker == "AP"] == [100 + 1000 * b for b in range(6)]
+    assert analyzer.instantaneous_rate == 60.0
+    assert analyzer.rolling_rate == 60.0
+
+
+def test_frame_size_does_not_change_result():
+    vent, atr = synthetic_egram()
+    small, large = EgramAnalyzer(), EgramAnalyzer()
+    a = [e for i in range(0, len(vent), 11) for e in small.process_frame(vent[i:i + 11], atr[i:i + 11])]
+    b = large.process_frame(vent, atr)
+    assert a == b
+
+
+def test_annotations_round_trip(tmp_path):
+    path = str(tmp_path / "lead_waveform.dcm")
+    lead_waveform_init("12345", path)
+    vent, atr = synthetic_egram(beats=3)
+    set_ecg_waveform(path, "Atrial Lead", atr[1000:])
+
+    analyzer = EgramAnalyzer()
+    analyzer.process_frame(vent, atr)
+    atrial_events = [e for e in analyzer.events_since(1000) if e.marker[0] == "A"]
+    set_waveform_annotations(path, "Atrial Lead", atrial_events, first_sample=1000)
+
+    assert get_waveform_annotations(path, "Atrial Lead") == [(100, "AP"), (1100, "AP")]
+    assert get_waveform_annotations(path, "Ventricular Lead") == []
+
+
+def test_fixed_point_storage(tmp_path):
+    path = str(tmp_path / "lead_waveform.dcm")
+    lead_waveform_init("12345", path)
+    set_ecg_waveform(path, "Ventricular Lead", np.array([0.0, 1.2345, -40.0, 40.0, np.nan]))
+
+    counts, sensitivity = get_ecg_counts(path, "Ventricular Lead")
+    assert counts.dtype == np.int16 and sensitivity == EGRAM_SENSITIVITY
+    assert counts.tolist() == [0, 1234, -32768, 32767, 0]   # rounded, saturated, NaN -> 0
+    assert np.allclose(get_ecg_waveform(path, "Ventricular Lead"), counts * EGRAM_SENSITIVITY)
+
+    set_ecg_waveform(path, "Atrial Lead", counts)             # int16 is stored as-is
+    assert get_ecg_counts(path, "Atrial Lead")[0].tolist() == counts.tolist()
+    assert to_counts([0.0004, -0.0006]).tolist() == [0, -1]
@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+import pytest
+
+from dicom import header_index, patients
+from dicom import dicom as dicom_module
+from dicom.dicom_init import patient_info_init, bradycardia_param_init, lead_waveform_init
+from dicom.dicom import set_parameter, set_ecg_waveform, save_dicom
+from dicom.waveform_appender import WaveformAppender
+from pydicom import dcmread
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(header_index, "DATA_DIR", str(tmp_path))
+    yield tmp_path
+    header_index.close_all()
+
+
+def make_patient(data_dir, patient_id):
+    patient_dir = data_dir / "clinician" / patient_id
+    patient_dir.mkdir(parents=True)
+    paths = {name: str(patient_dir / name) for name in ("patient_info.dcm", "brady_params_report.dcm", "lead_waveform.dcm")}
+    patient_info_init(patient_id, paths["patient_info.dcm"])
+    bradycardia_param_init(patient_id, paths["brady_params_report.dcm"])
+    lead_waveform_init(patient_id, paths["lead_waveform.dcm"])
+    for path in paths.values():
+        header_index.refresh(path)
+    return paths
+
+
+def test_index_follows_saves(data_dir):
+    user_dir = str(data_dir / "clinician")
+    paths = make_patient(data_dir, "11111")
+
+    ds = dcmread(paths["patient_info.dcm"])
+    ds.PatientName = "Doe^Jane"
+    save_dicom(ds, paths["patient_info.dcm"])
+    set_ecg_waveform(paths["lead_waveform.dcm"], "Atrial Lead", np.zeros(300, dtype=np.int16))
+    with WaveformAppender(paths["lead_waveform.dcm"], "Ventricular Lead") as appender:
+        appender.append(np.zeros(40, dtype=np.int16))
+
+    assert header_index.list_patients(user_dir) == \
+        [{"patientID": "11111", "name": "Doe^Jane", "birthdate": "19990101", "sex": "M"}]
+    summary = header_index.patient_summary(user_dir, "11111")
+    assert {f["path"] for f in summary["files"]} == {"11111/" + name for name in ("patient_info.dcm", "brady_params_report.dcm", "lead_waveform.dcm")}
+    assert {(w["label"], w["samples"]) for w in summary["waveforms"]} == {("Atrial Lead", 300), ("Ventricular Lead", 40)}
+    assert header_index.verify(str(data_dir))[user_dir] == {"stale": [], "missing": [], "orphaned": []}
+
+    header_index.remove_patient(user_dir, "11111")
+    assert header_index.list_patients(user_dir) == []
+
+
+def test_verify_and_parallel_rebuild(data_dir):
+    user_dir = str(data_dir / "clinician")
+    for patient_id in ("22222", "33333"):
+        make_patient(data_dir, patient_id)
+
+    # written behind the index's back
+    path = str(data_dir / "clinician" / "22222" / "brady_params_report.dcm")
+    ds = dcmread(path)
+    ds.PatientName = "Changed^Outside"
+    ds.save_as(path)
+    os.remove(str(data_dir / "clinician" / "33333" / "lead_waveform.dcm"))
+
+    report = header_index.verify(str(data_dir))[user_dir]
+    assert report["stale"] == ["22222/brady_params_report.dcm"]
+    assert report["orphaned"] == ["33333/lead_waveform.dcm"]
+
+    assert header_index.rebuild(str(data_dir), workers=2) == 5
+    assert header_index.verify(str(data_dir))[user_dir] == {"stale": [], "missing": [], "orphaned": []}
+    assert [p["patientID"] for p in header_index.list_patients(user_dir)] == ["22222", "33333"]
+
+
+def test_new_patient_files_are_written_once_and_listed_from_the_index(data_dir, monkeypatch):
+    user_dir = data_dir / "clinician"
+    monkeypatch.setattr(patients, "user_dir", lambda username: str(data_dir / username))
+    patient_dir = user_dir / "44444"
+    patient_dir.mkdir(parents=True)
+    paths = {name: str(patient_dir / filename) for name, filename in dicom_module.PATIENT_FILES.items()}
+
+    def no_read(*args, **kwargs):
+        raise AssertionError("DICOM file read back")
+    with monkeypatch.context() as m:
+        m.setattr(dicom_module, "dcmread", no_read)
+        m.setattr(header_index, "dcmread", no_read)
+        patients.write_patient_files(paths, "44444", "Doe^Jane", "1980-02-03", "F")
+    patients.save_patients(str(user_dir / "patients.json"), {"patients": [
+        {"patientID": "44444", "name": "Doe^Jane", "birthdate": "1980-02-03", "sex": "F"}]})
+    assert patients.list_patients("clinician") == \
+        [{"patientID": "44444", "name": "Doe^Jane", "birthdate": "1980-02-03", "sex": "F"}]
+    summary = header_index.patient_summary(str(user_dir), "44444")
+    assert len(summary["files"]) == 5
+    assert ("Surface Lead", 500) in {(w["label"], w["samples"]) for w in summary["waveforms"]}
+    assert str(dcmread(paths["LEAD_WAVFRM_DCM"]).PatientName) == "Doe^Jane"
+    # default parameters were filled in before that single write
+    defaults = patients.load_default_parameters()
+    for param_file in ("BRADY_PARAM_DCM", "TEMP_PARAM_DCM"):
+        stored = dicom_module.get_all_parameters(paths[param_file])
+        assert all(stored[mode][name] == value for mode, params in defaults.items() for name, value in params.items())
+
+    # a registered patient the index does not know yet is indexed on listing
+    make_patient(data_dir, "55555")
+    header_index.remove_patient(str(user_dir), "55555")
+    registry = patients.load_patients(str(user_dir / "patients.json"))
+    registry["patients"].append({"patientID": "55555", "name": "?", "birthdate": "?", "sex": "?"})
+    patients.save_patients(str(user_dir / "patients.json"), registry)
+    assert [(p["patientID"], p["birthdate"]) for p in patients.list_patients("clinician")] == \
+        [("44444", "1980-02-03"), ("55555", "1999-01-01")]
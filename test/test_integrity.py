@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+
+from dicom import integrity
+from dicom.dicom import PATIENT_FILES, INITIALIZERS, set_ecg_waveform
+from pydicom import dcmread
+
+
+def make_patient(data_dir, patient_id):
+    patient_dir = data_dir / "clinician" / patient_id
+    patient_dir.mkdir(parents=True)
+    paths = {}
+    for name, init in INITIALIZERS.items():
+        paths[name] = str(patient_dir / PATIENT_FILES[name])
+        init(patient_id, paths[name])
+    return paths
+
+
+def test_scan_detects_problems_and_caches(tmp_path):
+    clean = make_patient(tmp_path, "11111")
+    broken = make_patient(tmp_path, "22222")
+    set_ecg_waveform(clean["LEAD_WAVFRM_DCM"], "Atrial Lead", np.arange(100, dtype=np.int16))
+
+    result = integrity.scan(str(tmp_path), workers=2)
+    assert result == {"files": 10, "parsed": 10, "cached": 0, "problems": {}}
+
+    # unchanged files are served from the cache, touched but identical ones are only hashed
+    os.utime(clean["PT_INFO_DCM"], ns=(0, 0))
+    progress = []
+    result = integrity.scan(str(tmp_path), workers=2, progress=lambda done, total: progress.append((done, total)))
+    assert (result["parsed"], result["cached"]) == (0, 10)
+    assert progress[-1] == (10, 10)
+
+    # declared sample count no longer matches the data
+    ds = dcmread(broken["LEAD_WAVFRM_DCM"])
+    ds.WaveformSequence[1].NumberOfWaveformSamples = 10
+    ds.save_as(broken["LEAD_WAVFRM_DCM"])
+    # parameter item removed from one mode
+    ds = dcmread(broken["BRADY_PARAM_DCM"])
+    del ds.ContentSequence[0].ContentSequence[0]
+    ds.save_as(broken["BRADY_PARAM_DCM"])
+    # not a DICOM file any more, and a missing file
+    with open(broken["SURFACE_ECG_DCM"], "wb") as f:
+        f.write(b"garbage")
+    os.remove(broken["TEMP_PARAM_DCM"])
+
+    result = integrity.scan(str(tmp_path), workers=2)
+    assert result["parsed"] == 3
+    problems = result["problems"]
+    assert sorted(problems) == ["clinician/22222/" + f for f in
+                                ("brady_params_report.dcm", "lead_waveform.dcm", "surface_ecg.dcm", "temp_params_report.dcm")]
+    assert problems["clinician/22222/lead_waveform.dcm"] == \
+        ["'Ventricular Lead': 0 bytes of WaveformData, declared 10 samples x 1 channels"]
+    assert problems["clinician/22222/brady_params_report.dcm"] == ["AOO: parameter 'Lower Rate Limit' missing"]
+    assert problems["clinician/22222/surface_ecg.dcm"][0].startswith("unreadable")
+    assert problems["clinician/22222/temp_params_report.dcm"] == ["missing"]
+
+    # cached problems are reported again without re-parsing
+    again = integrity.scan(str(tmp_path), workers=1)
+    assert again["parsed"] == 0
+    assert again["problems"] == problems
@@ -0,0 +1,77 @@
+from comm.link_monitor import LinkMonitor, OK, DEGRADED, LOST
+from comm.serial_comm import PacemakerSerial
+from comm.simulator import SimulatedPacemaker
+
+
+def test_states_follow_errors_latency_and_silence():
+    changes = []
+    monitor = LinkMonitor(on_change=lambda old, new, stats: changes.append((old, new)))
+    t = 0.0
+    for i in range(200):
+        t += 0.15
+        monitor.record(True, 150.0 + (i % 10), now=t)
+    assert monitor.state == OK and changes == []
+    stats = monitor.stats()
+    assert 150 <= stats["latency_p50_ms"] <= stats["latency_p95_ms"] <= stats["latency_p99_ms"] <= 160
+    assert stats["jitter_ms"] < 5
+
+    # a burst of slow frames degrades the link, a few good ones do not restore it at once (hysteresis)
+    for _ in range(10):
+        t += 0.15
+        monitor.record(True, 500.0, now=t)
+    assert monitor.state == DEGRADED
+    t += 0.15
+    monitor.record(True, 150.0, now=t)
+    assert monitor.state == DEGRADED
+    for _ in range(60):
+        t += 0.15
+        monitor.record(True, 150.0, now=t)
+    assert monitor.state == OK
+
+    for _ in range(3):
+        t += 0.15
+        monitor.record(False, 150.0, now=t)
+    assert monitor.state == LOST
+    t += 0.15
+    monitor.record(True, 150.0, now=t)
+    assert monitor.state == DEGRADED  # recent errors still count
+    assert monitor.check(now=t + 5.0) == LOST  # silent past the timeout
+    assert changes == [(OK, DEGRADED), (DEGRADED, OK), (OK, LOST), (LOST, DEGRADED), (DEGRADED, LOST)]
+
+
+def test_serial_transactions_feed_the_monitor():
+    link = PacemakerSerial()
+    link.serial_port = SimulatedPacemaker()
+    link.connected = True
+    assert link.interrogate_device()[0]
+    assert link.monitor.frames == 1 and link.monitor.failures == 0
+    link.serial_port.baudrate = 9600  # wrong speed: every frame is lost
+    for _ in range(3):
+        assert not link.interrogate_device()[0]
+    assert link.monitor.state == LOST
+
+
+def test_jitter_ignores_user_paced_transactions_and_stream_pauses():
+    monitor = LinkMonitor()
+    # interrogations clicked at t=0, 10 and 60 s: no cadence, no jitter
+    for t in (0.0, 10.0, 60.0):
+        assert monitor.record(True, 150.0, now=t, stream=False) == OK
+    assert monitor.jitter_ms == 0.0
+    assert monitor.check(now=120.0) == OK  # not streaming: silence is not a lost link
+
+    t = 100.0
+    for _ in range(50):
+        t += 0.1
+        monitor.record(True, 80.0, now=t)
+    # an interrogation between frames and a pause in streaming leave the jitter alone
+    monitor.record(True, 150.0, now=t + 0.05, stream=False)
+    t += 0.3
+    for _ in range(10):
+        t += 0.1
+        monitor.record(True, 80.0, now=t)
+    t += 30.0
+    for _ in range(10):
+        t += 0.1
+        monitor.record(True, 80.0, now=t)
+    assert monitor.jitter_ms < 1.0 and monitor.state == OK
+    assert monitor.check(now=t + 5.0) == LOST
@@ -0,0 +1,58 @@
+import numpy as np
+
+from comm.recorder import SessionReplay, replay_signals
+from comm.serial_comm import PacemakerSerial, FRAME_SIZE
+from comm.simulator import SimulatedPacemaker
+from params import schema
+
+
+def simulated_link(**kwargs):
+    link = PacemakerSerial()
+    link.serial_port = SimulatedPacemaker(**kwargs)
+    link.connected = True
+    return link
+
+
+def test_negotiates_fastest_common_link_and_streams_larger_frames(tmp_path):
+    link = simulated_link(max_baudrate=460800, max_samples=64)
+    legacy = link.link_info()
+    assert (legacy["baudrate"], legacy["frame_bytes"], legacy["payload_efficiency"]) == (115200, 88, 0.721)
+
+    # recording from connect on survives the switch to larger frames
+    link.start_recording(str(tmp_path / "session.dcmrec"))
+    ok, message = link.negotiate_link()
+    assert ok, message
+    info = link.link_info()
+    assert (info["baudrate"], info["samples_per_channel"], info["frame_bytes"]) == (460800, 64, 512)
+    assert info["extended"] and info["payload_efficiency"] > 0.93
+    assert link.serial_port.baudrate == link.serial_port.device_baudrate == 460800
+
+    link.program_parameters("VOO", dict(schema.SERIAL_DEFAULTS, response_type=0))
+    frames = [link.get_signals() for _ in range(20)]
+    assert all(ok and len(vent) == len(atr) == 64 for ok, (vent, atr) in frames)
+    out = (np.empty(64, dtype=np.int16), np.empty(64, dtype=np.int16))
+    ok, (vent, atr) = link.get_signals(out)
+    assert ok and vent is out[0]
+    assert link.recorder is not None
+    link.stop_recording()
+
+    # the recorded large frames replay through a link that never negotiated
+    markers = []
+    replay_signals(SessionReplay(str(tmp_path / "session.dcmrec")),
+                   on_frame=lambda record, vent, atr, events: markers.extend(e.marker for e in events))
+    assert "AP" in markers and "VP" in markers
+
+    # parameter frames keep their 88-byte format on the new link
+    link.program_parameters("VOO", dict(schema.SERIAL_DEFAULTS))
+    ok, readback = link.interrogate_device()
+    assert ok and readback["LRL"] == schema.SERIAL_DEFAULTS["LRL"]
+
+
+def test_old_firmware_keeps_the_88_byte_frame():
+    link = simulated_link(extended=False)
+    ok, message = link.negotiate_link()
+    assert ok and "88-byte" in message
+    assert not link.link_info()["extended"] and link.signal_frame_size == FRAME_SIZE
+    link.program_parameters("VOO", dict(schema.SERIAL_DEFAULTS, response_type=0))
+    ok, (vent, atr) = link.get_signals()
+    assert ok and len(vent) == 11
@@ -0,0 +1,35 @@
+from metrics.metrics import MetricsRegistry
+
+
+def test_disabled_registry_is_noop():
+    registry = MetricsRegistry()
+    count = registry.counter("dcm_test_total")
+    latency = registry.histogram("dcm_test_ms", command="program")
+    count.inc()
+    latency.observe(3.0)
+    with latency.time():
+        pass
+    assert count.value == 0
+    assert latency.count == 0
+
+
+def test_snapshot_and_prometheus_export(tmp_path):
+    registry = MetricsRegistry()
+    registry.enable()
+    registry.counter("dcm_serial_bytes_out_total", "Bytes written").inc(34)
+    latency = registry.histogram("dcm_serial_transaction_ms", "Transaction time", command="interrogate")
+    latency.observe(0.3)
+    latency.observe(120)
+    assert registry.histogram("dcm_serial_transaction_ms", command="interrogate") is latency
+
+    metrics = {m["name"]: m for m in registry.snapshot()["metrics"]}
+    assert metrics["dcm_serial_bytes_out_total"]["value"] == 34
+    assert metrics["dcm_serial_transaction_ms"]["count"] == 2
+
+    path = str(tmp_path / "dcm.prom")
+    registry.export_prometheus(path)
+    text = open(path).read()
+    assert "dcm_serial_bytes_out_total 34" in text
+    assert 'dcm_serial_transaction_ms_bucket{command="interrogate",le="0.5"} 1' in text
+    assert 'dcm_serial_transaction_ms_bucket{command="interrogate",le="+Inf"} 2' in text
+    assert 'dcm_serial_transaction_ms_count{command="interrogate"} 2' in text
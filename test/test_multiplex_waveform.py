@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from analysis.egram import EGRAM_SENSITIVITY
+from dicom.dicom_init import surface_ecg_init, lead_waveform_init
+from dicom.dicom import (get_multiplex_waveform, set_multiplex_waveform, get_ecg_counts, set_ecg_waveform,
+                         get_ecg_waveform)
+
+
+def test_twelve_lead_round_trip(tmp_path):
+    path = str(tmp_path / "surface_ecg.dcm")
+    surface_ecg_init("12345", path)
+    data = (np.arange(500 * 12, dtype=np.int16) % 2000).reshape(500, 12)
+    set_multiplex_waveform(path, "Surface Lead", data)
+
+    counts, sensitivities, labels = get_multiplex_waveform(path, "Surface Lead")
+    assert counts.shape == (500, 12) and counts.dtype == np.int16
+    assert np.array_equal(counts, data)
+    assert np.all(sensitivities == EGRAM_SENSITIVITY)
+    assert labels[:3] == ["I", "II", "III"] and labels[-1] == "V6"
+
+    from pydicom import dcmread
+    seq = dcmread(path).WaveformSequence[0]
+    assert seq.NumberOfWaveformSamples == 500
+    assert seq.WaveformData[:4] == data[0, :2].astype("<i2").tobytes()  # sample-major interleave
+
+    with pytest.raises(ValueError):
+        set_multiplex_waveform(path, "Surface Lead", data[:, :11])
+
+
+def test_single_lead_is_a_one_channel_group(tmp_path):
+    path = str(tmp_path / "lead_waveform.dcm")
+    lead_waveform_init("12345", path)
+    set_ecg_waveform(path, "Atrial Lead", np.array([0.5, -0.25]))
+    counts, sensitivities, labels = get_multiplex_waveform(path, "Atrial Lead")
+    assert counts.tolist() == [[500], [-250]] and labels == ["Atrial"]
+    assert get_ecg_counts(path, "Atrial Lead")[0].tolist() == [500, -250]
+
+
+def test_sensitivity_is_stored_per_channel(tmp_path):
+    path = str(tmp_path / "surface_ecg.dcm")
+    surface_ecg_init("12345", path)
+    sensitivities = np.full(12, 0.005)
+    sensitivities[0] = 0.01
+    data = np.tile(np.array([[0.5], [-0.25]]), (1, 12))
+    set_multiplex_waveform(path, "Surface Lead", data, sensitivity=sensitivities)
+
+    counts, stored, _ = get_multiplex_waveform(path, "Surface Lead")
+    assert np.array_equal(stored, sensitivities)
+    assert counts[:, 0].tolist() == [50, -25] and counts[:, 1].tolist() == [100, -50]
+    assert np.allclose(counts * stored, data)
+
+    with pytest.raises(ValueError):
+        set_multiplex_waveform(path, "Surface Lead", data, sensitivity=[0.005] * 11)
+    with pytest.raises(ValueError):
+        set_multiplex_waveform(path, "Surface Lead", data, sensitivity=0)
+
+
+def test_unit_sensitivity_round_trip(tmp_path):
+    path = str(tmp_path / "lead_waveform.dcm")
+    lead_waveform_init("12345", path)
+    set_ecg_waveform(path, "Atrial Lead", np.array([5.0, -3.0]), sensitivity=1.0)
+    counts, sensitivity = get_ecg_counts(path, "Atrial Lead")
+    assert sensitivity == 1.0 and counts.tolist() == [5, -3]
+    assert np.allclose(get_ecg_waveform(path, "Atrial Lead"), [5.0, -3.0])
+
+
+def test_legacy_placeholder_sensitivity(tmp_path):
+    from pydicom import dcmread
+    path = str(tmp_path / "lead_waveform.dcm")
+    lead_waveform_init("12345", path)
+    set_ecg_waveform(path, "Atrial Lead", np.array([5.0]))
+
+    # files from before the fixed-point path: 1.0 placeholder, no correction factor, mV * 1000 stored
+    ds = dcmread(path)
+    ch = ds.WaveformSequence[0].ChannelDefinitionSequence[0]
+    ch.ChannelSensitivity = 1.0
+    del ch.ChannelSensitivityCorrectionFactor
+    ds.save_as(path)
+    assert get_ecg_counts(path, "Atrial Lead")[1] == EGRAM_SENSITIVITY
+    assert np.allclose(get_ecg_waveform(path, "Atrial Lead"), [5.0])
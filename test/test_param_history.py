@@ -0,0 +1,63 @@
+from dicom.param_history import ParameterHistory
+
+
+def initial_values():
+    return {"BRADY": {"AOO": {"Lower Rate Limit": 60.0, "Upper Rate Limit": 120.0}},
+            "TEMP": {"AOO": {"Lower Rate Limit": 60.0, "Upper Rate Limit": 120.0}}}
+
+
+def test_values_as_of_time_and_diff(tmp_path):
+    path = str(tmp_path / "parameter_history.jsonl")
+    history = ParameterHistory(path, initial=initial_values(), snapshot_every=4)
+
+    # 10 saves of the lower rate limit, one second apart
+    for i in range(10):
+        recorded = history.record("clinician", "BRADY", "AOO",
+                                  {"Lower Rate Limit": (60.0 + i, 61.0 + i), "Upper Rate Limit": (120.0, 120.0)},
+                                  t=1000.0 + i)
+        assert recorded == 1  # unchanged values are not recorded
+    history.record("other", "TEMP", "AOO", {"Upper Rate Limit": (120.0, 150.0)}, t=1010.0)
+
+    assert len(history) == 11
+    assert history.values_at(999.0) == initial_values()
+    assert history.values_at(1004.5)["BRADY"]["AOO"]["Lower Rate Limit"] == 65.0
+    assert history.values_at(2000.0)["TEMP"]["AOO"]["Upper Rate Limit"] == 150.0
+    assert history.diff(1002.0, 1010.0) == {
+        ("BRADY", "AOO", "Lower Rate Limit"): (63.0, 70.0),
+        ("TEMP", "AOO", "Upper Rate Limit"): (120.0, 150.0),
+    }
+    assert [d.user for d in history.changes(1009.0)] == ["clinician", "other"]
+
+    # reopening replays the log, including the intermediate snapshots
+    reopened = ParameterHistory(path, initial={})
+    assert reopened.current == history.current
+    assert reopened.values_at(1006.0) == history.values_at(1006.0)
+    assert reopened.diff(0, 2000.0) == history.diff(0, 2000.0)
+    with open(path) as f:
+        assert sum('"state"' in line for line in f) == 3  # initial + every 4 deltas
+
+
+def test_torn_last_line_does_not_swallow_later_changes(tmp_path):
+    path = str(tmp_path / "parameter_history.jsonl")
+    history = ParameterHistory(path, initial=initial_values())
+    history.record("clinician", "BRADY", "AOO", {"Lower Rate Limit": (60.0, 70.0)}, t=1000.0)
+    with open(path, "a") as f:
+        f.write('{"t":1001.0,"u":"clinician","s":"BRA')  # crash mid-write
+
+    reopened = ParameterHistory(path)
+    assert len(reopened) == 1
+    reopened.record("clinician", "BRADY", "AOO", {"Lower Rate Limit": (70.0, 80.0)}, t=1002.0)
+    reopened.record("clinician", "BRADY", "AOO", {"Lower Rate Limit": (80.0, 90.0)}, t=1003.0)
+
+    again = ParameterHistory(path)
+    assert len(again) == 3
+    assert again.current["BRADY"]["AOO"]["Lower Rate Limit"] == 90.0
+
+    # a last entry that lost only its newline is kept, and the next one goes on a line of its own
+    with open(path) as f:
+        content = f.read()
+    with open(path, "w") as f:
+        f.write(content.rstrip("\n"))
+    history = ParameterHistory(path)
+    history.record("clinician", "BRADY", "AOO", {"Lower Rate Limit": (90.0, 95.0)}, t=1004.0)
+    assert len(ParameterHistory(path)) == 4
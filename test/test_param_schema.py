@@ -0,0 +1,86 @@
+import numpy as np
+
+from params import schema
+
+
+def test_validate_parameters():
+    assert schema.validate_parameters({"Lower Rate Limit": "60", "Upper Rate Limit": "120"}) == []
+    assert schema.validate_parameters({"Atrial Amplitude": "7.5"}) == ["Atrial Amplitude (V) must be between 0.0 and 7.0"]
+    assert schema.validate_parameters({"ARP": "abc"}) == ["ARP (ms) must be a valid number"]
+    assert schema.validate_parameters({"Lower Rate Limit": 60.5}) == ["Lower Rate Limit (ppm) must be in increments of 1"]
+    assert schema.validate_parameters({"Lower Rate Limit": 130, "Upper Rate Limit": 120}) == \
+        ["Lower Rate Limit cannot be greater than Upper Rate Limit"]
+    assert schema.validate_parameter("Activity Threshold", "Med") == (True, "")
+
+
+def test_serial_round_trip():
+    gui = {"Atrial Pulse Width": 0.4, "Atrial Sensitivity": 3.0, "Lower Rate Limit": 70,
+           "Atrial Amplitude": 4.0, "Activity Threshold": "High"}
+    serial = schema.to_serial(gui)
+    assert serial["ATR_PULSE_WIDTH"] == 10
+    assert serial["ATR_CMP_REF_PWM"] == 94
+    assert serial["LRL"] == 70
+    assert serial["ACTIVITY_THRESHOLD"] == 1.5
+    assert serial["VRP"] == schema.SERIAL_DEFAULTS["VRP"]
+
+    back = schema.from_serial(serial)
+    for key in ("Atrial Pulse Width", "Atrial Sensitivity", "Lower Rate Limit", "Atrial Amplitude", "Activity Threshold"):
+        assert back[key] == gui[key]
+    assert schema.from_serial_value("ACTIVITY_THRESHOLD", 1.33) == "Med"
+
+
+def test_batch_matches_scalar_path():
+    rng = np.random.default_rng(0)
+    names = schema.MODE_PARAMETERS["AAIR"]
+    thresholds = np.array(list(schema.ACTIVITY_THRESHOLD_TO_FLOAT.values()))
+    rows = []
+    for name in names:
+        if name in schema.CHOICES:
+            col = rng.choice(np.append(thresholds, 1.25), 2000)
+        else:
+            spec = schema.SPECS[name]
+            col = np.round(rng.uniform(spec.lo - 5, spec.hi + 5, 2000) / spec.increment) * spec.increment
+        rows.append(col)
+    values = np.column_stack(rows)
+
+    mask = schema.validate_batch("AAIR", values, chunk_size=300)
+    to_choice = schema.FLOAT_TO_ACTIVITY_THRESHOLD
+    for row, ok in zip(values, mask):
+        gui = {name: to_choice.get(v, "?") if name in schema.CHOICES else v for name, v in zip(names, row)}
+        assert ok == (schema.validate_parameters(gui) == [])
+
+    fields = schema.to_serial_batch("AAIR", values[mask])
+    first = {name: to_choice[v] if name in schema.CHOICES else v for name, v in zip(names, values[mask][0])}
+    serial = schema.to_serial(first)
+    for field, column in fields.items():
+        assert column[0] == schema.SERIAL_TYPES[field](serial[field])
+
+
+def test_lookup_tables_round_trip():
+    for name, table in schema.TABLES.items():
+        field = schema.SPECS[name].serial
+        # every device code decodes to a legal value that encodes back to the same code
+        for code, value in table.decode.items():
+            assert schema.to_serial_value(name, value) == code
+            assert schema.from_serial_value(field, code) == value
+        # every legal value encodes to a code that decodes to a value with that code
+        for value, code in zip(table.values, table.codes):
+            assert schema.to_serial_value(name, value) == code
+            assert schema.to_serial_value(name, schema.from_serial_value(field, code)) == code
+        assert all(schema.validate_parameter(name, v)[0] for v in table.decode.values())
+
+    # exact decimal conversion: 27.5 and 32.5 both round up (binary floats gave 28 and 32)
+    assert schema.to_serial_value("Atrial Pulse Width", 1.1) == 28
+    assert schema.to_serial_value("Atrial Pulse Width", 1.3) == 33
+    assert schema.from_serial_value("ATR_CMP_REF_PWM", 37) == 0.52
+
+    # the batch path uses the same tables, including for off-table values
+    table = schema.TABLES["Atrial Pulse Width"]
+    names = schema.MODE_PARAMETERS["AAI"]
+    values = np.tile([schema.NOMINAL_VALUES[n] for n in names], (len(table.values) + 1, 1)).astype(float)
+    column = names.index("Atrial Pulse Width")
+    values[:-1, column] = table.values
+    values[-1, column] = 1.234
+    fields = schema.to_serial_batch("AAI", values)
+    assert list(fields["ATR_PULSE_WIDTH"][:-1]) == table.codes
+    assert fields["ATR_PULSE_WIDTH"][-1] == schema.to_serial_value("Atrial Pulse Width", 1.234)
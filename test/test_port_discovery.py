@@ -0,0 +1,57 @@
+import threading
+from types import SimpleNamespace
+
+import serial.tools.list_ports
+
+from comm.port_discovery import PortWatcher
+from comm.serial_comm import PacemakerSerial
+
+
+def test_enumerates_in_background_and_follows_hotplug(tmp_path, monkeypatch):
+    dev = tmp_path / "dev"
+    dev.mkdir()
+    (dev / "ttyS0").touch()
+    present = {"/dev/ttyS0": SimpleNamespace(device="/dev/ttyS0", description="ttyS0", serial_number=None)}
+    calls = []
+
+    def comports():
+        calls.append(1)
+        return list(present.values())
+    monkeypatch.setattr(serial.tools.list_ports, "comports", comports)
+
+    changes, plugged = [], []
+    jlink_seen = threading.Event()
+
+    def on_jlink(info, known):
+        plugged.append((info.device, known))
+        jlink_seen.set()
+
+    watcher = PortWatcher(on_change=lambda added, removed, ports: changes.append((added, removed)),
+                          on_jlink=on_jlink, poll_interval=0.01, dev_dir=str(dev)).start()
+    try:
+        assert watcher.wait_ready(2)
+        link = PacemakerSerial()
+        link.port_watcher = watcher
+        assert link.list_ports() == [("/dev/ttyS0", "ttyS0")]
+        enumerations = len(calls)
+        threading.Event().wait(0.1)
+        assert len(calls) == enumerations  # nothing changed in /dev: no re-enumeration
+
+        watcher.remember("000621000000")
+        present["/dev/ttyACM0"] = SimpleNamespace(device="/dev/ttyACM0", description="JLink CDC UART Port",
+                                                  serial_number="000621000000")
+        (dev / "ttyACM0").touch()
+        assert jlink_seen.wait(2)
+        assert plugged == [("/dev/ttyACM0", True)]
+        assert link.find_jlink_port() == "/dev/ttyACM0" and link._port_identity("/dev/ttyACM0") == "000621000000"
+
+        del present["/dev/ttyACM0"]
+        (dev / "ttyACM0").unlink()
+        for _ in range(200):
+            if len(watcher.port_infos) == 1:
+                break
+            threading.Event().wait(0.01)
+        assert link.find_jlink_port() is None
+        assert [p.device for p in changes[-1][1]] == ["/dev/ttyACM0"]
+    finally:
+        watcher.stop()
@@ -0,0 +1,85 @@
+import threading
+from types import SimpleNamespace
+
+import serial.tools.list_ports
+
+from comm import serial_comm
+from comm.serial_comm import PacemakerSerial
+from comm.simulator import SimulatedPacemaker
+from params import schema
+
+PORT = "/dev/ttyACM0"
+
+
+def test_reconnects_to_the_same_device_and_restores_the_stream(monkeypatch):
+    plugged = {"device": SimulatedPacemaker(port=PORT)}
+    jlink = SimpleNamespace(device=PORT, description="JLink CDC UART Port", serial_number="000621000000")
+    monkeypatch.setattr(serial.tools.list_ports, "comports", lambda: [jlink] if plugged["device"] else [])
+
+    link = PacemakerSerial()
+    monkeypatch.setattr(link, "_open_port", lambda port, baudrate, timeout: plugged["device"])
+    events = []
+    restored = threading.Event()
+
+    def on_connection(state, info):
+        events.append(state)
+        if state == "connected":
+            restored.set()
+    link.on_connection = on_connection
+
+    assert link.connect(PORT)[0] and link.device_identity == "000621000000"
+    assert link.negotiate_link(max_samples=64)[0]
+    streaming = dict(schema.SERIAL_DEFAULTS, response_type=0, LRL=75)
+    assert link.program_parameters("VVI", streaming)[0]
+    assert link.get_signals()[0]
+
+    # unplug: the active call fails, later calls are refused while reconnecting in the background
+    plugged.pop("device").unplug()
+    plugged["device"] = None
+    assert not link.get_signals()[0]
+    assert not link.connected and events == ["reconnecting"]
+    ok, message = link.get_signals()
+    assert not ok and "Reconnecting" in message
+
+    # the device comes back reset to its defaults
+    device = SimulatedPacemaker(port=PORT)
+    plugged["device"] = device
+    link.notify_port_change()
+    assert restored.wait(5)
+    assert link.connected and events == ["reconnecting", "connected"]
+    assert device.programmed["LRL"] == 75 and device.programmed["response_type"] == 0
+    assert device.samples == 64 and link.link_info()["samples_per_channel"] == 64
+    ok, (vent, atr) = link.get_signals()
+    assert ok and len(vent) == 64
+
+    stats = link.reconnect_stats
+    assert stats["losses"] == stats["recoveries"] == 1
+    assert 0 < stats["last_port_to_restore_ms"] <= stats["last_recover_ms"]
+    link.disconnect()
+
+
+def test_gives_up_and_stays_disconnected(monkeypatch):
+    monkeypatch.setattr(serial_comm, "RECONNECT_GIVE_UP_S", 0.2)
+    monkeypatch.setattr(serial.tools.list_ports, "comports", lambda: [])
+    device = SimulatedPacemaker(port=PORT)
+    link = PacemakerSerial()
+    monkeypatch.setattr(link, "_open_port", lambda port, baudrate, timeout: device)
+    events = []
+    failed = threading.Event()
+
+    def on_connection(state, info):
+        events.append(state)
+        if state == "failed":
+            failed.set()
+    link.on_connection = on_connection
+
+    assert link.connect(PORT)[0]
+    device.unplug()
+    assert not link.get_signals()[0]
+    assert failed.wait(5)
+    assert link.serial_port is None and link.port_name is None
+
+    # later calls are refused without starting another reconnect
+    assert link.get_signals() == (False, "Device not connected")
+    assert link.interrogate_device() == (False, "Device not connected")
+    assert events == ["reconnecting", "failed"] and link.reconnect_stats["losses"] == 1
@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+
+from comm.serial_comm import PacemakerSerial
+from comm.simulator import SimulatedPacemaker
+from comm.scheduler import CommandScheduler, SchedulerFull, PROGRAM, INTERROGATE, STREAM
+from params import schema
+
+
+@pytest.fixture
+def link():
+    link = PacemakerSerial()
+    link.serial_port = SimulatedPacemaker()
+    link.connected = True
+    streaming = dict(schema.SERIAL_DEFAULTS, response_type=0)
+    assert link.program_parameters("VVI", streaming)[0]
+    return link
+
+
+@pytest.fixture
+def scheduler(link):
+    scheduler = CommandScheduler(link).start()
+    yield scheduler
+    scheduler.stop()
+
+
+# Hold the worker on a command until release is set
+def block(scheduler):
+    started, release = threading.Event(), threading.Event()
+
+    def hold():
+        started.set()
+        release.wait(5)
+    scheduler.submit(STREAM, hold, name="hold")
+    assert started.wait(5)
+    return release
+
+
+def test_runs_commands_by_priority(scheduler):
+    order = []
+    release = block(scheduler)
+    futures = [scheduler.submit(STREAM, order.append, "stream"),
+               scheduler.submit(INTERROGATE, order.append, "interrogate"),
+               scheduler.submit(PROGRAM, order.append, "program")]
+    release.set()
+    for future in futures:
+        future.result(5)
+    assert order == ["program", "interrogate", "stream"]
+
+
+def test_program_waits_for_at_most_the_frame_in_flight(link, scheduler):
+    order = []
+    get_signals = link.get_signals
+    program_parameters = link.program_parameters
+    link.get_signals = lambda out=None: order.append("signals") or get_signals(out)
+    link.program_parameters = lambda mode, params: order.append("program") or program_parameters(mode, params)
+    stop = threading.Event()
+
+    # keep the stream queue full from another thread
+    def stream():
+        while not stop.is_set():
+            scheduler.poll_signals()
+    streamer = threading.Thread(target=stream)
+    streamer.start()
+    try:
+        while order.count("signals") < 5:
+            threading.Event().wait(0.001)
+        before = len(order)
+        ok, message = scheduler.program("VVI", dict(schema.SERIAL_DEFAULTS, response_type=0, LRL=80)).result(5)
+    finally:
+        stop.set()
+        streamer.join()
+    assert ok
+    assert order.index("program") - before <= 1
+    assert link.serial_port.programmed["LRL"] == 80
+
+
+def test_bounded_queues_and_cancellation(scheduler):
+    release = block(scheduler)
+    polls = [scheduler.poll_signals() for _ in range(3)]
+    # the stream queue keeps the newest polls
+    assert polls[0].cancelled() and not polls[1].cancelled()
+
+    programs = [scheduler.submit(PROGRAM, lambda: (True, "ok")) for _ in range(scheduler.max_queued[PROGRAM])]
+    with pytest.raises(SchedulerFull):
+        scheduler.submit(PROGRAM, lambda: (True, "ok"))
+    assert programs[-1].cancel()
+    scheduler.submit(PROGRAM, lambda: (True, "ok"))
+
+    assert scheduler.cancel(STREAM) == 2
+    assert scheduler.pending() == {"program": 4, "interrogate": 0, "stream": 0}
+    release.set()
+    assert all(future.result(5) == (True, "ok") for future in programs[:-1])
+    assert all(poll.cancelled() for poll in polls)
+
+
+def test_stream_polls_decode_signals(scheduler):
+    ok, (vent, atr) = scheduler.poll_signals().result(5)
+    assert ok and len(vent) == len(atr) == 11
@@ -6,42 +6,21 @@ import sys
 import os
 import time
 
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "comm"))
-from serial_comm import PacemakerSerial
-
-
-# =============================================================
-# UNIT CONVERSION CONSTANTS (must match main_interface.py)
-# =============================================================
-PULSE_WIDTH_MULTIPLIER = 25    # GUI_ms * 25 = serial_value (0.4ms -> 10)
-SENSITIVITY_PWM_BASE = 25      # PWM value at 0 mV
-SENSITIVITY_PWM_SCALE = 23     # PWM increase per mV
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from comm.serial_comm import PacemakerSerial
+from params import schema
 
 
 def convert_gui_to_serial(gui_params):
     """
     Convert GUI-style parameters to serial protocol parameters.
-    This mimics what main_interface.py does.
+    Uses the same parameter schema as main_interface.py.
     """
-    serial_params = {
-        "response_type": gui_params.get("response_type", 1),
-        "ARP": int(gui_params.get("ARP", 250)),
-        "VRP": int(gui_params.get("VRP", 320)),
-        "ATR_PULSE_AMP": float(gui_params.get("Atrial Amplitude", 3.5)),
-        "VENT_PULSE_AMP": float(gui_params.get("Ventricular Amplitude", 3.5)),
-        "ATR_PULSE_WIDTH": int(round(gui_params.get("Atrial Pulse Width", 0.4) * PULSE_WIDTH_MULTIPLIER)),
-        "VENT_PULSE_WIDTH": int(round(gui_params.get("Ventricular Pulse Width", 0.4) * PULSE_WIDTH_MULTIPLIER)),
-        "ATR_CMP_REF_PWM": int(SENSITIVITY_PWM_BASE + gui_params.get("Atrial Sensitivity", 2.5) * SENSITIVITY_PWM_SCALE),
-        "VENT_CMP_REF_PWM": int(SENSITIVITY_PWM_BASE + gui_params.get("Ventricular Sensitivity", 2.5) * SENSITIVITY_PWM_SCALE),
-        "REACTION_TIME": int(gui_params.get("Reaction Time", 30)),
-        "RECOVERY_TIME": int(gui_params.get("Recovery Time", 5)),
-        "FIXED_AV_DELAY": int(gui_params.get("FIXED_AV_DELAY", 150)),
-        "RESPONSE_FACTOR": int(gui_params.get("Response Factor", 8)),
-        "ACTIVITY_THRESHOLD": int(gui_params.get("ACTIVITY_THRESHOLD", 1)), 
-        "LRL": int(gui_params.get("Lower Rate Limit", 60)),
-        "URL": int(gui_params.get("Upper Rate Limit", 120)),
-        "MSR": int(gui_params.get("Maximum Sensor Rate", 120)),
-    }
+    serial_params = schema.to_serial(gui_params)
+    # protocol-only fields are passed straight through
+    for key in ("response_type", "FIXED_AV_DELAY", "ACTIVITY_THRESHOLD"):
+        if key in gui_params:
+            serial_params[key] = gui_params[key]
     return serial_params
 
 
@@ -49,23 +28,7 @@ def convert_serial_to_gui(serial_params):
     """
     Convert serial protocol parameters back to GUI-style for verification.
     """
-    gui_params = {
-        "Lower Rate Limit": serial_params.get("LRL", 60),
-        "Upper Rate Limit": serial_params.get("URL", 120),
-        "Maximum Sensor Rate": serial_params.get("MSR", 120),
-        "Atrial Amplitude": serial_params.get("ATR_PULSE_AMP", 3.5),
-        "Ventricular Amplitude": serial_params.get("VENT_PULSE_AMP", 3.5),
-        "Atrial Pulse Width": round(serial_params.get("ATR_PULSE_WIDTH", 10) / PULSE_WIDTH_MULTIPLIER, 2),
-        "Ventricular Pulse Width": round(serial_params.get("VENT_PULSE_WIDTH", 10) / PULSE_WIDTH_MULTIPLIER, 2),
-        "Atrial Sensitivity": round((serial_params.get("ATR_CMP_REF_PWM", 82) - SENSITIVITY_PWM_BASE) / SENSITIVITY_PWM_SCALE, 2),
-        "Ventricular Sensitivity": round((serial_params.get("VENT_CMP_REF_PWM", 82) - SENSITIVITY_PWM_BASE) / SENSITIVITY_PWM_SCALE, 2),
-        "ARP": serial_params.get("ARP", 250),
-        "VRP": serial_params.get("VRP", 320),
-        "Reaction Time": serial_params.get("REACTION_TIME", 30),
-        "Recovery Time": serial_params.get("RECOVERY_TIME", 5),
-        "Response Factor": serial_params.get("RESPONSE_FACTOR", 8),
-    }
-    return gui_params
+    return schema.from_serial(serial_params)
 
 
 def test_all():
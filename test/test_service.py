@@ -0,0 +1,213 @@
+import os
+import shutil
+import struct
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from auth import auth
+from dicom import header_index
+from dicom.patients import user_dir
+from params import schema
+from comm.serial_comm import PacemakerSerial
+from service.service import DCMService, DeviceSession
+from service.server import DCMServer, DCMClient
+
+USERNAME = "test_service"
+
+# serial field order of the program packet and of the device's 88-byte echo frame
+PROGRAM_LAYOUT = struct.Struct("<BBHHffHHxBBHHxBBBBBB")
+PROGRAM_FIELDS = ("response_type", "mode", "ARP", "VRP", "ATR_PULSE_AMP", "VENT_PULSE_AMP", "ATR_PULSE_WIDTH",
+                  "VENT_PULSE_WIDTH", "ATR_CMP_REF_PWM", "VENT_CMP_REF_PWM", "REACTION_TIME", "RECOVERY_TIME",
+                  "FIXED_AV_DELAY", "RESPONSE_FACTOR", "ACTIVITY_THRESHOLD", "LRL", "URL", "MSR")
+ECHO_LAYOUT = struct.Struct("<BBffHHBHHBBBBHHBBB")
+ECHO_FIELDS = ("response_type", "mode", "ATR_PULSE_AMP", "VENT_PULSE_AMP", "ATR_PULSE_WIDTH", "VENT_PULSE_WIDTH",
+               "LRL", "ARP", "VRP", "ATR_CMP_REF_PWM", "VENT_CMP_REF_PWM", "MSR", "RESPONSE_FACTOR",
+               "REACTION_TIME", "RECOVERY_TIME", "ACTIVITY_THRESHOLD", "URL", "FIXED_AV_DELAY")
+
+
+class EchoPort:
+    ''' Serial port double that stores programmed parameters and echoes them back '''
+
+    def __init__(self):
+        self.is_open = True
+        self.in_waiting = 88
+        self.programmed = dict.fromkeys(PROGRAM_FIELDS, 0)
+
+    def write(self, data):
+        if data[1] == PacemakerSerial.CMD_SET_PARAMS:
+            self.programmed = dict(zip(PROGRAM_FIELDS, PROGRAM_LAYOUT.unpack(bytes(data[2:]))))
+        return len(data)
+
+    def read(self, size):
+        return ECHO_LAYOUT.pack(*(self.programmed[f] for f in ECHO_FIELDS)).ljust(88, b"\0")[:size]
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+@pytest.fixture
+def device(tmp_path, monkeypatch):
+    monkeypatch.setattr(auth, "DB_FILE", str(tmp_path / "users.db"))
+    link = PacemakerSerial()
+    link.serial_port = EchoPort()
+    link.connected = True
+    yield DeviceSession(link)
+    header_index.close_all()
+    shutil.rmtree(user_dir(USERNAME), ignore_errors=True)
+
+
+def test_service_program_and_verify(device):
+    service = DCMService(device)
+    assert service.register(USERNAME, "pw") == (True, f"{USERNAME} registered")
+    assert service.login(USERNAME, "wrong")[0] is False
+    assert service.list_patients() == (False, "Not logged in")
+    assert service.login(USERNAME, "pw")[0]
+
+    assert service.add_patient("Doe^Jane", "1980-02-03", "X") == (False, "Sex must be 'M' or 'F'")
+    ok, patient_id = service.add_patient("Doe^Jane", "1980-02-03", "F")
+    assert ok
+    assert service.list_patients() == (True, [{"patientID": patient_id, "name": "Doe^Jane",
+                                               "birthdate": "1980-02-03", "sex": "F"}])
+    ok, summary = service.select_patient(patient_id)
+    assert ok and len(summary["files"]) == 5
+
+    assert service.program("AAI", {"Lower Rate Limit": 200})[0] is False  # validation before the device
+    assert service.program("AAI", {"Lower Rate Limit": 70, "Atrial Pulse Width": 1.1}) == (True, "Parameters accepted")
+    assert device.link.serial_port.programmed["LRL"] == 70
+    assert device.link.serial_port.programmed["ATR_PULSE_WIDTH"] == 28
+
+    # programmed values were saved and recorded in the history
+    ok, values = service.get_parameters("AAI")
+    assert values["Lower Rate Limit"] == 70.0 and values["Atrial Pulse Width"] == 1.1
+    assert {d.key for d in service.history.changes()} >= {"Lower Rate Limit", "Atrial Pulse Width"}
+
+    ok, result = service.interrogate()
+    assert ok and result["parameters"]["Lower Rate Limit"] == 70
+    ok, result = service.verify("AAI")
+    assert ok, result
+    service.close()
+
+
+def test_server_shares_device_between_clients(device):
+    auth.init_db()
+    auth.add_user(USERNAME, "pw")
+    server = DCMServer(("127.0.0.1", 0), device=device)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        first, second = DCMClient(url), DCMClient(url)
+        assert first.list_patients() == (False, "Not logged in")
+        assert first.login(USERNAME, "pw")[0] and second.login(USERNAME, "pw")[0]
+
+        ok, patient_id = first.add_patient(name="Doe^John", birthdate="1975-06-07", sex="M")
+        assert ok
+        assert second.select_patient(patient_id=patient_id)[0]
+        assert second.program(mode="VOO", values={"Lower Rate Limit": 80}) == (True, "Parameters accepted")
+        ok, result = first.interrogate()
+        assert ok and result["parameters"]["Lower Rate Limit"] == 80
+        # both clients on the same patient share its stores: one's save is the other's read
+        assert first.select_patient(patient_id=patient_id)[0]
+        assert first.save_parameters(mode="AAI", values={"Lower Rate Limit": 65})[0]
+        assert second.get_parameters(mode="AAI")[1]["Lower Rate Limit"] == 65
+        assert second.logout()[0]
+        assert first.get_parameters(mode="AAI")[1]["Lower Rate Limit"] == 65
+
+        # bad arguments get a reply, never a dropped connection
+        assert first.add_patient(name="A", birthdate=19900101, sex="M") == (
+            False, "Name, birthdate and sex must be strings")
+        assert first.save_parameters(mode="AAI", values="x") == (
+            False, "Parameter values must be a {name: value} object")
+        assert first.stream(frames="many") == (False, "frames must be a positive integer")
+        assert first.get_parameters(bogus=1)[0] is False
+        server.sessions[first.token].list_patients = lambda: 1 / 0
+        ok, message = first.list_patients()
+        assert not ok and "ZeroDivisionError" in message
+
+        assert first.select_patient(patient_id="00000") == (False, "Unknown patient 00000")
+        assert first.logout()[0]
+        assert first.status() == (False, "Not logged in")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class StreamLink:
+    ''' Link double answering egram polls slowly enough for several clients to fill the stream queue '''
+
+    def __init__(self):
+        self.connected = True
+        self.release = threading.Event()
+
+    def get_signals(self, out=None):
+        time.sleep(0.002)
+        return True, (np.zeros(4, dtype=np.int16), np.ones(4, dtype=np.int16))
+
+    def interrogate_device(self):
+        self.release.wait(2)
+        return True, {}
+
+    def disconnect(self):
+        self.connected = False
+
+
+def test_stream_survives_dropped_polls_and_disconnect_fails_other_clients():
+    link = StreamLink()
+    device = DeviceSession(link)
+    try:
+        results = []
+        clients = [threading.Thread(target=lambda: results.append(device.stream(5))) for _ in range(4)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        assert [ok for ok, _ in results] == [True] * 4
+        assert all(frames["vent"] == [0] * 20 for _, frames in results)
+
+        # one client's interrogation in flight, another's queued behind it: a disconnect fails the queued one
+        first = device.scheduler.interrogate()
+        queued = []
+        waiter = threading.Thread(target=lambda: queued.append(device.interrogate()))
+        waiter.start()
+        while not device.scheduler.pending()["interrogate"]:
+            time.sleep(0.001)
+        threading.Timer(0.05, link.release.set).start()
+        assert device.disconnect() == (True, "Disconnected")
+        waiter.join()
+        assert first.result() == (True, {})
+        assert queued == [(False, "Device disconnected")]
+    finally:
+        device.scheduler.stop()
+
+
+def test_device_process_streams_through_the_telemetry_ring():
+    from comm.device_process import DeviceProcess
+    from comm.simulator import open_port
+    from comm.telemetry_ring import TelemetryRing
+
+    link = DeviceProcess(port_opener=open_port)
+    ring = link.telemetry = TelemetryRing.create(f"dcm_test_service_{os.getpid()}", slots=64)
+    device = DeviceSession(link)
+    try:
+        assert device.ring is ring
+        assert device.connect("SIM0")[0]
+        assert device.program("VVI", dict(schema.SERIAL_DEFAULTS, response_type=0))[0]
+        ok, frames = device.stream(3)
+        assert ok and len(frames["vent"]) == 3 * link.signal_frame_size // 8
+        # the child polled the frames on its own; streaming stops with the last client
+        assert ring.published >= 3
+        published = ring.published
+        time.sleep(0.2)
+        assert ring.published - published <= 1
+    finally:
+        device.close()
+        ring.close()
@@ -0,0 +1,48 @@
+import os
+import json
+
+from dicom.dicom_init import bradycardia_param_init
+from dicom.dicom import set_parameter
+from dicom.session_store import SessionStore
+
+
+def make_store(tmp_path):
+    dcm_path = str(tmp_path / "brady_params_report.dcm")
+    cache_path = str(tmp_path / "brady_params.json")
+    bradycardia_param_init("12345", dcm_path)
+    return dcm_path, cache_path
+
+
+def test_only_changes_are_journaled(tmp_path):
+    dcm_path, cache_path = make_store(tmp_path)
+    store = SessionStore(cache_path, dcm_path, delay=0.01)
+    store.set("AOO", "Lower Rate Limit", 0.0)  # unchanged from the DICOM
+    store.set("AOO", "Upper Rate Limit", 130.0)
+    store.close()
+
+    with open(cache_path) as f:
+        journal = [json.loads(line) for line in f.read().splitlines()[1:]]
+    assert journal == [{"m": "AOO", "k": "Upper Rate Limit", "v": 130.0}]
+
+
+def test_cache_reused_until_dicom_changes(tmp_path):
+    dcm_path, cache_path = make_store(tmp_path)
+    store = SessionStore(cache_path, dcm_path, delay=0.01)
+    store.set("VVI", "VRP", 300.0)
+    set_parameter(dcm_path, "VVI", "VRP", 300.0)
+    store.mark_synced()
+    store.close()
+
+    reopened = SessionStore(cache_path, dcm_path)
+    assert reopened.get("VVI")["VRP"] == 300.0
+    reopened.close()
+
+    # cache values that never reached the DICOM are dropped once it changes
+    store = SessionStore(cache_path, dcm_path, delay=0.01)
+    store.set("VVI", "VRP", 400.0)
+    store.close()
+    os.utime(dcm_path, ns=(0, os.stat(dcm_path).st_mtime_ns + 1))
+
+    rebuilt = SessionStore(cache_path, dcm_path)
+    assert rebuilt.get("VVI")["VRP"] == 300.0
+    rebuilt.close()
@@ -0,0 +1,100 @@
+from comm.scheduler import CommandScheduler
+from comm.serial_comm import PacemakerSerial
+from comm.simulator import SimulatedPacemaker
+from params import schema
+
+
+class CountingPacemaker(SimulatedPacemaker):
+    ''' Simulated device that counts the packets it receives '''
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return super().write(data)
+
+
+def connected_link(device):
+    link = PacemakerSerial()
+    link.serial_port = device
+    link.connected = True
+    link.device_identity = "000621000000"
+    return link
+
+
+def test_skips_programming_already_verified():
+    device = CountingPacemaker()
+    link = connected_link(device)
+    params = dict(schema.SERIAL_DEFAULTS, LRL=70)
+
+    ok, message, differences = link.echo_test_parameters("AAI", params)
+    assert ok and not differences and device.writes == 2
+    assert link.cached_state()["readback"]["LRL"] == 70
+
+    # same payload: no write, and the echo test is answered from the cache
+    assert link.program_parameters("AAI", params) == (True, "Parameters already programmed (verified)")
+    ok, message, _ = link.echo_test_parameters("AAI", params)
+    assert ok and "unchanged" in message and device.writes == 2
+
+    # a changed parameter is written and unverified until read back
+    assert link.program_parameters("AAI", dict(params, LRL=75))[0]
+    assert device.writes == 3 and link.cached_state() is None
+    ok, _, _ = link.verify_parameters("AAI", dict(params, LRL=75))
+    assert ok and device.writes == 4 and link.cached_state() is not None
+
+    # forced programming always goes out
+    assert link.program_parameters("AAI", dict(params, LRL=75), force=True)[0]
+    assert device.writes == 5
+
+
+def test_verify_only_reports_mismatch_and_invalidates():
+    device = CountingPacemaker()
+    link = connected_link(device)
+    params = dict(schema.SERIAL_DEFAULTS, LRL=70)
+    assert link.echo_test_parameters("AAI", params)[0]
+
+    # reprogrammed behind the DCM's back
+    device.programmed["LRL"] = 90
+    ok, message, differences = link.verify_parameters("AAI", params)
+    assert not ok and differences["LRL"] == {"sent": 70, "received": 90}
+    assert link.cached_state() is None
+
+
+def test_cache_is_per_device_and_dropped_on_reconnect_or_device_change():
+    link = connected_link(CountingPacemaker())
+    params = dict(schema.SERIAL_DEFAULTS, LRL=70)
+    assert link.echo_test_parameters("AAI", params)[0]
+
+    # a different device does not see the first one's verified state
+    link.device_identity = "000621000001"
+    assert link.cached_state() is None
+    link.device_identity = "000621000000"
+    assert link.cached_state() is not None
+
+    link.invalidate_state_cache(all_devices=True)
+    assert link.state_cache == {}
+
+    assert link.echo_test_parameters("AAI", params)[0]
+    link.port_name = "SIM0"
+    link.auto_reconnect = False
+    link._link_failed(OSError("device disconnected"))
+    assert link.cached_state() is None
+
+
+def test_forced_verify_through_the_scheduler_reprograms_a_drifted_device():
+    device = CountingPacemaker()
+    link = connected_link(device)
+    params = dict(schema.SERIAL_DEFAULTS, LRL=70)
+    scheduler = CommandScheduler(link).start()
+    try:
+        assert scheduler.verify("AAI", params).result()[0] and device.writes == 2
+        # the device reset without a USB drop: a repeat is answered from the cache, a forced one goes out
+        device.programmed["LRL"] = 60
+        ok, message, _ = scheduler.verify("AAI", params).result()
+        assert ok and "unchanged" in message and device.writes == 2
+        ok, message, differences = scheduler.verify("AAI", params, force=True).result()
+        assert ok and not differences and device.writes == 4 and device.programmed["LRL"] == 70
+    finally:
+        scheduler.stop()
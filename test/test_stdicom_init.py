@@ -2,6 +2,7 @@ import os
 import pydicom
 import random
 from dicom.dicom import init_dir, get_parameter, set_parameter
+from params import schema
 
 # 1. Set test patient info
 username = "test_user"
@@ -38,14 +39,7 @@ test_paths = {
     "TEMP_PARAM_DCM"  : paths["TEMP_PARAM_DCM"],
     }
 
-MODE_PARAMETERS = {
-    "AOO": ["Lower Rate Limit", "Upper Rate Limit", "Atrial Amplitude", "Atrial Pulse Width"],
-    "VOO": ["Lower Rate Limit", "Upper Rate Limit", "Ventricular Amplitude", "Ventricular Pulse Width"],
-    "AAI": ["Lower Rate Limit", "Upper Rate Limit", "Atrial Amplitude", "Atrial Pulse Width",
-            "Atrial Sensitivity", "ARP", "PVARP", "Hysteresis", "Rate Smoothing"],
-    "VVI": ["Lower Rate Limit", "Upper Rate Limit", "Ventricular Amplitude", "Ventricular Pulse Width",
-            "Ventricular Sensitivity", "VRP", "Hysteresis", "Rate Smoothing"],
-}
+MODE_PARAMETERS = {mode: schema.MODE_PARAMETERS[mode] for mode in ("AOO", "VOO", "AAI", "VVI")}
 
 for key, path in test_paths.items():
     print(f"\n=== Reading {key} Parameters ===")
@@ -0,0 +1,69 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from comm.stream_queue import StreamQueue, StreamClosed, BLOCK, DROP_OLDEST, DROP_NEWEST, DECIMATE
+
+
+def frame(seq, n=11):
+    return np.full(n, seq, dtype=np.int16), np.full(n, -seq, dtype=np.int16)
+
+
+def fill(queue, frames):
+    return [queue.put(*frame(seq), seq=seq) for seq in range(1, frames + 1)]
+
+
+def seqs(queue):
+    return [seq for seq, _, _ in queue.drain()]
+
+
+def test_drop_policies_keep_the_freshest_or_the_backlog():
+    freshest = StreamQueue("display", maxsize=4, policy=DROP_OLDEST)
+    assert all(fill(freshest, 10))
+    assert seqs(freshest) == [7, 8, 9, 10] and freshest.dropped == 6
+
+    backlog = StreamQueue("analyzer", maxsize=4, policy=DROP_NEWEST)
+    assert fill(backlog, 10) == [True] * 4 + [False] * 6
+    assert seqs(backlog) == [1, 2, 3, 4] and backlog.dropped == 6
+
+
+def test_decimate_thins_the_stream_to_fit_and_recovers():
+    queue = StreamQueue("trend", maxsize=8, policy=DECIMATE)
+    fill(queue, 40)
+    assert queue.decimation > 1
+    kept = seqs(queue)
+    assert len(kept) <= 8 and kept[-1] == 40
+    assert queue.dropped == 40 - len(kept)
+    # drained: full rate again
+    while queue.decimation > 1:
+        fill(queue, 1)
+        queue.drain()
+    assert queue.put(*frame(41), seq=41)
+
+
+def test_block_is_lossless_and_bounded():
+    queue = StreamQueue("recorder", maxsize=4, policy=BLOCK)
+    received = []
+
+    def consume():
+        while len(received) < 50:
+            seq, vent, atr = queue.get(timeout=5)
+            received.append(seq)
+            time.sleep(0.001)
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    assert all(fill(queue, 50))
+    consumer.join(10)
+    assert received == list(range(1, 51)) and queue.dropped == 0
+    assert queue.stats()["memory_bytes"] < 4 * 2 * 128 * 2 + 100
+
+    # a stuck consumer: put gives up after block_timeout and counts the drop
+    queue.block_timeout = 0.01
+    fill(queue, 5)
+    assert queue.dropped == 1
+    queue.close()
+    with pytest.raises(StreamClosed):
+        queue.put(*frame(6))
+
@@ -0,0 +1,82 @@
+import os
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from comm.serial_comm import PacemakerSerial
+from comm.simulator import SimulatedPacemaker
+from comm.telemetry_ring import TelemetryRing
+from params import schema
+
+
+@pytest.fixture
+def ring():
+    ring = TelemetryRing.create(f"dcm_test_ring_{os.getpid()}", slots=8)
+    yield ring
+    ring.close()
+
+
+def frame(seq, n=11):
+    return np.full(n, seq, dtype=np.int16), np.full(n, -seq, dtype=np.int16)
+
+
+def test_readers_see_every_frame_without_copies(ring):
+    consumer = TelemetryRing.attach(ring.name)
+    reader = consumer.reader("analyzer")
+    for seq in range(1, 6):
+        ring.publish(*frame(seq, n=11 if seq % 2 else 128))
+
+    frames = list(reader)
+    assert [seq for seq, _, _ in frames] == [1, 2, 3, 4, 5]
+    seq, vent, atr = frames[1]
+    assert len(vent) == 128 and vent[0] == 2 and atr[0] == -2
+    assert np.shares_memory(vent, consumer.samples) and reader.intact(seq)
+    assert reader.next() is None and reader.lost == 0
+    del frames, vent, atr
+    consumer.close()
+
+
+def test_each_reader_detects_its_own_overruns(ring):
+    fast, slow = ring.reader("display"), ring.reader("recorder")
+    vent, atr = np.zeros(ring.max_samples, np.int16), np.zeros(ring.max_samples, np.int16)
+    for seq in range(1, 21):
+        ring.publish(*frame(seq))
+        assert fast.read_into(vent, atr) == (seq, 11)
+
+    # the slow reader was lapped: it resumes at the oldest frame still in the ring
+    seq, n = slow.read_into(vent, atr)
+    assert seq == 13 and vent[0] == 13
+    assert slow.lost == 12 and slow.overruns == 1
+    assert fast.lost == 0 and fast.stats()["frames"] == 20
+
+
+def consume(name, frames, results):
+    ring = TelemetryRing.attach(name)
+    reader = ring.reader("child", start="oldest")
+    total = 0
+    while reader.frames + reader.lost < frames:
+        for seq, vent, atr in reader:
+            total += int(vent[0])
+    results.put((total, reader.lost))
+    ring.close()
+
+
+def test_consumer_process_reads_frames_published_by_the_serial_reader(ring):
+    link = PacemakerSerial()
+    link.serial_port = SimulatedPacemaker()
+    link.connected = True
+    link.telemetry = ring
+    assert link.program_parameters("VVI", dict(schema.SERIAL_DEFAULTS, response_type=0))[0]
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    child = context.Process(target=consume, args=(ring.name, 6, results))
+    for _ in range(6):
+        ok, (vent, atr) = link.get_signals()
+        assert ok
+    child.start()
+    total, lost = results.get(timeout=30)
+    child.join(10)
+    assert lost == 0 and ring.published == 6
+    assert total == sum(int(ring.samples[i, 0, 0]) for i in range(6))
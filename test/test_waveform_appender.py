@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+import pytest
+from pydicom import dcmread
+
+from dicom.dicom_init import lead_waveform_init, surface_ecg_init
+from dicom.dicom import (get_ecg_counts, set_ecg_waveform, get_multiplex_waveform, set_multiplex_waveform,
+                         set_waveform_annotations, get_waveform_annotations)
+from dicom.waveform_appender import WaveformAppender
+
+
+def test_appends_are_valid_at_each_checkpoint(tmp_path):
+    path = str(tmp_path / "lead_waveform.dcm")
+    lead_waveform_init("12345", path)
+    set_ecg_waveform(path, "Ventricular Lead", np.array([7, 8], dtype=np.int16))
+    set_ecg_waveform(path, "Atrial Lead", np.array([1, 2], dtype=np.int16))
+    set_waveform_annotations(path, "Atrial Lead", [(0, "AP")])
+
+    # Atrial Lead is the first group, so opening moves it to the end
+    appender = WaveformAppender(path, "Atrial Lead", checkpoint_samples=100)
+    expected = [1, 2]
+    for i in range(10):
+        block = np.arange(i * 30, i * 30 + 30, dtype=np.int16)
+        appender.append(block)
+        expected.extend(block.tolist())
+        if i == 4:
+            assert appender.samples == 2 + 120  # checkpointed after 120 samples, 30 pending
+            assert get_ecg_counts(path, "Atrial Lead")[0].tolist() == expected[:122]
+
+    size = os.path.getsize(path)
+    appender.append(np.arange(5, dtype=np.int16))
+    appender.checkpoint()
+    assert os.path.getsize(path) - size == (300 - 240 + 5) * 2  # only the new samples were written
+    appender.close()
+    expected.extend(range(5))
+
+    ds = dcmread(path)
+    assert [item.MultiplexGroupLabel for item in ds.WaveformSequence] == ["Ventricular Lead", "Atrial Lead"]
+    assert ds.WaveformSequence[1].NumberOfWaveformSamples == len(expected)
+    assert get_ecg_counts(path, "Atrial Lead")[0].tolist() == expected
+    assert get_ecg_counts(path, "Ventricular Lead")[0].tolist() == [7, 8]
+    assert get_waveform_annotations(path, "Atrial Lead") == [(0, "AP")]
+
+    # ordinary writers still work on the rewritten file
+    set_ecg_waveform(path, "Atrial Lead", np.array([1, 2, 3], dtype=np.int16))
+    assert get_ecg_counts(path, "Atrial Lead")[0].tolist() == [1, 2, 3]
+
+
+def test_multichannel_append(tmp_path):
+    path = str(tmp_path / "surface_ecg.dcm")
+    surface_ecg_init("12345", path)
+    data = np.arange(50 * 12, dtype=np.int16).reshape(50, 12)
+    with WaveformAppender(path, "Surface Lead", checkpoint_samples=20) as appender:
+        for i in range(0, 50, 10):
+            appender.append(data[i:i + 10])
+    counts, _, _ = get_multiplex_waveform(path, "Surface Lead")
+    assert np.array_equal(counts, data)
+
+
+def test_append_keeps_stored_sensitivity(tmp_path):
+    path = str(tmp_path / "surface_ecg.dcm")
+    surface_ecg_init("12345", path)
+    set_multiplex_waveform(path, "Surface Lead", np.full((4, 12), 5.0), sensitivity=0.01)
+
+    # opening and closing leaves the stored samples at their scale
+    WaveformAppender(path, "Surface Lead").close()
+    counts, sensitivities, _ = get_multiplex_waveform(path, "Surface Lead")
+    assert np.allclose(counts * sensitivities, 5.0)
+
+    with WaveformAppender(path, "Surface Lead", checkpoint_samples=2) as appender:
+        appender.append(np.full((3, 12), -2.5))
+    counts, sensitivities, _ = get_multiplex_waveform(path, "Surface Lead")
+    assert np.allclose(sensitivities, 0.01)
+    assert np.allclose(counts * sensitivities, [[5.0] * 12] * 4 + [[-2.5] * 12] * 3)
+
+    # a different scale is refused once the group holds samples
+    with pytest.raises(ValueError):
+        WaveformAppender(path, "Surface Lead", sensitivity=0.001)
+
+
+def test_empty_group_takes_requested_sensitivity(tmp_path):
+    path = str(tmp_path / "lead_waveform.dcm")
+    lead_waveform_init("12345", path)
+    with WaveformAppender(path, "Atrial Lead", sensitivity=0.005) as appender:
+        appender.append(np.array([1.0, -1.0]))
+    counts, sensitivity = get_ecg_counts(path, "Atrial Lead")
+    assert sensitivity == 0.005
+    assert counts.tolist() == [200, -200]